@@ -0,0 +1,289 @@
+"""
+HTTP API for the analysis pipeline, for other services and for scaling out.
+
+    python api.py --port 8080
+    curl -X POST localhost:8080/videos -d '{"url": "https://www.youtube.com/watch?v=..."}'
+
+    POST /videos                   {"url"} -> 202 and the job status; starts the analysis
+    GET  /videos/{id}              job status, plus metadata once known
+    GET  /videos/{id}/transcript   {"text"}; ?segments=1 adds [start, duration, text] per segment
+    GET  /videos/{id}/summary      {"summary", "stats"}; ?mode=auto|single|map_reduce,
+                                   ?stream=1 streams the text as it is generated
+    GET  /videos/{id}/pdf          PDF report, with the summary if one was generated
+    POST /videos/{id}/chat         {"question", "history", "memory", "stream"} -> {"answer", "stats", "memory"},
+                                   or NDJSON lines {"delta"} ... {"done", "stats", "memory"} when streamed
+    GET  /search?q=                library search across every processed video
+    GET  /healthz, GET /metrics
+
+Replicas keep no state of their own: transcripts, LLM responses, the library
+and job status all live in SQLite files under VIDEO_CACHE_DIR, so any number
+of them can run behind a load balancer as long as they share that directory.
+Chat clients send the history and the returned `memory` back with each turn.
+Blocking work (yt-dlp, ffmpeg, Groq calls, SQLite, PDF rendering) runs on
+thread pools, the event loop only moves bytes.
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from aiohttp import web
+
+import tracing
+from cache import get_cache
+from chat_context import ChatMemory
+from jobs import JobManager, JobStore
+from library import get_library
+from utils import SUMMARY_MODES, VideoUtils, AIEngine, PDFGenerator, warm_up
+
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8080"))
+# Threads for request work (cache reads, LLM calls, PDF export); analysis jobs have their own pool
+API_WORKERS = int(os.getenv("API_WORKERS", "32"))
+
+_DONE = object()
+
+
+async def run_blocking(request: web.Request, fn: Callable, *args) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(request.app['pool'], fn, *args)
+
+
+async def iterate_blocking(request: web.Request, gen: Iterator[str]) -> AsyncIterator[str]:
+    """Runs a blocking generator on the pool and yields its items on the event loop."""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in gen:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            item = _DONE
+        except Exception as e:
+            item = e
+        finally:
+            # Runs the generator's own cleanup (stats, response cache) on this thread
+            gen.close()
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    request.app['pool'].submit(produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # The client went away or the handler failed, stop at the next item
+        stop.set()
+
+
+def _session(request: web.Request) -> str:
+    # Callers that identify themselves are queued fairly against each other by the Groq scheduler
+    return request.headers.get('X-Session-Id') or request.remote or "api"
+
+
+def _error(status: int, message: str) -> web.Response:
+    return web.json_response({'error': message}, status=status)
+
+
+async def _transcript_or_404(request: web.Request):
+    video_id = request.match_info['video_id']
+    cached = await run_blocking(request, get_cache().get_transcript, video_id)
+    if cached is None:
+        raise web.HTTPNotFound(text=json.dumps({'error': f"No transcript for {video_id} yet"}),
+                               content_type='application/json')
+    return video_id, cached['transcript']
+
+
+def _job_status(store: JobStore, video_id: str) -> Optional[Dict[str, Any]]:
+    status = store.get(video_id)
+    if status is None:
+        # Videos analyzed before the store existed (or by the Streamlit app) are served from the cache
+        if get_cache().get_transcript(video_id) is None:
+            return None
+        status = {'video_id': video_id, 'status': 'done', 'stages': {'metadata': 'done', 'transcript': 'done'},
+                  'error': None}
+    if status['status'] == 'done' or status['stages'].get('metadata') == 'done':
+        status['metadata'] = get_cache().get_metadata(video_id)
+    status.pop('owner', None)
+    return status
+
+
+async def submit_video(request: web.Request) -> web.Response:
+    try:
+        body = await request.json()
+        url = body['url']
+    except (ValueError, KeyError, TypeError):
+        return _error(400, 'Expected a JSON body with "url"')
+    try:
+        job = await run_blocking(request, request.app['jobs'].submit, url)
+    except ValueError as e:
+        return _error(400, str(e))
+    video_id = job.video_id if job else VideoUtils.extract_video_id(url)
+    status = await run_blocking(request, _job_status, request.app['store'], video_id)
+    return web.json_response(status, status=202, headers={'Location': f"/videos/{video_id}"})
+
+
+async def get_video(request: web.Request) -> web.Response:
+    video_id = request.match_info['video_id']
+    status = await run_blocking(request, _job_status, request.app['store'], video_id)
+    if status is None:
+        return _error(404, f"Unknown video {video_id}, POST it to /videos first")
+    return web.json_response(status)
+
+
+async def get_transcript(request: web.Request) -> web.Response:
+    video_id, transcript = await _transcript_or_404(request)
+    result: Dict[str, Any] = {'video_id': video_id, 'text': transcript.text}
+    if request.query.get('segments') in ('1', 'true'):
+        result['segments'] = [[round(start, 2), round(duration, 2), text] for text, start, duration in transcript]
+    return web.json_response(result)
+
+
+async def get_summary(request: web.Request) -> web.StreamResponse:
+    mode = request.query.get('mode', 'auto')
+    if mode not in SUMMARY_MODES:
+        return _error(400, f"mode must be one of {', '.join(SUMMARY_MODES)}")
+    video_id, transcript = await _transcript_or_404(request)
+    ai = AIEngine(session=_session(request))
+    if request.query.get('stream') not in ('1', 'true'):
+        summary = await run_blocking(request, ai.summarize, transcript.text, mode)
+        return web.json_response({'video_id': video_id, 'summary': summary, 'stats': ai.last_stats})
+
+    response = web.StreamResponse(headers={'Content-Type': 'text/plain; charset=utf-8'})
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    async for delta in iterate_blocking(request, ai.summarize_stream(transcript.text, mode)):
+        await response.write(delta.encode('utf-8'))
+    await response.write_eof()
+    return response
+
+
+def _render_pdf(video_id: str, transcript, session: str) -> str:
+    """Writes the report to a temp file and returns its path (the caller deletes it)."""
+    summary = AIEngine(session=session).cached_summary(transcript.text) or ""
+    metadata = get_cache().get_metadata(video_id) or {'title': video_id}
+    fd, path = tempfile.mkstemp(suffix='.pdf')
+    with os.fdopen(fd, 'wb') as f:
+        PDFGenerator.generate(transcript, summary, metadata, out=f)
+    return path
+
+
+async def get_pdf(request: web.Request) -> web.StreamResponse:
+    video_id, transcript = await _transcript_or_404(request)
+    path = await run_blocking(request, _render_pdf, video_id, transcript, _session(request))
+    try:
+        response = web.StreamResponse(headers={
+            'Content-Type': 'application/pdf',
+            'Content-Disposition': f'attachment; filename="{video_id}.pdf"',
+            'Content-Length': str(os.path.getsize(path)),
+        })
+        await response.prepare(request)
+        with open(path, 'rb') as f:
+            while True:
+                data = await run_blocking(request, f.read, 256 * 1024)
+                if not data:
+                    break
+                await response.write(data)
+        await response.write_eof()
+        return response
+    finally:
+        try:
+            os.remove(path)
+        except: pass
+
+
+async def chat(request: web.Request) -> web.StreamResponse:
+    video_id, transcript = await _transcript_or_404(request)
+    try:
+        body = await request.json()
+        question = body['question']
+        history = body.get('history') or []
+        memory = ChatMemory()
+        memory.summary = (body.get('memory') or {}).get('summary', "")
+        memory.folded = int((body.get('memory') or {}).get('folded', 0))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return _error(400, 'Expected a JSON body with "question" (and optionally "history", "memory", "stream")')
+
+    ai = AIEngine(session=_session(request))
+    if not body.get('stream'):
+        answer = await run_blocking(request, ai.chat, transcript.text, history, question, video_id, memory)
+        return web.json_response({'answer': answer, 'stats': ai.last_stats,
+                                  'memory': {'summary': memory.summary, 'folded': memory.folded}})
+
+    response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    gen = ai.chat_stream(transcript.text, history, question, video_id, memory)
+    async for delta in iterate_blocking(request, gen):
+        await response.write((json.dumps({'delta': delta}) + "\n").encode('utf-8'))
+    await response.write((json.dumps({'done': True, 'stats': ai.last_stats,
+                                      'memory': {'summary': memory.summary, 'folded': memory.folded}})
+                          + "\n").encode('utf-8'))
+    await response.write_eof()
+    return response
+
+
+async def search(request: web.Request) -> web.Response:
+    query = request.query.get('q', '')
+    try:
+        limit = min(int(request.query.get('limit', '10')), 50)
+    except ValueError:
+        return _error(400, "limit must be a number")
+    results = await run_blocking(request, get_library().search, query, limit)
+    return web.json_response({'query': query, 'results': results})
+
+
+async def healthz(request: web.Request) -> web.Response:
+    return web.json_response({'ok': True})
+
+
+async def metrics(request: web.Request) -> web.Response:
+    return web.Response(text=tracing.render_prometheus(), content_type='text/plain')
+
+
+def create_app(jobs: Optional[JobManager] = None, workers: int = API_WORKERS) -> web.Application:
+    app = web.Application()
+    app['store'] = jobs.store if jobs and jobs.store else JobStore()
+    app['jobs'] = jobs or JobManager(store=app['store'])
+    app['pool'] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+
+    async def shutdown(app: web.Application):
+        app['pool'].shutdown(wait=False, cancel_futures=True)
+
+    app.on_cleanup.append(shutdown)
+    # yt-dlp and the Groq client load while the server starts listening, not on the first request
+    warm_up()
+    app.router.add_post('/videos', submit_video)
+    app.router.add_get('/videos/{video_id}', get_video)
+    app.router.add_get('/videos/{video_id}/transcript', get_transcript)
+    app.router.add_get('/videos/{video_id}/summary', get_summary)
+    app.router.add_get('/videos/{video_id}/pdf', get_pdf)
+    app.router.add_post('/videos/{video_id}/chat', chat)
+    app.router.add_get('/search', search)
+    app.router.add_get('/healthz', healthz)
+    app.router.add_get('/metrics', metrics)
+    return app
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="HTTP API for the video analysis pipeline.")
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    args = parser.parse_args(argv)
+    web.run_app(create_app(), host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
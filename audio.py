@@ -0,0 +1,473 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import subprocess
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, jobs are still single-flight per process
+    fcntl = None
+
+import numpy as np
+
+import tracing
+from cache import CACHE_DIR
+
+# Whisper works on 16kHz mono internally, so that is all that gets uploaded. Speech-tuned
+# Opus at 16kbps is ~7MB per hour, against ~29MB for the 64kbps stereo mp3 used before.
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # s16le
+PCM_BYTES_PER_SECOND = SAMPLE_RATE * SAMPLE_WIDTH
+AUDIO_BITRATE = os.getenv("WHISPER_AUDIO_BITRATE", "16k")
+MAX_UPLOAD_MB = float(os.getenv("WHISPER_MAX_UPLOAD_MB", "24"))
+
+
+def _bits_per_second(bitrate: str) -> int:
+    return int(float(bitrate.lower().rstrip('k')) * 1000) if bitrate.lower().endswith('k') else int(bitrate)
+
+
+# Longest segment that fits under the upload limit, with 5% headroom for the container and
+# VBR peaks. WHISPER_SEGMENT_SECONDS can lower it to get more parallel uploads per video, never raise it.
+MAX_SEGMENT_SECONDS = int(MAX_UPLOAD_MB * 1024 * 1024 * 8 * 0.95 / _bits_per_second(AUDIO_BITRATE))
+SEGMENT_SECONDS = min(int(os.getenv("WHISPER_SEGMENT_SECONDS", str(MAX_SEGMENT_SECONDS))), MAX_SEGMENT_SECONDS)
+
+# Cuts go into the last pause found within SILENCE_SEARCH_SECONDS before the segment
+# limit, so words aren't split between two uploads. Same criteria as ffmpeg's
+# silencedetect: quieter than SILENCE_THRESHOLD_DB for at least SILENCE_MIN_SECONDS.
+SILENCE_SEARCH_SECONDS = 30
+SILENCE_THRESHOLD_DB = float(os.getenv("WHISPER_SILENCE_DB", "-35"))
+SILENCE_MIN_SECONDS = 0.3
+SILENCE_FRAME_SECONDS = 0.02
+
+# A trailing segment shorter than this holds nothing worth transcribing
+MIN_SEGMENT_SECONDS = 0.5
+
+# Size of the reads pumped from the downloaded file into ffmpeg, and how often to poll it for growth
+PIPE_CHUNK_BYTES = 64 * 1024
+TAIL_POLL_SECONDS = 0.2
+
+# YouTube client yt-dlp extracts with, for the metadata lookup as well so its formats can be downloaded
+YOUTUBE_PLAYER_CLIENT = 'android'
+
+# Audio of failed jobs is kept for resuming, but not forever
+AUDIO_DIR = os.path.join(CACHE_DIR, "audio")
+AUDIO_MAX_AGE_SECONDS = 7 * 86400
+
+
+def find_silence_cut(pcm: bytes) -> int:
+    """
+    Byte offset to cut 16kHz mono s16le audio at: the middle of the last pause,
+    or the quietest frame if there is no pause long enough.
+    """
+    frame = int(SAMPLE_RATE * SILENCE_FRAME_SECONDS)
+    samples = np.frombuffer(pcm, dtype='<i2', count=len(pcm) // SAMPLE_WIDTH)
+    n = len(samples) // frame
+    if n == 0:
+        return len(samples) * SAMPLE_WIDTH
+    frames = samples[:n * frame].astype(np.float32).reshape(n, frame)
+    db = 20 * np.log10(np.sqrt(np.mean(frames * frames, axis=1)) / 32768 + 1e-9)
+    silent = np.concatenate(([False], db < SILENCE_THRESHOLD_DB, [False]))
+    # Pause runs as alternating start/end frame indexes
+    edges = np.flatnonzero(silent[1:] != silent[:-1])
+    run_starts, run_ends = edges[0::2], edges[1::2]
+    long_runs = np.flatnonzero(run_ends - run_starts >= round(SILENCE_MIN_SECONDS / SILENCE_FRAME_SECONDS))
+    if len(long_runs):
+        last = long_runs[-1]
+        cut = (run_starts[last] + run_ends[last]) // 2
+    else:
+        cut = int(np.argmin(db))
+    return int(cut) * frame * SAMPLE_WIDTH
+
+
+def prune_audio_dirs(max_age: float = AUDIO_MAX_AGE_SECONDS):
+    """Removes work directories of jobs that failed and were never retried."""
+    if not os.path.isdir(AUDIO_DIR):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(AUDIO_DIR):
+        path = os.path.join(AUDIO_DIR, name)
+        try:
+            if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+class _SegmentWriter:
+    """One segment being encoded: PCM written here is piped into an Opus encoder."""
+
+    def __init__(self, path: str, log):
+        self.path = path
+        self.size = 0
+        self._sha = hashlib.sha1()
+        self._proc = subprocess.Popen([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', '1', '-i', 'pipe:0',
+            '-c:a', 'libopus', '-b:a', AUDIO_BITRATE, '-vbr', 'constrained', '-application', 'voip',
+            # Half the encoder effort for the same size at this bitrate
+            '-compression_level', '5',
+            path,
+        ], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=log)
+
+    @property
+    def seconds(self) -> float:
+        return self.size / PCM_BYTES_PER_SECOND
+
+    def write(self, pcm: bytes):
+        if pcm:
+            self._proc.stdin.write(pcm)
+            self._sha.update(pcm)
+            self.size += len(pcm)
+
+    def finish(self) -> str:
+        """Closes the encoder and returns the sha1 of the segment's PCM."""
+        self._proc.stdin.close()
+        if self._proc.wait() != 0:
+            raise RuntimeError(f"Encoding {os.path.basename(self.path)} failed")
+        return self._sha.hexdigest()
+
+    def abort(self):
+        if self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+        try: os.remove(self.path)
+        except: pass
+
+
+class SpeechChunker:
+    """
+    Cuts a 16kHz mono PCM stream into Opus segments of at most `segment_seconds`,
+    each ending in a pause (see find_silence_cut). Segments are encoded while
+    the PCM arrives, only the search window before a cut is held in memory.
+
+    Segments are described as (index, path, seconds, sha1 of the PCM). The hash
+    is taken before encoding because the Ogg container gets a random stream
+    serial number, so the same audio never encodes to the same bytes twice.
+    """
+
+    def __init__(self, out_dir: str, segment_seconds: float = SEGMENT_SECONDS, log=None):
+        self.out_dir = out_dir
+        self.log = log
+        self._limit = int(segment_seconds * SAMPLE_RATE) * SAMPLE_WIDTH
+        self._window = int(min(SILENCE_SEARCH_SECONDS, segment_seconds / 2) * SAMPLE_RATE) * SAMPLE_WIDTH
+        self._pending = bytearray()
+        self._index = 0
+        self._writer: Optional[_SegmentWriter] = None
+
+    def _current(self) -> _SegmentWriter:
+        if self._writer is None:
+            path = os.path.join(self.out_dir, f"chunk_{self._index:03d}.ogg")
+            self._writer = _SegmentWriter(path, self.log)
+        return self._writer
+
+    def _finish(self) -> Tuple[int, str, float, str]:
+        writer, self._writer = self._current(), None
+        segment = (self._index, writer.path, writer.seconds, writer.finish())
+        self._index += 1
+        return segment
+
+    def feed(self, data: bytes) -> List[Tuple[int, str, float, str]]:
+        """Adds PCM and returns the segments it completed."""
+        self._pending += data
+        done = []
+        while self._current().size + len(self._pending) >= self._limit:
+            writer = self._current()
+            need = self._limit - writer.size
+            head = max(need - self._window, 0)
+            cut = head + find_silence_cut(bytes(self._pending[head:need]))
+            writer.write(bytes(self._pending[:cut]))
+            del self._pending[:cut]
+            done.append(self._finish())
+        # Audio before the search window can't be part of a cut decision, encode it now
+        flush = min(len(self._pending), self._limit - self._window - self._current().size)
+        flush -= flush % SAMPLE_WIDTH
+        if flush > 0:
+            self._current().write(bytes(self._pending[:flush]))
+            del self._pending[:flush]
+        return done
+
+    def flush(self) -> Optional[Tuple[int, str, float, str]]:
+        """Encodes what is left at the end of the stream as the last segment."""
+        writer = self._current()
+        writer.write(bytes(self._pending[:len(self._pending) - len(self._pending) % SAMPLE_WIDTH]))
+        self._pending.clear()
+        if writer.seconds < MIN_SEGMENT_SECONDS:
+            self.abort()
+            return None
+        return self._finish()
+
+    def abort(self):
+        """Kills the segment in progress, e.g. when the stream turned out to be truncated."""
+        if self._writer:
+            self._writer.abort()
+            self._writer = None
+
+
+class AudioSegmenter:
+    """
+    Streams a video's audio into upload-ready segments while it downloads.
+
+    yt-dlp downloads into the video's work directory, a pump thread tails that
+    file into ffmpeg, which decodes it to 16kHz mono PCM, and a SpeechChunker
+    cuts that into Opus segments at pauses. Completed segments are yielded in
+    order while the download is still running. At most `max_pending` segments are kept on disk: once that many have
+    been yielded but not yet released, the pump stops feeding ffmpeg until the
+    consumer calls `release()`.
+
+    The downloaded audio survives failures: a later run for the same video
+    resumes the download where it stopped (or skips it if it completed) and
+    re-cuts identical segments locally, so callers can match them to results
+    checkpointed earlier. Call `discard()` once the job has succeeded.
+    """
+
+    def __init__(self, video_id: str, segment_seconds: float = SEGMENT_SECONDS, max_pending: int = 3,
+                 info: Optional[Dict[str, Any]] = None):
+        """`info` is the video's yt-dlp info dict if it was just extracted, the download then skips extraction."""
+        self.video_id = video_id
+        self.info = info
+        self.segment_seconds = segment_seconds
+        self.max_pending = max(1, max_pending)
+        self.workdir = os.path.join(AUDIO_DIR, video_id)
+        self.source_path = os.path.join(self.workdir, 'source.audio')
+        self.segment_dir = os.path.join(self.workdir, 'segments')
+        self.info_path = os.path.join(self.workdir, 'info.json')
+        self.downloaded_bytes = 0
+        self._initial_bytes = 0
+        self._waiting_since = 0.0
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._closed = False
+        self._discard = False
+        self._lock_file = None
+        self.waited = False
+        self._download: Optional[subprocess.Popen] = None
+        self._ffmpeg: Optional[subprocess.Popen] = None
+        self._pump_thread: Optional[threading.Thread] = None
+
+    @property
+    def _complete_marker(self) -> str:
+        return os.path.join(self.workdir, 'source.complete')
+
+    def _download_cmd(self) -> List[str]:
+        return [
+            sys.executable, '-m', 'yt_dlp',
+            '-f', 'bestaudio/best',
+            '-o', self.source_path,
+            # Write straight to the final name and resume it with a Range request after a failure
+            '--no-part', '--continue', '--fixup', 'never',
+            '--quiet', '--no-warnings',
+            '--extractor-args', f"youtube:player_client={YOUTUBE_PLAYER_CLIENT}",
+            '--retries', '10',
+            '--fragment-retries', '10',
+            '--socket-timeout', '30',
+        ] + (['--load-info-json', self.info_path] if self.info else [f"https://www.youtube.com/watch?v={self.video_id}"])
+
+    def _ffmpeg_cmd(self) -> List[str]:
+        return [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-i', 'pipe:0',
+            '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 's16le', 'pipe:1',
+        ]
+
+    @property
+    def _lock_path(self) -> str:
+        # Outside the work directory, so it outlives discard()
+        return os.path.join(AUDIO_DIR, f"{self.video_id}.lock")
+
+    def lock(self):
+        """
+        Waits for any other process working on the same video to finish (`waited` is
+        then True), and keeps the video to this one until close(). start() takes the
+        lock if it wasn't yet.
+        """
+        if self._lock_file:
+            return
+        os.makedirs(AUDIO_DIR, exist_ok=True)
+        while True:
+            lock_file = open(self._lock_path, 'a')
+            if not fcntl:
+                break
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.waited = True
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # The previous holder removes the file on close: a lock on the removed file excludes nobody
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(self._lock_path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+        self._lock_file = lock_file
+
+    def start(self):
+        prune_audio_dirs()
+        self.lock()
+        os.makedirs(self.workdir, exist_ok=True)
+        # Segments are cheap to re-cut from the local audio, start from a clean slate
+        shutil.rmtree(self.segment_dir, ignore_errors=True)
+        os.makedirs(self.segment_dir)
+
+        self._initial_bytes = os.path.getsize(self.source_path) if os.path.exists(self.source_path) else 0
+        self._download_log = open(os.path.join(self.workdir, 'download.log'), 'wb')
+        self._ffmpeg_log = open(os.path.join(self.workdir, 'ffmpeg.log'), 'wb')
+        if not os.path.exists(self._complete_marker):
+            if self.info:
+                try:
+                    with open(self.info_path, 'w', encoding='utf-8') as f:
+                        json.dump(self.info, f)
+                except (OSError, TypeError, ValueError) as e:
+                    print(f"Error writing info JSON, extracting again: {e}")
+                    self.info = None
+            if self._initial_bytes:
+                print(f"Resuming download of {self.video_id} from {self._initial_bytes / (1024 * 1024):.1f}MB")
+            self._download = subprocess.Popen(self._download_cmd(), stdout=subprocess.DEVNULL, stderr=self._download_log)
+        self._ffmpeg = subprocess.Popen(
+            self._ffmpeg_cmd(), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self._ffmpeg_log
+        )
+        self._pump_thread = threading.Thread(target=self._pump, daemon=True)
+        self._pump_thread.start()
+
+    def _downloading(self) -> bool:
+        return self._download is not None and self._download.poll() is None
+
+    def _pump(self):
+        """Tails the downloaded file into ffmpeg, pausing while too many segments are pending."""
+        failed = False
+        try:
+            while not os.path.exists(self.source_path):
+                if not self._downloading() or self._closed:
+                    return
+                time.sleep(TAIL_POLL_SECONDS)
+
+            with open(self.source_path, 'rb') as source:
+                while True:
+                    data = source.read(PIPE_CHUNK_BYTES)
+                    if not data:
+                        if self._downloading():
+                            time.sleep(TAIL_POLL_SECONDS)
+                            continue
+                        # The download ended, pick up whatever it wrote last
+                        data = source.read(PIPE_CHUNK_BYTES)
+                        if not data:
+                            break
+                    with self._cond:
+                        while self._pending >= self.max_pending and not self._closed:
+                            self._cond.wait()
+                        if self._closed:
+                            break
+                    self._ffmpeg.stdin.write(data)
+
+            if self._download is not None:
+                if self._download.wait() == 0:
+                    open(self._complete_marker, 'w').close()
+                else:
+                    failed = True
+        except (BrokenPipeError, ValueError, OSError):
+            pass
+        finally:
+            if failed:
+                # Don't let ffmpeg close a truncated last segment, it would be transcribed as complete
+                self._ffmpeg.kill()
+            try: self._ffmpeg.stdin.close()
+            except: pass
+
+    def _yield(self, segment: Tuple[int, str, float, str]) -> Tuple[int, str, float, str]:
+        with self._cond:
+            self._pending += 1
+        # Time the consumer waited for this segment: download, decoding and encoding not hidden by uploads
+        now = time.time()
+        _, path, seconds, _ = segment
+        tracing.record('audio.segment', now - self._waiting_since, video_id=self.video_id, file=os.path.basename(path),
+                       audio_seconds=round(seconds, 2), bytes=os.path.getsize(path))
+        self._waiting_since = now
+        return segment
+
+    def __iter__(self) -> Iterator[Tuple[int, str, float, str]]:
+        """Yields (index, path, seconds, PCM sha1) for each segment in order as soon as it is encoded."""
+        if self._ffmpeg is None:
+            self.start()
+        chunker = SpeechChunker(self.segment_dir, self.segment_seconds, self._ffmpeg_log)
+        self._waiting_since = time.time()
+        try:
+            for data in iter(lambda: self._ffmpeg.stdout.read(PIPE_CHUNK_BYTES), b''):
+                for segment in chunker.feed(data):
+                    yield self._yield(segment)
+
+            self._pump_thread.join()
+            download_rc = self._download.wait() if self._download else 0
+            ffmpeg_rc = self._ffmpeg.wait()
+            if os.path.exists(self.source_path):
+                self.downloaded_bytes = os.path.getsize(self.source_path) - self._initial_bytes
+            if self._closed:
+                return
+            # Only a stream that ended cleanly has a complete last segment
+            if download_rc != 0:
+                raise RuntimeError(f"Audio download failed: {self._log_tail(self._download_log.name)}")
+            if ffmpeg_rc != 0:
+                raise RuntimeError(f"Audio decoding failed: {self._log_tail(self._ffmpeg_log.name)}")
+            segment = chunker.flush()
+            if segment:
+                yield self._yield(segment)
+        finally:
+            chunker.abort()
+
+    def release(self, path: str):
+        """Deletes a consumed segment and lets the pump continue."""
+        try: os.remove(path)
+        except: pass
+        with self._cond:
+            self._pending -= 1
+            self._cond.notify_all()
+
+    @staticmethod
+    def _log_tail(path: str, limit: int = 500) -> str:
+        try:
+            with open(path, 'rb') as f:
+                return f.read().decode('utf-8', 'replace').strip()[-limit:] or "no output"
+        except OSError:
+            return "no output"
+
+    def discard(self):
+        """Marks the downloaded audio for deletion on close, call once the job has succeeded."""
+        self._discard = True
+
+    def stop(self):
+        """Kills both processes, ending the iteration early. Safe to call from any thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for proc in (self._download, self._ffmpeg):
+            if proc and proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+    def close(self):
+        """Stops both processes. The downloaded audio is kept unless `discard()` was called."""
+        self.stop()
+        if self._pump_thread:
+            self._pump_thread.join()
+        for log in (getattr(self, '_download_log', None), getattr(self, '_ffmpeg_log', None)):
+            if log:
+                log.close()
+        shutil.rmtree(self.workdir if self._discard else self.segment_dir, ignore_errors=True)
+        if self._lock_file:
+            # Removed while still held, so nobody locks it after us (see lock()); closing releases the flock
+            try: os.remove(self._lock_path)
+            except OSError: pass
+            self._lock_file.close()
+            self._lock_file = None
+
+    def __enter__(self) -> 'AudioSegmenter':
+        """Takes the video's lock; the download starts with the iteration (or start())."""
+        self.lock()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,259 @@
+"""
+Headless batch processing of many videos.
+
+    python batch.py urls.txt --output results.jsonl --summarize
+    python batch.py "https://www.youtube.com/playlist?list=..." --transcript-workers 4
+
+Each video goes through the metadata, transcript and (optionally) summary
+stages, each stage with its own worker pool. Finished stages are appended to a
+checkpoint file, so rerunning the same command after a crash skips completed
+videos and resumes the others at their first missing stage.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+from utils import VideoUtils, AIEngine
+from normalize import token_reduction
+
+STAGES = ['metadata', 'transcript', 'summary']
+
+
+class Checkpoint:
+    """Append-only JSONL log of completed stages, keyed by video ID."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stages: Dict[str, Dict[str, dict]] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A crash can leave a truncated last line
+                        continue
+                    self.stages.setdefault(record['video_id'], {})[record['stage']] = record.get('data') or {}
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def done(self, video_id: str, stage: str) -> bool:
+        return stage in self.stages.get(video_id, {})
+
+    def get(self, video_id: str, stage: str) -> dict:
+        return self.stages.get(video_id, {}).get(stage, {})
+
+    def record(self, video_id: str, stage: str, data: Optional[dict] = None):
+        with self._lock:
+            self.stages.setdefault(video_id, {})[stage] = data or {}
+            self._file.write(json.dumps({'video_id': video_id, 'stage': stage, 'data': data or {}}) + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def completed_in_output(path: str) -> Set[str]:
+    """
+    IDs of the videos with a completed result in a results file. A truncated last
+    line (from a crash) is ended, so the next result starts on a line of its own.
+    """
+    if not os.path.exists(path):
+        return set()
+    completed = set()
+    with open(path, 'rb+') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if result.get('status') == 'completed':
+                completed.add(result['video_id'])
+        if f.tell() and not line.endswith(b"\n"):
+            f.write(b"\n")
+    return completed
+
+
+class BatchRunner:
+    """Runs videos through per-stage worker pools and streams results out as JSONL."""
+
+    def __init__(self, output: str, checkpoint: str, summarize: bool = False,
+                 include_transcript: bool = False, workers: Optional[Dict[str, int]] = None):
+        self.summarize = summarize
+        self.include_transcript = include_transcript
+        self.stages = STAGES if summarize else STAGES[:2]
+        workers = workers or {}
+        self.pools = {
+            stage: ThreadPoolExecutor(max_workers=max(1, workers.get(stage, 2)), thread_name_prefix=f"batch-{stage}")
+            for stage in self.stages
+        }
+        self.checkpoint = Checkpoint(checkpoint)
+        # A crash between writing a result and checkpointing 'done' must not write it twice on resume
+        self._written = completed_in_output(output)
+        self._output = open(output, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._finished = threading.Event()
+        self.counts = {'completed': 0, 'failed': 0, 'skipped': 0}
+
+    def run(self, video_ids: List[str]) -> Dict[str, float]:
+        start = time.time()
+        pending = []
+        for video_id in dict.fromkeys(video_ids):
+            if self.checkpoint.done(video_id, 'done'):
+                self.counts['skipped'] += 1
+            else:
+                pending.append(video_id)
+
+        print(f"{len(pending)} videos to process, {self.counts['skipped']} already done.")
+        self._remaining = len(pending)
+        if not pending:
+            self._finished.set()
+        for video_id in pending:
+            self._submit(video_id, 0)
+
+        try:
+            self._finished.wait()
+        finally:
+            for pool in self.pools.values():
+                pool.shutdown(wait=False, cancel_futures=True)
+            self.checkpoint.close()
+            self._output.close()
+
+        elapsed = time.time() - start
+        processed = self.counts['completed']
+        return {
+            **self.counts,
+            'seconds': round(elapsed, 1),
+            'videos_per_hour': round(processed / elapsed * 3600, 1) if elapsed > 0 else 0.0,
+        }
+
+    def _submit(self, video_id: str, stage_index: int):
+        # Skip stages finished in an earlier run
+        while stage_index < len(self.stages) and self.checkpoint.done(video_id, self.stages[stage_index]):
+            stage_index += 1
+        if stage_index == len(self.stages):
+            self._complete(video_id)
+            return
+        stage = self.stages[stage_index]
+        self.pools[stage].submit(self._run_stage, video_id, stage_index)
+
+    def _run_stage(self, video_id: str, stage_index: int):
+        stage = self.stages[stage_index]
+        try:
+            if stage == 'metadata':
+                # Strict: a placeholder title must not be checkpointed, the lookup is retried on resume
+                data = VideoUtils.get_video_metadata(f"https://www.youtube.com/watch?v={video_id}", strict=True)
+            elif stage == 'transcript':
+                # The transcript itself lives in the transcript cache, only its size is checkpointed
+                text = VideoUtils.get_transcript(video_id)
+                data = {'chars': len(text), **token_reduction(text)}
+            else:
+                ai = AIEngine(session="batch")
+                data = {'summary': ai.summarize(VideoUtils.get_transcript(video_id)), 'stats': ai.last_stats}
+            self.checkpoint.record(video_id, stage, data)
+            self._submit(video_id, stage_index + 1)
+        except Exception as e:
+            print(f"[{video_id}] {stage} failed: {e}")
+            self._emit({'video_id': video_id, 'status': 'failed', 'stage': stage, 'error': str(e)})
+            self._finish_one('failed')
+
+    def _complete(self, video_id: str):
+        if video_id in self._written:
+            self.checkpoint.record(video_id, 'done')
+            self._finish_one('completed')
+            return
+        transcript = self.checkpoint.get(video_id, 'transcript')
+        result = {
+            'video_id': video_id,
+            'status': 'completed',
+            'metadata': self.checkpoint.get(video_id, 'metadata'),
+            'transcript_chars': transcript.get('chars'),
+        }
+        # Tokens before and after the cleanup that runs ahead of the LLM calls (absent in old checkpoints)
+        if 'tokens' in transcript:
+            result['transcript_tokens'] = {key: transcript[key] for key in ('raw_tokens', 'tokens', 'reduction')}
+        if self.include_transcript:
+            result['transcript'] = VideoUtils.get_transcript(video_id)
+        if self.summarize:
+            result['summary'] = self.checkpoint.get(video_id, 'summary').get('summary')
+        self._emit(result)
+        self.checkpoint.record(video_id, 'done')
+        self._finish_one('completed')
+
+    def _emit(self, result: dict):
+        with self._lock:
+            self._output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self._output.flush()
+
+    def _finish_one(self, outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+            self._remaining -= 1
+            done = self.counts['completed'] + self.counts['failed']
+            print(f"Progress: {done} finished, {self._remaining} remaining")
+            if self._remaining == 0:
+                self._finished.set()
+
+
+def collect_video_ids(source: str) -> List[str]:
+    """Reads video IDs from a file of URLs (one per line, playlists allowed) or a single URL."""
+    if os.path.exists(source):
+        with open(source, 'r', encoding='utf-8') as f:
+            urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    else:
+        urls = [source]
+
+    video_ids = []
+    for url in urls:
+        video_id = VideoUtils.extract_video_id(url)
+        if video_id:
+            video_ids.append(video_id)
+        else:
+            video_ids.extend(VideoUtils.list_playlist_videos(url))
+    return video_ids
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Process many YouTube videos without the UI.")
+    parser.add_argument('source', help="File with one URL per line, or a playlist/channel URL")
+    parser.add_argument('--output', default='results.jsonl', help="JSONL file results are appended to")
+    parser.add_argument('--checkpoint', help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument('--summarize', action='store_true', help="Also generate a summary per video")
+    parser.add_argument('--include-transcript', action='store_true', help="Write full transcripts into the results")
+    parser.add_argument('--metadata-workers', type=int, default=4)
+    parser.add_argument('--transcript-workers', type=int, default=2)
+    parser.add_argument('--summary-workers', type=int, default=2)
+    args = parser.parse_args(argv)
+
+    video_ids = collect_video_ids(args.source)
+    if not video_ids:
+        print("No videos found.")
+        return 1
+
+    runner = BatchRunner(
+        args.output,
+        args.checkpoint or f"{args.output}.checkpoint",
+        summarize=args.summarize,
+        include_transcript=args.include_transcript,
+        workers={
+            'metadata': args.metadata_workers,
+            'transcript': args.transcript_workers,
+            'summary': args.summary_workers,
+        },
+    )
+    stats = runner.run(video_ids)
+    print(
+        f"Completed {stats['completed']}, failed {stats['failed']}, skipped {stats['skipped']} "
+        f"in {stats['seconds']}s ({stats['videos_per_hour']} videos/hour)"
+    )
+    return 0 if stats['failed'] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
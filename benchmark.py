@@ -0,0 +1,200 @@
+"""
+Offline end-to-end benchmark of the analysis pipeline.
+
+    python benchmark.py --output results.json
+    python benchmark.py --sizes short medium --rate-limit-every 20 --compare results.json
+
+Groq is replaced by a local FakeGroqServer, yt-dlp metadata and YouTube
+captions by generated stand-ins, and the audio download by ffmpeg generating
+tone bursts with pauses. Everything else (cache, scheduler, segmenter,
+summarizer, retrieval, PDF export) is the real code, run against a fresh
+cache directory. Each video goes through metadata, captions transcript,
+Whisper transcription, summary, chat, a repeated (cached) summary and PDF
+export; the latency, throughput and peak Python memory (tracemalloc) of
+every stage are written to JSON.
+Needs ffmpeg on PATH.
+"""
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import tempfile
+import subprocess
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmark_utils import caption_segments, measure
+from fake_groq import FakeGroqServer
+
+# name -> (video ID, minutes)
+VIDEOS: Dict[str, Tuple[str, float]] = {
+    'short': ("benchShort1", 5),
+    'medium': ("benchMedium", 30),
+    'long': ("benchLong01", 180),
+}
+
+CHAT_QUESTION = "What does the speaker say about the example?"
+
+
+def _minutes(video_id: str) -> float:
+    return next(minutes for vid, minutes in VIDEOS.values() if vid == video_id)
+
+
+class FakeYoutubeDL:
+    """Stand-in for yt_dlp.YoutubeDL that knows the benchmark videos."""
+
+    def __init__(self, opts: Optional[dict] = None):
+        self.opts = opts or {}
+
+    def __enter__(self) -> 'FakeYoutubeDL':
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @staticmethod
+    def sanitize_info(info: Dict[str, Any]) -> Dict[str, Any]:
+        return info
+
+    def extract_info(self, url: str, download: bool = False) -> Dict[str, Any]:
+        video_id = url.rsplit('=', 1)[-1]
+        return {
+            'id': video_id,
+            'title': f"Benchmark video {video_id}",
+            'uploader': "Benchmark",
+            'duration': int(_minutes(video_id) * 60),
+            'thumbnail': '',
+        }
+
+
+class FakeTranscriptApi:
+    """Stand-in for YouTubeTranscriptApi: three second auto-caption style entries."""
+
+    @staticmethod
+    def get_transcript(video_id: str) -> List[Dict[str, Any]]:
+        return [{'text': text, 'start': start, 'duration': duration}
+                for text, start, duration in caption_segments(_minutes(video_id) * 60)]
+
+
+def fake_download_cmd(segmenter) -> List[str]:
+    """Replaces the yt-dlp download: ffmpeg writes the video's length of tone bursts and pauses."""
+    seconds = _minutes(segmenter.video_id) * 60
+    source = f"sine=f=180:sample_rate=44100:d={seconds},volume=0:enable='lt(mod(t,4.7),0.5)'"
+    return ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-f', 'lavfi', '-i', source,
+            '-ac', '2', '-c:a', 'libopus', '-b:a', '48k', '-f', 'webm', segmenter.source_path]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_video(name: str, trace_memory: bool, workdir: str) -> List[Dict[str, Any]]:
+    # Imported late: these read their configuration from the environment set up in main()
+    from utils import VideoUtils, AIEngine, PDFGenerator
+
+    video_id, minutes = VIDEOS[name]
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    results = []
+
+    def stage(stage_name: str, run: Callable[[], Any], amount: Callable[[Any], float], unit: str) -> Any:
+        value, metrics = measure(run, trace_memory)
+        throughput = amount(value) / metrics['seconds'] if metrics['seconds'] else 0.0
+        results.append({'video': name, 'minutes': minutes, 'stage': stage_name, **metrics,
+                        'throughput': round(throughput, 2), 'unit': unit})
+        print(f"  {stage_name:<11}{metrics['seconds']:>9.2f}s{metrics['peak_mb']:>9.1f}MB"
+              f"{throughput:>12.1f} {unit}")
+        return value
+
+    print(f"{name} ({minutes:g} min, {video_id})")
+    metadata = stage('metadata', lambda: VideoUtils.get_video_metadata(url), lambda _: 1, 'videos/s')
+    text = stage('transcript', lambda: VideoUtils.get_transcript(video_id), len, 'chars/s')
+    stage('whisper', lambda: VideoUtils.transcribe_with_whisper(video_id, session=f"bench-{name}"),
+          lambda _: minutes * 60, 'audio s/s')
+
+    ai = AIEngine(session=f"bench-{name}")
+    summary = stage('summary', lambda: ai.summarize(text), lambda _: ai.last_stats.get('total_tokens', 0), 'tokens/s')
+    stage('chat', lambda: ai.chat(text, [], CHAT_QUESTION, video_id=video_id),
+          lambda _: ai.last_stats.get('total_tokens', 0), 'tokens/s')
+    # Another session asking for the same summary is served from the response cache
+    stage('summary_hit', lambda: AIEngine(session=f"bench-{name}-2").summarize(text), lambda _: 1, 'requests/s')
+
+    transcript = VideoUtils.get_transcript_segments(video_id)
+    pdf_path = os.path.join(workdir, f"{name}.pdf")
+    stage('pdf', lambda: PDFGenerator.generate(transcript, summary, metadata, out=pdf_path),
+          lambda _: len(text), 'chars/s')
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r['video'], r['stage']): r for r in json.load(f)['results']}
+    print(f"\nCompared with {baseline_path}:")
+    for r in results:
+        old = baseline.get((r['video'], r['stage']))
+        if not old or not old['seconds']:
+            continue
+        change = (r['seconds'] - old['seconds']) / old['seconds'] * 100
+        print(f"  {r['video']:<7}{r['stage']:<11}{old['seconds']:>9.2f}s -> {r['seconds']:>8.2f}s ({change:+.0f}%)"
+              f"  peak {old['peak_mb']:.1f} -> {r['peak_mb']:.1f}MB")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark.")
+    parser.add_argument('--sizes', nargs='+', choices=list(VIDEOS), default=list(VIDEOS))
+    parser.add_argument('--output', default='benchmark.json', help="JSON file the results are written to")
+    parser.add_argument('--compare', help="Earlier results file to print the change against")
+    parser.add_argument('--latency', type=float, default=0.05, help="Fake Groq latency per request (s)")
+    parser.add_argument('--tokens-per-second', type=float, default=400.0)
+    parser.add_argument('--whisper-speed', type=float, default=200.0, help="Fake Whisper speed (x real time)")
+    parser.add_argument('--rate-limit-every', type=int, default=0, help="Answer every Nth request with a 429")
+    parser.add_argument('--real-limits', action='store_true',
+                        help="Keep the configured Groq rate limits instead of lifting them")
+    parser.add_argument('--no-memory', action='store_true', help="Skip tracemalloc (it slows Python code down)")
+    args = parser.parse_args(argv)
+
+    server = FakeGroqServer(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                            whisper_speed=args.whisper_speed, rate_limit_every=args.rate_limit_every)
+    with server, tempfile.TemporaryDirectory() as workdir:
+        os.environ['VIDEO_CACHE_DIR'] = os.path.join(workdir, 'cache')
+        os.environ['GROQ_BASE_URL'] = server.url
+        os.environ['GROQ_API_KEY'] = 'benchmark'
+        if not args.real_limits:
+            # The fake server is the only limit, so the numbers measure our own overhead
+            for name in ('GROQ_TPM_LIMIT', 'GROQ_RPM_LIMIT', 'WHISPER_RPM_LIMIT', 'WHISPER_ASH_LIMIT'):
+                os.environ[name] = '1000000000'
+
+        import audio
+        import utils
+        utils.yt_dlp = types.SimpleNamespace(YoutubeDL=FakeYoutubeDL)
+        utils.YouTubeTranscriptApi = FakeTranscriptApi
+        audio.AudioSegmenter._download_cmd = fake_download_cmd
+
+        results = []
+        for name in args.sizes:
+            results.extend(run_video(name, not args.no_memory, workdir))
+
+        from rate_limit import get_scheduler
+        report = {
+            'commit': git_commit(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'config': vars(args),
+            'results': results,
+            'fake_groq': dict(server.stats),
+            'scheduler': get_scheduler().stats(),
+        }
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Compares the Whisper upload pipelines on a local audio file.
+
+    python benchmark_audio.py lecture.m4a
+    python benchmark_audio.py --minutes 90     # synthetic speech-like sample
+
+"before" is the old 64kbps mp3 cut every 900 seconds, "after" is 16kHz mono
+Opus cut at pauses by audio.SpeechChunker. Needs ffmpeg on PATH.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List, Optional
+
+from audio import SAMPLE_RATE, SEGMENT_SECONDS, PIPE_CHUNK_BYTES, SpeechChunker
+
+# Old pipeline settings, kept here for comparison only
+LEGACY_BITRATE = "64k"
+LEGACY_SEGMENT_SECONDS = 900
+
+
+def make_sample(path: str, minutes: float):
+    """Writes stereo tone bursts separated by short pauses, roughly the rhythm of speech."""
+    source = f"aevalsrc=0.3*sin(2*PI*180*t)*(0.6+0.4*sin(2*PI*3*t))*gt(mod(t\\,4.7)\\,0.5):s=44100:d={minutes * 60}"
+    subprocess.run(
+        ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-f', 'lavfi', '-i', source,
+         '-ac', '2', '-c:a', 'libopus', '-b:a', '96k', path],
+        check=True,
+    )
+
+
+def run_legacy(source: str, out_dir: str) -> List[int]:
+    subprocess.run(
+        ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', source,
+         '-vn', '-c:a', 'libmp3lame', '-b:a', LEGACY_BITRATE,
+         '-f', 'segment', '-segment_time', str(LEGACY_SEGMENT_SECONDS), '-reset_timestamps', '1',
+         os.path.join(out_dir, 'chunk_%03d.mp3')],
+        check=True,
+    )
+    return [os.path.getsize(os.path.join(out_dir, name)) for name in sorted(os.listdir(out_dir))]
+
+
+def run_speech(source: str, out_dir: str, segment_seconds: float) -> List[int]:
+    decoder = subprocess.Popen(
+        ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', source,
+         '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 's16le', 'pipe:1'],
+        stdout=subprocess.PIPE,
+    )
+    chunker = SpeechChunker(out_dir, segment_seconds)
+    segments = []
+    for data in iter(lambda: decoder.stdout.read(PIPE_CHUNK_BYTES), b''):
+        segments.extend(chunker.feed(data))
+    if decoder.wait() != 0:
+        raise RuntimeError("Decoding failed")
+    last = chunker.flush()
+    if last:
+        segments.append(last)
+    return [os.path.getsize(path) for _, path, _, _ in segments]
+
+
+def measure(name: str, run) -> Dict[str, float]:
+    start = time.time()
+    sizes = run()
+    return {
+        'pipeline': name,
+        'chunks': len(sizes),
+        'mb': sum(sizes) / (1024 * 1024),
+        'largest_mb': max(sizes, default=0) / (1024 * 1024),
+        'seconds': time.time() - start,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bytes uploaded and chunk count per Whisper pipeline.")
+    parser.add_argument('source', nargs='?', help="Audio or video file (default: generated sample)")
+    parser.add_argument('--minutes', type=float, default=60, help="Length of the generated sample")
+    parser.add_argument('--segment-seconds', type=float, default=SEGMENT_SECONDS)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = args.source
+        if not source:
+            source = os.path.join(tmp, 'sample.webm')
+            print(f"Generating a {args.minutes:g} minute sample...")
+            make_sample(source, args.minutes)
+
+        for name in ('before', 'after'):
+            os.makedirs(os.path.join(tmp, name))
+        results = [
+            measure('before', lambda: run_legacy(source, os.path.join(tmp, 'before'))),
+            measure('after', lambda: run_speech(source, os.path.join(tmp, 'after'), args.segment_seconds)),
+        ]
+
+    print(f"{'pipeline':<10}{'chunks':>8}{'MB':>10}{'largest MB':>12}{'seconds':>10}")
+    for r in results:
+        print(f"{r['pipeline']:<10}{r['chunks']:>8}{r['mb']:>10.2f}{r['largest_mb']:>12.2f}{r['seconds']:>10.1f}")
+    before, after = results
+    if after['mb']:
+        print(f"Upload size reduced {before['mb'] / after['mb']:.1f}x, {before['chunks']} -> {after['chunks']} chunks")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Transcript cleanup throughput and token reduction on auto-caption style input.
+
+    python benchmark_normalize.py --hours 1 3 10
+
+Generates rolling auto-captions (each three second line repeats the last few
+words of the previous one), with [Music]/[Applause] tags and filler words
+sprinkled in at rates typical of talk videos, and times `normalize_transcript`
+on them. The cleanup runs before every summary and chat on an uncached video.
+"""
+import sys
+import argparse
+from typing import List, Optional
+
+import numpy as np
+
+from benchmark_utils import CAPTION_SECONDS, CAPTION_WORDS, caption_segments, timed_runs
+from normalize import normalize_transcript, token_reduction
+from transcript import Transcript
+
+SYLLABLES = "ka lo mi ne ru ta shi po ve da ri mo lu se fa ni to be ga zu".split()
+VOCABULARY = 20000
+FILLER_RATE = 0.03
+TAG_RATE = 0.01
+ROLLING_RATE = 0.5
+
+
+def make_captions(hours: float, rng: np.random.Generator) -> Transcript:
+    vocabulary = ["".join(rng.choice(SYLLABLES, size=rng.integers(1, 4))) for _ in range(VOCABULARY)]
+    ids = np.minimum(rng.zipf(1.2, size=int(hours * 3600 / CAPTION_SECONDS) * CAPTION_WORDS), VOCABULARY) - 1
+    segments, previous = [], []
+    for text, start, duration in caption_segments(hours * 3600, [vocabulary[w] for w in ids]):
+        words = text.split()
+        line = list(words)
+        if previous and rng.random() < ROLLING_RATE:
+            line = previous[-int(rng.integers(2, 6)):] + line
+        if rng.random() < FILLER_RATE * CAPTION_WORDS:
+            line.insert(int(rng.integers(0, len(line))), rng.choice(["um", "uh", "Um,", "uh..."]))
+        if rng.random() < TAG_RATE * CAPTION_WORDS:
+            line.insert(0, rng.choice(["[Music]", "[Applause]", "[Laughter]", "♪"]))
+        segments.append((" ".join(line), start, duration))
+        previous = words
+    return Transcript.from_segments(segments)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Transcript cleanup throughput and token reduction.")
+    parser.add_argument('--hours', type=float, nargs='+', default=[1, 3, 10])
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per transcript")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    print(f"{'hours':>6}{'MB':>8}{'ms':>9}{'MB/s':>8}{'raw tokens':>13}{'tokens':>11}{'saved':>8}")
+    for hours in args.hours:
+        text = make_captions(hours, rng).text
+
+        def run():
+            normalize_transcript.cache_clear()
+            return normalize_transcript(text)
+
+        seconds = float(np.median(timed_runs(run, args.repeat)))
+        normalized = normalize_transcript(text)
+        size = len(text.encode('utf-8')) / (1024 * 1024)
+        r = token_reduction(text, normalized)
+        print(f"{hours:>6g}{size:>8.1f}{seconds * 1000:>9.1f}{size / seconds:>8.1f}"
+              f"{r['raw_tokens']:>13,}{r['tokens']:>11,}{r['reduction']:>8.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
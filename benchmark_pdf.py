@@ -0,0 +1,83 @@
+"""
+Time and peak memory of the PDF export against transcript length.
+
+    python benchmark_pdf.py --hours 0.5 1 2 4
+
+Transcripts are synthetic caption segments at ~150 words per minute. "legacy"
+is the previous single multi_cell, in-memory, ASCII-only export, "streaming" is
+PDFGenerator writing to a temp file. Peak memory is measured with tracemalloc.
+"""
+import os
+import sys
+import argparse
+import tempfile
+import unicodedata
+from typing import Callable, Dict, List, Optional
+
+from fpdf import FPDF
+
+from benchmark_utils import caption_segments, measure
+from utils import PDFGenerator
+from transcript import Transcript
+
+WORDS = "so the idea here is that we take the whole video and turn it into something you can read later".split()
+
+
+def make_transcript(hours: float) -> Transcript:
+    return Transcript.from_segments(caption_segments(hours * 3600, WORDS))
+
+
+def legacy_generate(transcript: str, summary: str, metadata: Dict[str, str]) -> bytes:
+    """The export as it was: one multi_cell for the whole transcript, output built in memory."""
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', 24)
+    pdf.cell(0, 10, "YouTube-to-Text Pro", 0, 1)
+    pdf.set_font("Arial", '', 10)
+    pdf.cell(0, 10, f"Video: {metadata.get('title', 'Unknown')}", 0, 1)
+    pdf.set_font("Arial", 'B', 18)
+    pdf.cell(0, 10, "Full Transcript", 0, 1)
+    pdf.set_font("Arial", '', 10)
+    normalized = unicodedata.normalize('NFKD', transcript).encode('ascii', 'ignore').decode('ascii')
+    pdf.multi_cell(0, 6, normalized)
+    return pdf.output(dest='S').encode('latin-1')
+
+
+def measure_export(run: Callable[[], int]) -> Dict[str, float]:
+    """Times one run, then repeats it under tracemalloc (which slows it down) for the peak."""
+    size, timing = measure(run)
+    _, memory = measure(run, trace_memory=True)
+    return {'seconds': timing['seconds'], 'peak_mb': memory['peak_mb'], 'pdf_mb': size / (1024 * 1024)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="PDF export time and memory per transcript length.")
+    parser.add_argument('--hours', type=float, nargs='+', default=[0.5, 1, 2, 4])
+    parser.add_argument('--skip-legacy', action='store_true', help="Only run the streaming export")
+    args = parser.parse_args(argv)
+
+    metadata = {'title': "Benchmark"}
+    print(f"{'hours':>6}{'chars':>10}  {'export':<10}{'seconds':>9}{'peak MB':>9}{'PDF MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'report.pdf')
+
+        def streaming(transcript: Transcript) -> int:
+            PDFGenerator.generate(transcript, "", metadata, out=path)
+            return os.path.getsize(path)
+
+        # Font metrics are loaded on first use, keep that out of the first measurement
+        streaming(make_transcript(0.01))
+        for hours in args.hours:
+            transcript = make_transcript(hours)
+            runs = [('streaming', lambda: streaming(transcript))]
+            if not args.skip_legacy:
+                runs.append(('legacy', lambda: len(legacy_generate(transcript.text, "", metadata))))
+            for name, run in runs:
+                r = measure_export(run)
+                print(f"{hours:>6g}{len(transcript.text):>10,}  {name:<10}{r['seconds']:>9.2f}"
+                      f"{r['peak_mb']:>9.1f}{r['pdf_mb']:>8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
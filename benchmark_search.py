@@ -0,0 +1,85 @@
+"""
+Library search latency against the amount of indexed transcript.
+
+    python benchmark_search.py --hours 1000
+    python benchmark_search.py --hours 20000 --keep /tmp/library.db
+
+Indexes synthetic one-hour transcripts (Zipf-distributed words from a generated
+vocabulary, three second caption segments at ~160 words per minute) into a
+fresh library, then times a mix of rare, common, multi-word, phrase and
+question-style queries.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from typing import List, Optional
+
+import numpy as np
+
+from benchmark_utils import CAPTION_WORDS, caption_segments, timed_runs
+from library import Library
+from transcript import Transcript
+
+VOCABULARY = 30000
+SYLLABLES = "ka lo mi ne ru ta shi po ve da ri mo lu se fa ni to be ga zu".split()
+QUERIES = [
+    "order blocks",          # inserted into a few videos only
+    '"order blocks"',
+    "ka",                     # the most frequent word
+    "kalo mine",
+    "which videos mention liquidity sweeps?",
+    "rumota",
+]
+
+
+def make_vocabulary(size: int, rng: np.random.Generator) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES, size=rng.integers(1, 5))))
+    return sorted(words, key=len)
+
+
+def make_video(index: int, vocabulary: List[str], rng: np.random.Generator) -> Transcript:
+    ids = np.minimum(rng.zipf(1.2, size=3600 // 3 * CAPTION_WORDS), len(vocabulary)) - 1
+    segments = caption_segments(3600, [vocabulary[w] for w in ids])
+    if index % 500 == 0:
+        text, start, duration = segments[600]
+        segments[600] = (text + " order blocks and liquidity sweeps", start, duration)
+    return Transcript.from_segments(segments)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Library search latency per indexed hours.")
+    parser.add_argument('--hours', type=int, default=1000, help="One-hour videos to index")
+    parser.add_argument('--repeat', type=int, default=20, help="Runs per query")
+    parser.add_argument('--keep', help="Library file to build (kept afterwards) instead of a temp file")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    vocabulary = make_vocabulary(VOCABULARY, rng)
+    with tempfile.TemporaryDirectory() as tmp:
+        library = Library(args.keep or os.path.join(tmp, 'library.db'))
+        start = time.time()
+        for index in range(args.hours):
+            video_id = f"bench{index:06d}"
+            library.set_metadata(video_id, {'title': f"Benchmark video {index}", 'channel': "Benchmark"})
+            library.add(video_id, make_video(index, vocabulary, rng))
+            if (index + 1) % 1000 == 0:
+                print(f"  {index + 1} hours indexed ({time.time() - start:.0f}s)")
+        library.optimize()
+        elapsed = time.time() - start
+        size = os.path.getsize(library.path) / (1024 * 1024)
+        print(f"Indexed {args.hours} hours in {elapsed:.1f}s ({args.hours / elapsed:.1f} hours/s), {size:.0f}MB")
+
+        print(f"{'query':<42}{'videos':>7}{'p50 ms':>9}{'p95 ms':>9}")
+        for query in QUERIES:
+            results = library.search(query)
+            times = np.array(timed_runs(lambda: library.search(query), args.repeat)) * 1000
+            print(f"{query:<42}{len(results):>7}{np.percentile(times, 50):>9.1f}{np.percentile(times, 95):>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
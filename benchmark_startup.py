@@ -0,0 +1,113 @@
+"""
+Cold start and per-message latency of the app's Python side.
+
+    python benchmark_startup.py
+    python benchmark_startup.py --messages 5 --gap 6
+
+Each scenario runs in a fresh interpreter against a local FakeGroqServer:
+it imports what main.py imports (streamlit aside), then sends `--messages`
+short summary requests, each from a new AIEngine as a Streamlit rerun would,
+`--gap` seconds apart. Scenarios:
+
+    eager       heavy dependencies imported up front, as utils.py used to
+    lazy        imported on first use
+    warm        lazy, with utils.warm_up() finished before the first message
+                (it runs while the first page renders)
+    short-pool  warm, but with httpx's default 5s keep-alive for idle connections
+
+Prints the import time, the first and the following messages' latency and
+how many connections the fake server accepted.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from typing import Any, Dict, List, Optional
+
+from fake_groq import FakeGroqServer
+
+SCENARIOS = {
+    'eager': {'eager': True},
+    'lazy': {},
+    'warm': {'warm': True},
+    'short-pool': {'warm': True, 'env': {'GROQ_KEEPALIVE_SECONDS': '5'}},
+}
+EAGER_MODULES = ['yt_dlp', 'youtube_transcript_api', 'groq', 'fpdf']
+
+
+def child(eager: bool, warm: bool, messages: int, gap: float) -> Dict[str, Any]:
+    start = time.perf_counter()
+    if eager:
+        for name in EAGER_MODULES:
+            __import__(name)
+    import utils
+    import jobs, library, normalize, chat_context, rate_limit  # noqa: F401 (main.py's imports)
+    imported = time.perf_counter() - start
+
+    if warm:
+        utils.warm_up().join()
+
+    latencies = []
+    for i in range(messages):
+        if i:
+            time.sleep(gap)
+        start = time.perf_counter()
+        utils.AIEngine(session="startup").summarize(f"Message {i}: the speaker explains step {i} of the example.")
+        latencies.append(time.perf_counter() - start)
+    return {'import_seconds': imported, 'latencies': latencies}
+
+
+def run_scenario(name: str, server: FakeGroqServer, messages: int, gap: float, workdir: str) -> Dict[str, Any]:
+    scenario = SCENARIOS[name]
+    env = dict(os.environ, VIDEO_CACHE_DIR=os.path.join(workdir, name), GROQ_BASE_URL=server.url,
+               GROQ_API_KEY='startup', GROQ_TPM_LIMIT='1000000000', GROQ_RPM_LIMIT='1000000000',
+               **scenario.get('env', {}))
+    args = [sys.executable, __file__, '--child', '--messages', str(messages), '--gap', str(gap)]
+    args += ['--eager'] if scenario.get('eager') else []
+    args += ['--warm'] if scenario.get('warm') else []
+    connections = server.stats['connections']
+    output = subprocess.run(args, env=env, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['connections'] = server.stats['connections'] - connections
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Cold start and per-message latency.")
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--messages', type=int, default=4, help="Requests per run")
+    parser.add_argument('--gap', type=float, default=6.0, help="Seconds between requests")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per scenario (medians are shown)")
+    parser.add_argument('--latency', type=float, default=0.02, help="Fake Groq latency per request (s)")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--eager', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--warm', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args.eager, args.warm, args.messages, args.gap)))
+        return 0
+
+    # Imported here, the child must start from a bare interpreter
+    import numpy as np
+
+    print(f"{'scenario':<12}{'import ms':>11}{'first ms':>10}{'next ms':>9}{'connections':>13}")
+    with FakeGroqServer(latency=args.latency, tokens_per_second=100000) as server, \
+            tempfile.TemporaryDirectory() as workdir:
+        for name in args.scenarios:
+            runs = [run_scenario(name, server, args.messages, args.gap, os.path.join(workdir, str(i)))
+                    for i in range(args.repeat)]
+            imported = np.median([r['import_seconds'] for r in runs]) * 1000
+            first = np.median([r['latencies'][0] for r in runs]) * 1000
+            following = [t for r in runs for t in r['latencies'][1:]]
+            following = np.median(following) * 1000 if following else 0.0
+            connections = np.median([r['connections'] for r in runs])
+            print(f"{name:<12}{imported:>11.0f}{first:>10.0f}{following:>9.1f}{connections:>13g}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
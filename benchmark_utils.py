@@ -0,0 +1,52 @@
+"""
+What the benchmarks and the load test share: auto-caption style synthetic
+transcripts (`caption_segments`) and timing (`measure`, `timed_runs`).
+"""
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+WORDS = ("the speaker explains how the system works and why each step matters "
+         "then walks through an example and answers questions from the audience").split()
+
+# YouTube's auto-generated captions: about eight words every three seconds
+CAPTION_WORDS = 8
+CAPTION_SECONDS = 3.0
+
+
+def caption_segments(seconds: float, words: Sequence[str] = WORDS, offset: int = 0) -> List[Tuple[str, float, float]]:
+    """
+    (text, start, duration) caption segments for `seconds` of video, CAPTION_WORDS
+    words each, taken in order from `words` starting at `offset` and cycling.
+    """
+    return [(" ".join(words[(offset + i * CAPTION_WORDS + j) % len(words)] for j in range(CAPTION_WORDS)),
+             i * CAPTION_SECONDS, CAPTION_SECONDS)
+            for i in range(int(seconds / CAPTION_SECONDS))]
+
+
+def measure(run: Callable[[], Any], trace_memory: bool = False) -> Tuple[Any, Dict[str, float]]:
+    """
+    Runs `run` once and returns its result and {'seconds', 'peak_mb'}. The peak Python
+    memory is only measured with `trace_memory` (tracemalloc slows Python code down).
+    """
+    if trace_memory:
+        tracemalloc.start()
+    start = time.time()
+    try:
+        result = run()
+    finally:
+        elapsed = time.time() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        if trace_memory:
+            tracemalloc.stop()
+    return result, {'seconds': round(elapsed, 3), 'peak_mb': round(peak / (1024 * 1024), 2)}
+
+
+def timed_runs(run: Callable[[], Any], repeat: int) -> List[float]:
+    """Seconds each of `repeat` calls of `run` took."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return times
@@ -0,0 +1,360 @@
+import os
+import json
+import heapq
+import atexit
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any, List, Sequence, Tuple, Union
+
+from transcript import Transcript
+
+# Cache location and eviction limits (override via environment)
+CACHE_DIR = os.getenv("VIDEO_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+CACHE_MAX_MB = float(os.getenv("VIDEO_CACHE_MAX_MB", "512"))
+CACHE_MAX_AGE_DAYS = float(os.getenv("VIDEO_CACHE_MAX_AGE_DAYS", "30"))
+# Chat retrieval indexes (retrieval.py), evicted along with the entries
+INDEX_DIR = os.path.join(CACHE_DIR, "indexes")
+
+# Keep reads from writing: a hit refreshes the entry's last use at most this often, and
+# hit/miss counters are added up in memory and written together this often
+ACCESS_UPDATE_SECONDS = 60
+STATS_FLUSH_SECONDS = 5
+# evict() runs after this many puts, or on the first put this long after its last run, so
+# the cache can go over its size limit by a few entries in between
+EVICT_EVERY_PUTS = 20
+EVICT_INTERVAL_SECONDS = 60
+
+
+class ThreadLocalConnection:
+    """
+    Callable returning this thread's connection to the SQLite database at `path`
+    (sqlite3 connections must not be shared across threads), opened in autocommit
+    mode with `pragmas` applied. WAL mode lets several processes share the file.
+    """
+
+    PRAGMAS = ("journal_mode=WAL", "synchronous=NORMAL", "busy_timeout=30000")
+
+    def __init__(self, path: str, pragmas: Sequence[str] = PRAGMAS):
+        self.path = path
+        self.pragmas = tuple(pragmas)
+        self._local = threading.local()
+
+    def __call__(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            for pragma in self.pragmas:
+                conn.execute(f"PRAGMA {pragma}")
+            self._local.conn = conn
+        return conn
+
+
+class TranscriptCache:
+    """
+    On-disk cache of transcripts and metadata keyed by video ID, and of LLM responses keyed by request.
+    Backed by SQLite in WAL mode so several Streamlit worker processes can share it.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None,
+                 max_age: Optional[float] = None, index_dir: Optional[str] = None):
+        self.path = path or os.path.join(CACHE_DIR, "videos.db")
+        self.index_dir = index_dir or os.path.join(os.path.dirname(os.path.abspath(self.path)), "indexes")
+        self.max_bytes = int(CACHE_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self.max_age = CACHE_MAX_AGE_DAYS * 86400 if max_age is None else max_age
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._conn = ThreadLocalConnection(self.path)
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._counts_flushed = time.time()
+        self._puts = 0
+        self._evicted = 0.0
+        self._init_schema()
+        atexit.register(self._flush_at_exit)
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                kind TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                data BLOB NOT NULL,
+                source TEXT,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (kind, video_id)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_created ON entries (created_at)")
+        # Whisper results per audio chunk, so a failed transcription can resume where it stopped
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                video_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                audio_hash TEXT NOT NULL,
+                data BLOB NOT NULL,
+                duration REAL NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (video_id, chunk_index, audio_hash)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS chunks_created ON chunks (created_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+
+    def _flush_at_exit(self):
+        # Temporary caches (tests, benchmarks) may be gone by now
+        if os.path.exists(self.path):
+            try:
+                self.flush_stats()
+            except sqlite3.Error as e:
+                print(f"Error writing cache stats: {e}")
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+            due = time.time() - self._counts_flushed >= STATS_FLUSH_SECONDS
+        if due:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """Adds the hit/miss counts gathered in memory to the shared counters."""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            self._counts_flushed = time.time()
+        if not counts:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO stats (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                counts.items()
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _get(self, kind: str, video_id: str, max_age: Optional[float] = None, count: bool = True) -> Optional[tuple]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT data, source, created_at, accessed_at FROM entries WHERE kind = ? AND video_id = ?",
+            (kind, video_id)
+        ).fetchone()
+        now = time.time()
+        max_age = max_age or self.max_age
+        if row and max_age and now - row[2] > max_age:
+            conn.execute("DELETE FROM entries WHERE kind = ? AND video_id = ?", (kind, video_id))
+            row = None
+        if row is None:
+            if count:
+                self._count(f"{kind}_misses")
+            return None
+        if now - row[3] >= ACCESS_UPDATE_SECONDS:
+            conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE kind = ? AND video_id = ?",
+                (now, kind, video_id)
+            )
+        if count:
+            self._count(f"{kind}_hits")
+        return row[:3]
+
+    def _put(self, kind: str, video_id: str, data: Union[str, bytes], source: Optional[str] = None):
+        now = time.time()
+        size = len(data) if isinstance(data, bytes) else len(data.encode('utf-8'))
+        self._conn().execute(
+            "INSERT OR REPLACE INTO entries (kind, video_id, data, source, size, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (kind, video_id, data, source, size, now, now)
+        )
+        with self._lock:
+            self._puts += 1
+            due = self._puts >= EVICT_EVERY_PUTS or now - self._evicted >= EVICT_INTERVAL_SECONDS
+        if due:
+            self.evict()
+
+    def get_transcript(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """Returns {'transcript', 'text', 'source'} for a cached transcript, or None."""
+        row = self._get('transcript', video_id)
+        if row is None:
+            return None
+        # Entries written before timestamps were kept hold plain text
+        if isinstance(row[0], bytes):
+            transcript = Transcript.from_bytes(row[0])
+        else:
+            transcript = Transcript.from_text(row[0])
+        return {'transcript': transcript, 'text': transcript.text, 'source': row[1]}
+
+    def put_transcript(self, video_id: str, transcript: Transcript, source: str):
+        """Stores a transcript along with where it came from ('captions' or 'whisper')."""
+        self._put('transcript', video_id, transcript.to_bytes(), source)
+
+    def get_metadata(self, video_id: str) -> Optional[Dict[str, str]]:
+        row = self._get('metadata', video_id)
+        return json.loads(row[0]) if row else None
+
+    def put_metadata(self, video_id: str, metadata: Dict[str, str]):
+        self._put('metadata', video_id, json.dumps(metadata))
+
+    def get_response(self, key: str, max_age: Optional[float] = None, count: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Returns {'text', 'stats'} of a cached LLM response, or None if missing or older than max_age seconds.
+        count=False leaves the hit/miss counters alone, for lookups that would never call the LLM on a miss.
+        """
+        row = self._get('response', key, max_age, count)
+        return json.loads(row[0]) if row else None
+
+    def put_response(self, key: str, text: str, stats: Dict[str, Any], source: Optional[str] = None):
+        """Stores an LLM response under a key built from everything that determines it (see utils.response_key)."""
+        self._put('response', key, json.dumps({'text': text, 'stats': stats}), source)
+
+    def video_ids(self, kind: str) -> List[str]:
+        """IDs of every cached entry of `kind` ('transcript' or 'metadata')."""
+        return [row[0] for row in self._conn().execute("SELECT video_id FROM entries WHERE kind = ?", (kind,))]
+
+    def get_chunk(self, video_id: str, chunk_index: int, audio_hash: str) -> Optional[Tuple[Transcript, float]]:
+        """Returns (transcript, duration) checkpointed for this exact chunk of audio, or None."""
+        row = self._conn().execute(
+            "SELECT data, duration FROM chunks WHERE video_id = ? AND chunk_index = ? AND audio_hash = ?",
+            (video_id, chunk_index, audio_hash)
+        ).fetchone()
+        if row is None:
+            return None
+        return Transcript.from_bytes(row[0]), row[1]
+
+    def put_chunk(self, video_id: str, chunk_index: int, audio_hash: str, transcript: Transcript, duration: float):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO chunks (video_id, chunk_index, audio_hash, data, duration, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (video_id, chunk_index, audio_hash, transcript.to_bytes(), duration, time.time())
+        )
+
+    def clear_chunks(self, video_id: str):
+        """Drops a video's chunk checkpoints once its full transcript is stored."""
+        self._conn().execute("DELETE FROM chunks WHERE video_id = ?", (video_id,))
+
+    def _index_files(self) -> List[Tuple[float, int, None, str]]:
+        """(last use, size, None, path) of every retrieval index file, oldest first, shaped like entry rows."""
+        files = []
+        try:
+            with os.scandir(self.index_dir) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, None, entry.path))
+        except OSError:
+            pass
+        return sorted(files)
+
+    @staticmethod
+    def _remove_file(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def evict(self):
+        """
+        Drops entries, Whisper chunk checkpoints and retrieval index files older than
+        max_age, then the least recently used of any of them until under max_bytes.
+        Runs every few puts on its own.
+        """
+        with self._lock:
+            self._puts = 0
+            self._evicted = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            files = self._index_files()
+            if self.max_age:
+                cutoff = time.time() - self.max_age
+                cur = conn.execute("DELETE FROM entries WHERE created_at < ?", (cutoff,))
+                evicted = cur.rowcount
+                conn.execute("DELETE FROM chunks WHERE created_at < ?", (cutoff,))
+                evicted += sum(self._remove_file(f[3]) for f in files if f[0] < cutoff)
+                files = [f for f in files if f[0] >= cutoff]
+            else:
+                evicted = 0
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            total += conn.execute("SELECT COALESCE(SUM(length(data)), 0) FROM chunks").fetchone()[0]
+            total += sum(f[1] for f in files)
+            if self.max_bytes and total > self.max_bytes:
+                rows = conn.execute(
+                    "SELECT accessed_at, size, kind, video_id FROM entries ORDER BY accessed_at"
+                ).fetchall()
+                # Chunk checkpoints go per video, last used when its latest chunk was stored
+                chunks = conn.execute(
+                    "SELECT MAX(created_at), SUM(length(data)), 'chunks', video_id FROM chunks "
+                    "GROUP BY video_id ORDER BY 1"
+                ).fetchall()
+                # Index files are rebuilt from the transcript on demand, they go by last use like the rest
+                for _, size, kind, key in heapq.merge(rows, chunks, files, key=lambda r: r[0]):
+                    if total <= self.max_bytes:
+                        break
+                    if kind is None:
+                        self._remove_file(key)
+                    elif kind == 'chunks':
+                        conn.execute("DELETE FROM chunks WHERE video_id = ?", (key,))
+                    else:
+                        conn.execute("DELETE FROM entries WHERE kind = ? AND video_id = ?", (kind, key))
+                    total -= size
+                    evicted += 1
+            if evicted:
+                conn.execute(
+                    "INSERT INTO stats (name, value) VALUES ('evictions', ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    (evicted,)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and hit rates per kind (shared by all processes) plus current size."""
+        self.flush_stats()
+        conn = self._conn()
+        result: Dict[str, Any] = {name: value for name, value in conn.execute("SELECT name, value FROM stats")}
+        for kind in ('transcript', 'metadata', 'response'):
+            lookups = result.get(f"{kind}_hits", 0) + result.get(f"{kind}_misses", 0)
+            result[f"{kind}_hit_rate"] = result.get(f"{kind}_hits", 0) / lookups if lookups else 0.0
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        result['entries'] = entries
+        result['chunk_bytes'] = conn.execute("SELECT COALESCE(SUM(length(data)), 0) FROM chunks").fetchone()[0]
+        result['index_bytes'] = sum(f[1] for f in self._index_files())
+        result['bytes'] = size + result['chunk_bytes'] + result['index_bytes']
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._counts = {}
+        conn = self._conn()
+        conn.execute("DELETE FROM entries")
+        conn.execute("DELETE FROM chunks")
+        conn.execute("DELETE FROM stats")
+        for f in self._index_files():
+            self._remove_file(f[3])
+
+
+_cache: Optional[TranscriptCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TranscriptCache:
+    """Returns the process-wide cache instance."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TranscriptCache()
+        return _cache
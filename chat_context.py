@@ -0,0 +1,84 @@
+"""
+Token-bounded chat history.
+
+The last CHAT_HISTORY_TURNS exchanges are sent verbatim (fewer if they exceed
+CHAT_HISTORY_TOKENS), older ones are folded into a running summary kept in a
+ChatMemory, so a turn's prompt stays the same size however long the
+conversation gets. Tokens are counted with a local approximation of the Llama 3
+tokenizer, close enough for budgeting without downloading a vocabulary.
+"""
+import os
+import re
+from typing import Dict, List, Tuple
+
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "3"))
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "1500"))
+# Older turns are folded this many at a time, so the summary isn't rewritten on every message
+CHAT_FOLD_TURNS = 2
+CHAT_SUMMARY_MAX_TOKENS = 300
+
+# Role markers and separators the chat template adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Letter runs, digit runs, and any other non-space character on its own
+TOKEN_PIECE_RE = re.compile(r"[^\W\d_]+|\d+|\S")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate token count: English words take about one token per five letters,
+    digits are split in groups of three, punctuation is a token per character and
+    non-Latin scripts roughly one per character.
+    """
+    count = 0
+    for piece in TOKEN_PIECE_RE.findall(text):
+        if piece.isdigit():
+            count += (len(piece) + 2) // 3
+        elif piece.isalpha() and piece.isascii():
+            count += (len(piece) + 4) // 5
+        elif piece.isalpha():
+            count += len(piece)
+        else:
+            count += 1
+    return count
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+class ChatMemory:
+    """Running summary of one conversation's older turns. Keep one per conversation (e.g. in session state)."""
+
+    def __init__(self):
+        self.summary = ""
+        # Number of history messages already folded into the summary
+        self.folded = 0
+
+    def reset(self):
+        self.summary = ""
+        self.folded = 0
+
+
+def split_history(history: List[Dict[str, str]], memory: ChatMemory, turns: int = CHAT_HISTORY_TURNS,
+                  budget: int = CHAT_HISTORY_TOKENS) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    """
+    Splits the messages not yet in `memory` into (to fold into the summary, to send verbatim).
+    Nothing is folded until CHAT_FOLD_TURNS exchanges have left the verbatim window,
+    unless the window is over `budget`. The latest exchange is always sent verbatim.
+    """
+    if memory.folded > len(history):
+        # The conversation was cleared or replaced
+        memory.reset()
+    pending = history[memory.folded:]
+    if count_message_tokens(pending) <= budget and len(pending) < (turns + CHAT_FOLD_TURNS) * 2:
+        return [], pending
+
+    start = max(0, len(pending) - turns * 2)
+    while start < len(pending) - 2 and count_message_tokens(pending[start:]) > budget:
+        start += 1
+    return pending[:start], pending[start:]
+
+
+def format_messages(messages: List[Dict[str, str]]) -> str:
+    return "\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in messages)
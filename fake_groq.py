@@ -0,0 +1,176 @@
+"""
+Local stand-in for the Groq API, for benchmarks and offline runs.
+
+    server = FakeGroqServer(latency=0.05, tokens_per_second=400, rate_limit_every=10)
+    server.start()
+    os.environ["GROQ_BASE_URL"] = server.url
+
+Serves chat completions (plain and streamed) and Whisper transcriptions with
+generated text. Responses take `latency` seconds plus the time to "generate"
+their tokens at `tokens_per_second` (or, for audio, to transcribe it at
+`whisper_speed` times real time), and every `rate_limit_every`-th request is
+answered with a 429 and a `retry-after` header.
+"""
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+from benchmark_utils import WORDS
+
+# What the transcription endpoint assumes the upload is, to turn its size into a duration
+UPLOAD_BITS_PER_SECOND = 16000
+WHISPER_SEGMENT_SECONDS = 5.0
+
+
+def _words(count: int, offset: int = 0) -> str:
+    return " ".join(WORDS[(offset + i) % len(WORDS)] for i in range(count))
+
+
+class FakeGroqServer:
+    def __init__(self, latency: float = 0.05, tokens_per_second: float = 400.0, completion_tokens: int = 200,
+                 whisper_speed: float = 200.0, rate_limit_every: int = 0, retry_after: float = 0.2,
+                 port: int = 0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.whisper_speed = whisper_speed
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.port = port
+        # connections: TCP connections accepted, fewer than requests when clients keep them alive
+        self.stats: Dict[str, int] = {'chat': 0, 'transcription': 0, 'rate_limited': 0, 'connections': 0}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> 'FakeGroqServer':
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                with fake._lock:
+                    fake.stats['connections'] += 1
+                super().setup()
+
+            def do_POST(self):
+                fake._handle(self)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> 'FakeGroqServer':
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _rate_limited(self) -> bool:
+        with self._lock:
+            self._count += 1
+            if self.rate_limit_every and self._count % self.rate_limit_every == 0:
+                self.stats['rate_limited'] += 1
+                return True
+            return False
+
+    def _handle(self, request: BaseHTTPRequestHandler):
+        body = request.rfile.read(int(request.headers.get('Content-Length') or 0))
+        if self._rate_limited():
+            self._send_json(request, 429, {'error': {'message': "Rate limit reached", 'type': 'tokens'}},
+                            {'retry-after': str(self.retry_after)})
+            return
+        time.sleep(self.latency)
+        if request.path.endswith('/chat/completions'):
+            with self._lock:
+                self.stats['chat'] += 1
+            self._chat(request, json.loads(body or b'{}'))
+        elif request.path.endswith('/audio/transcriptions'):
+            with self._lock:
+                self.stats['transcription'] += 1
+            self._transcription(request, len(body))
+        else:
+            self._send_json(request, 404, {'error': {'message': f"Unknown path {request.path}"}})
+
+    def _chat(self, request: BaseHTTPRequestHandler, payload: Dict[str, Any]):
+        prompt_chars = sum(len(m.get('content') or '') for m in payload.get('messages', []))
+        usage = {
+            'prompt_tokens': prompt_chars // 4 + 1,
+            'completion_tokens': min(self.completion_tokens, payload.get('max_tokens') or self.completion_tokens),
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        base = {'id': 'chatcmpl-fake', 'created': int(time.time()), 'model': payload.get('model', 'fake')}
+        words = usage['completion_tokens']
+
+        if not payload.get('stream'):
+            time.sleep(words / self.tokens_per_second)
+            self._send_json(request, 200, {
+                **base, 'object': 'chat.completion',
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': _words(words)}}],
+                'usage': usage,
+            })
+            return
+
+        request.send_response(200)
+        request.send_header('Content-Type', 'text/event-stream')
+        request.send_header('Connection', 'close')
+        request.end_headers()
+        for i in range(words):
+            time.sleep(1 / self.tokens_per_second)
+            chunk = {**base, 'object': 'chat.completion.chunk',
+                     'choices': [{'index': 0, 'delta': {'content': WORDS[i % len(WORDS)] + " "}, 'finish_reason': None}]}
+            request.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        final = {**base, 'object': 'chat.completion.chunk',
+                 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                 'x_groq': {'id': 'req-fake', 'usage': usage}}
+        request.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+        request.wfile.flush()
+        request.close_connection = True
+
+    def _transcription(self, request: BaseHTTPRequestHandler, upload_bytes: int):
+        duration = upload_bytes * 8 / UPLOAD_BITS_PER_SECOND
+        segments = []
+        start = 0.0
+        while start < duration:
+            end = min(start + WHISPER_SEGMENT_SECONDS, duration)
+            segments.append({'id': len(segments), 'start': start, 'end': end, 'text': " " + _words(12, len(segments))})
+            start = end
+        time.sleep(duration / self.whisper_speed)
+        self._send_json(request, 200, {
+            'text': "".join(s['text'] for s in segments).strip(),
+            'duration': duration,
+            'language': 'english',
+            'segments': segments,
+        })
+
+    @staticmethod
+    def _send_json(request: BaseHTTPRequestHandler, status: int, payload: Dict[str, Any],
+                   headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(data)
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from cache import CACHE_DIR, ThreadLocalConnection
+from utils import VideoUtils
+
+# Analysis jobs running at once per process, and how long finished jobs stay pollable
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_RETENTION_SECONDS = 600
+
+# Job status shared by API replicas. Owners refresh their active jobs every JOB_HEARTBEAT_SECONDS,
+# one not refreshed for JOB_STALE_SECONDS belongs to a dead replica and can be taken over.
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join(CACHE_DIR, "jobs.db"))
+JOB_HEARTBEAT_SECONDS = 15
+JOB_STALE_SECONDS = 60
+
+STAGES = ['metadata', 'transcript']
+
+
+class Job:
+    """One video analysis, shared by every session that asked for the same video."""
+
+    def __init__(self, video_id: str, url: str):
+        self.video_id = video_id
+        self.url = url
+        self.status = 'queued'  # queued -> running -> done | failed
+        self.stages: Dict[str, str] = {stage: 'pending' for stage in STAGES}
+        self.result: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('queued', 'running')
+
+    def progress(self) -> float:
+        return sum(state == 'done' for state in self.stages.values()) / len(self.stages)
+
+
+class JobStore:
+    """
+    Job status in SQLite next to the cache, so any API replica sharing the cache
+    directory can report on any job, and only one replica runs each video.
+    """
+
+    def __init__(self, path: str = JOB_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # synchronous stays at the default FULL, status writes are small
+        self._conn = ThreadLocalConnection(self.path, ("journal_mode=WAL", "busy_timeout=30000"))
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                video_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stages TEXT NOT NULL,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                finished REAL
+            )
+        """)
+
+    def claim(self, job: Job, owner: str) -> bool:
+        """
+        Records `job` as run by `owner`. False if the video already has a live job
+        elsewhere (or one that finished within JOB_RETENTION_SECONDS).
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT status, updated, finished FROM jobs WHERE video_id = ?",
+                               (job.video_id,)).fetchone()
+            if row:
+                status, updated, finished = row
+                if status in ('queued', 'running') and now - updated < JOB_STALE_SECONDS:
+                    conn.execute("COMMIT")
+                    return False
+                if status == 'done' and finished and now - finished < JOB_RETENTION_SECONDS:
+                    conn.execute("COMMIT")
+                    return False
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (video_id, url, owner, status, stages, error, created, updated, finished) "
+                "VALUES (?, ?, ?, ?, ?, NULL, ?, ?, NULL)",
+                (job.video_id, job.url, owner, job.status, json.dumps(job.stages), now, now)
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def save(self, job: Job, owner: str):
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, stages = ?, error = ?, updated = ?, finished = ? "
+            "WHERE video_id = ? AND owner = ?",
+            (job.status, json.dumps(job.stages), job.error, time.time(), job.finished, job.video_id, owner)
+        )
+
+    def heartbeat(self, video_ids: List[str], owner: str):
+        if video_ids:
+            self._conn().execute(
+                f"UPDATE jobs SET updated = ? WHERE owner = ? AND video_id IN ({','.join('?' * len(video_ids))})",
+                (time.time(), owner, *video_ids)
+            )
+
+    def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """{'video_id', 'status', 'stages', 'error', ...} as last saved, or None."""
+        row = self._conn().execute(
+            "SELECT video_id, url, owner, status, stages, error, created, updated, finished FROM jobs WHERE video_id = ?",
+            (video_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ('video_id', 'url', 'owner', 'status', 'stages', 'error', 'created', 'updated', 'finished')
+        result = dict(zip(keys, row))
+        result['stages'] = json.loads(result['stages'])
+        if result['status'] in ('queued', 'running') and time.time() - result['updated'] > JOB_STALE_SECONDS:
+            # The replica running it died, the next submit starts it again
+            result['status'] = 'stalled'
+        return result
+
+
+class JobManager:
+    """
+    Runs video analysis on a shared background pool, outside the Streamlit script thread.
+    Requests for a video that already has an active (or just finished) job are
+    coalesced onto it, so the download and transcription happen once.
+    With a JobStore, that also holds across processes: status goes to the store
+    and a video already running in another replica is not started again.
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, store: Optional[JobStore] = None):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+        # Metadata lookups run beside the transcript stage, on their own threads so they never queue behind jobs
+        self._metadata_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="metadata")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.store = store
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        if store:
+            threading.Thread(target=self._heartbeat, daemon=True, name="job-heartbeat").start()
+
+    def submit(self, url: str) -> Optional[Job]:
+        """The video's job, started if needed. None if it runs in another process (see `store`)."""
+        video_id = VideoUtils.extract_video_id(url)
+        if not video_id:
+            raise ValueError("Invalid YouTube URL")
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(video_id)
+            if job and job.status != 'failed':
+                return job
+            job = Job(video_id, url)
+            if self.store and not self.store.claim(job, self.owner):
+                return None
+            self._jobs[video_id] = job
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, video_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(video_id)
+
+    def _prune(self):
+        now = time.time()
+        for video_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished > JOB_RETENTION_SECONDS:
+                del self._jobs[video_id]
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            with self._lock:
+                active = [job.video_id for job in self._jobs.values() if job.active]
+            try:
+                self.store.heartbeat(active, self.owner)
+            except Exception as e:
+                print(f"Job heartbeat failed: {e}")
+
+    def _save(self, job: Job):
+        if self.store:
+            try:
+                self.store.save(job, self.owner)
+            except Exception as e:
+                print(f"Error saving job {job.video_id}: {e}")
+
+    def _stage(self, job: Job, stage: str, run: Callable[[], Any]):
+        job.stages[stage] = 'running'
+        self._save(job)
+        try:
+            job.result[stage] = run()
+            job.stages[stage] = 'done'
+        except Exception:
+            job.stages[stage] = 'failed'
+            raise
+        finally:
+            self._save(job)
+
+    def _run(self, job: Job):
+        job.status = 'running'
+        try:
+            # Captions don't depend on the metadata, so both requests go out at once. Without
+            # captions, the Whisper download reuses the metadata's yt-dlp extraction.
+            metadata = self._metadata_pool.submit(
+                self._stage, job, 'metadata', lambda: VideoUtils.get_video_metadata(job.url))
+            self._stage(job, 'transcript', lambda: VideoUtils.get_transcript(job.video_id))
+            metadata.result()
+            job.status = 'done'
+        except Exception as e:
+            print(f"Analysis of {job.video_id} failed: {e}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished = time.time()
+            self._save(job)
@@ -0,0 +1,282 @@
+"""
+Full-text search across every transcript the app has processed.
+
+    python library.py "order blocks"
+    python library.py --backfill
+
+Transcripts are split into passages of ~PASSAGE_CHARS with the start time of
+each, stored in `.cache/library.db` and indexed with SQLite FTS5 (porter
+stemming). Unlike the transcript cache, the library is never evicted. Adding a
+video again only rewrites its passages when the transcript changed.
+"""
+import os
+import re
+import sys
+import json
+import time
+import bisect
+import hashlib
+import argparse
+import threading
+from typing import Any, Dict, List, Optional
+
+from cache import CACHE_DIR, ThreadLocalConnection, get_cache
+from transcript import Transcript, format_timestamp
+
+LIBRARY_PATH = os.getenv("LIBRARY_PATH", os.path.join(CACHE_DIR, "library.db"))
+PASSAGE_CHARS = 400
+SNIPPET_TOKENS = 16
+MATCHES_PER_VIDEO = 3
+# bm25() scores every matching passage before LIMIT applies, which for words found in most
+# passages grows with the library. Only this many of the newest matches are ranked.
+RANK_CANDIDATES = int(os.getenv("LIBRARY_RANK_CANDIDATES", "5000"))
+
+# Rowid of the RANK_CANDIDATES-th newest match. FTS5 walks its index in rowid order, so this
+# stops there instead of visiting every match.
+CANDIDATES_SQL = """
+    SELECT rowid FROM passages_fts WHERE passages_fts MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?
+"""
+# Ranked by BM25 in SQLite. FTS5 applies the rowid bound while scanning, so only candidates are scored.
+SEARCH_SQL = f"""
+    SELECT p.video_id, p.start, snippet(passages_fts, 0, '**', '**', '…', {SNIPPET_TOKENS}),
+           bm25(passages_fts) AS score, v.title, v.channel, p.text, p.segments
+    FROM passages_fts
+    JOIN passages p ON p.id = passages_fts.rowid
+    LEFT JOIN videos v ON v.video_id = p.video_id
+    WHERE passages_fts MATCH ? AND passages_fts.rowid >= ?
+    ORDER BY score
+    LIMIT ?
+"""
+
+# Question words that would otherwise have to appear in the transcript ("which videos mention ...")
+STOPWORDS = {
+    'a', 'an', 'the', 'and', 'or', 'of', 'to', 'in', 'on', 'is', 'are', 'was', 'do', 'does', 'did',
+    'what', 'which', 'who', 'where', 'when', 'how', 'why', 'about', 'video', 'videos', 'mention',
+    'mentions', 'mentioned', 'talk', 'talks', 'say', 'says', 'said', 'any', 'all',
+}
+TERM_RE = re.compile(r'"([^"]+)"|(\S+)')
+WORD_RE = re.compile(r"\w+")
+HIGHLIGHT_RE = re.compile(r"\*\*(.+?)\*\*")
+
+
+def fts_query(text: str, operator: str = "AND") -> str:
+    """
+    Turns user input into an FTS5 query: quoted phrases are kept, every other word
+    is quoted on its own (so FTS5 syntax characters can't break the query) and
+    question words are dropped. Empty if nothing searchable is left.
+    """
+    terms = []
+    for phrase, word in TERM_RE.findall(text):
+        words = WORD_RE.findall((phrase or word).lower())
+        if not phrase:
+            words = [w for w in words if w not in STOPWORDS]
+        if words:
+            terms.append('"' + " ".join(words) + '"')
+    return f" {operator} ".join(terms)
+
+
+def match_time(snippet: str, text: str, segments: Optional[str], start: float) -> float:
+    """Start of the segment holding the snippet's first highlighted word, else of the passage."""
+    word = HIGHLIGHT_RE.search(snippet)
+    position = re.search(r"\b" + re.escape(word.group(1)) + r"\b", text) if word and segments else None
+    if position is None:
+        return start
+    segments = json.loads(segments)
+    i = bisect.bisect_right([offset for offset, _ in segments], position.start()) - 1
+    return segments[max(i, 0)][1]
+
+
+class Library:
+    """SQLite FTS5 index of transcript passages, shared by every session and process."""
+
+    def __init__(self, path: str = LIBRARY_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._conn = ThreadLocalConnection(self.path)
+        self._init_schema()
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                title TEXT,
+                channel TEXT,
+                digest TEXT,
+                passages INTEGER NOT NULL DEFAULT 0,
+                indexed_at REAL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS passages (
+                id INTEGER PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                start REAL NOT NULL,
+                text TEXT NOT NULL,
+                -- [[char offset, start time], ...] of the segments in the passage
+                segments TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS passages_video ON passages (video_id)")
+        # External-content FTS table, kept in sync with passages by the triggers below
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS passages_fts USING fts5(
+                text, content='passages', content_rowid='id', tokenize='porter unicode61'
+            )
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS passages_insert AFTER INSERT ON passages BEGIN
+                INSERT INTO passages_fts (rowid, text) VALUES (new.id, new.text);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS passages_delete AFTER DELETE ON passages BEGIN
+                INSERT INTO passages_fts (passages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            END
+        """)
+
+    def set_metadata(self, video_id: str, metadata: Dict[str, str]):
+        """Records the title and channel shown with search results."""
+        self._conn().execute(
+            "INSERT INTO videos (video_id, title, channel) VALUES (?, ?, ?) "
+            "ON CONFLICT(video_id) DO UPDATE SET title = excluded.title, channel = excluded.channel",
+            (video_id, metadata.get('title'), metadata.get('channel'))
+        )
+
+    def add(self, video_id: str, transcript: Transcript) -> bool:
+        """Indexes a video's transcript, replacing an older version. False if it was already indexed."""
+        text = transcript.text
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        conn = self._conn()
+        row = conn.execute("SELECT digest FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+        if row and row[0] == digest:
+            return False
+
+        if len(transcript) > 1:
+            passages = []
+            for passage in transcript.passages(PASSAGE_CHARS):
+                segments = [[int(offset), round(float(start), 2)]
+                            for offset, start in zip(passage.offsets[:-1] - passage.offsets[0], passage.starts)]
+                passages.append((float(passage.starts[0]), passage.text, json.dumps(segments)))
+        else:
+            # Plain text without timing: word windows, all at 0:00
+            words = text.split()
+            size = max(1, PASSAGE_CHARS // 6)
+            passages = [(0.0, " ".join(words[i:i + size]), None) for i in range(0, len(words), size)]
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM passages WHERE video_id = ?", (video_id,))
+            conn.executemany(
+                "INSERT INTO passages (video_id, start, text, segments) VALUES (?, ?, ?, ?)",
+                ((video_id, start, passage, segments) for start, passage, segments in passages)
+            )
+            conn.execute(
+                "INSERT INTO videos (video_id, digest, passages, indexed_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(video_id) DO UPDATE SET digest = excluded.digest, passages = excluded.passages, "
+                "indexed_at = excluded.indexed_at",
+                (video_id, digest, len(passages), time.time())
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def _passages(self, match: str, limit: int) -> List[tuple]:
+        """The `limit` best ranked passages for an FTS5 query, among its RANK_CANDIDATES newest matches."""
+        conn = self._conn()
+        cutoff = conn.execute(CANDIDATES_SQL, (match, RANK_CANDIDATES - 1)).fetchone()
+        return conn.execute(SEARCH_SQL, (match, cutoff[0] if cutoff else 0, limit)).fetchall()
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Videos matching `query`, best first, each with its best matching passages as
+        {'start', 'snippet'} (matched words in **bold**). All words must match; if no
+        passage has all of them, passages with any of them are ranked instead. Words
+        found in most passages only rank the newest RANK_CANDIDATES matches.
+        """
+        rows: List[tuple] = []
+        for operator in ("AND", "OR"):
+            match = fts_query(query, operator)
+            if not match:
+                return []
+            rows = self._passages(match, limit * MATCHES_PER_VIDEO * 4)
+            if rows or " AND " not in match:
+                break
+
+        results: Dict[str, Dict[str, Any]] = {}
+        for video_id, start, snippet, rank, title, channel, text, segments in rows:
+            result = results.get(video_id)
+            if result is None:
+                if len(results) == limit:
+                    continue
+                # FTS5's bm25() is negative, lower is better
+                result = results[video_id] = {'video_id': video_id, 'title': title, 'channel': channel,
+                                              'score': -rank, 'matches': []}
+            if len(result['matches']) < MATCHES_PER_VIDEO:
+                result['matches'].append({'start': match_time(snippet, text, segments, start), 'snippet': snippet})
+        return list(results.values())
+
+    def stats(self) -> Dict[str, int]:
+        videos, passages = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(passages), 0) FROM videos WHERE digest IS NOT NULL"
+        ).fetchone()
+        return {'videos': videos, 'passages': passages}
+
+    def optimize(self):
+        """Merges the FTS index segments, worth running after a large backfill."""
+        self._conn().execute("INSERT INTO passages_fts (passages_fts) VALUES ('optimize')")
+
+
+_library: Optional[Library] = None
+_library_lock = threading.Lock()
+
+
+def get_library() -> Library:
+    """Returns the process-wide library instance."""
+    global _library
+    with _library_lock:
+        if _library is None:
+            _library = Library()
+        return _library
+
+
+def backfill() -> int:
+    """Indexes every transcript and metadata entry already in the transcript cache."""
+    cache, library = get_cache(), get_library()
+    added = 0
+    for video_id in cache.video_ids('metadata'):
+        metadata = cache.get_metadata(video_id)
+        if metadata:
+            library.set_metadata(video_id, metadata)
+    for video_id in cache.video_ids('transcript'):
+        cached = cache.get_transcript(video_id)
+        if cached and library.add(video_id, cached['transcript']):
+            added += 1
+    library.optimize()
+    return added
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Search the transcripts of every processed video.")
+    parser.add_argument('query', nargs='?', help="Words or \"quoted phrases\" to look for")
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--backfill', action='store_true', help="Index the transcripts already in the cache")
+    args = parser.parse_args(argv)
+
+    if args.backfill:
+        print(f"Indexed {backfill()} transcript(s).")
+    if args.query:
+        start = time.time()
+        results = get_library().search(args.query, args.limit)
+        print(f"{len(results)} video(s) in {(time.time() - start) * 1000:.1f}ms")
+        for r in results:
+            print(f"\n{r['title'] or r['video_id']} ({r['video_id']}, score {r['score']:.2f})")
+            for m in r['matches']:
+                print(f"  {format_timestamp(m['start']):>8}  {m['snippet']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Load test of the HTTP API (api.py).
+
+    python loadtest.py --concurrency 50 --duration 20
+    python loadtest.py --url http://localhost:8080 --video-ids benchShort1 benchMedium
+
+Without --url the API runs in this process against a fresh cache directory
+and a local FakeGroqServer, with synthetic transcripts already cached, so the
+numbers measure the service and not YouTube or Groq. `--concurrency` clients
+then loop over a mix of requests (status, transcript, summary, chat, search,
+PDF) for `--duration` seconds, and requests/s with p50/p95/p99 latency per
+endpoint are printed (and written to --output as JSON).
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import aiohttp
+
+from benchmark_utils import caption_segments
+from fake_groq import FakeGroqServer
+
+# endpoint -> relative weight in the request mix
+MIX = {
+    'status': 30,
+    'transcript': 15,
+    'summary': 20,
+    'chat': 15,
+    'search': 15,
+    'pdf': 5,
+}
+QUESTIONS = ["What is the main point?", "Which example is used?", "What does the speaker say about questions?",
+             "How does the system work?", "Why does each step matter?"]
+SEARCHES = ["example", "system works", '"answers questions"', "which videos mention the audience?"]
+
+
+def seed(count: int, minutes: float) -> List[str]:
+    """Caches `count` synthetic videos as if they had been analyzed, returns their IDs."""
+    from cache import get_cache
+    from library import get_library
+    from transcript import Transcript
+
+    cache, library = get_cache(), get_library()
+    video_ids = []
+    for index in range(count):
+        video_id = f"load{index:07d}"
+        metadata = {'title': f"Load test video {index}", 'channel': "Load test", 'duration': int(minutes * 60),
+                    'thumbnail': ''}
+        # Shifted per video so the transcripts differ
+        transcript = Transcript.from_segments(caption_segments(minutes * 60, offset=index))
+        cache.put_metadata(video_id, metadata)
+        cache.put_transcript(video_id, transcript, 'captions')
+        library.set_metadata(video_id, metadata)
+        library.add(video_id, transcript)
+        video_ids.append(video_id)
+    return video_ids
+
+
+async def request(session: aiohttp.ClientSession, base: str, endpoint: str, video_id: str, client: int):
+    headers = {'X-Session-Id': f"load-{client}"}
+    if endpoint == 'status':
+        call = session.get(f"{base}/videos/{video_id}", headers=headers)
+    elif endpoint == 'transcript':
+        call = session.get(f"{base}/videos/{video_id}/transcript", headers=headers)
+    elif endpoint == 'summary':
+        call = session.get(f"{base}/videos/{video_id}/summary", headers=headers)
+    elif endpoint == 'chat':
+        call = session.post(f"{base}/videos/{video_id}/chat", headers=headers,
+                            json={'question': random.choice(QUESTIONS), 'history': []})
+    elif endpoint == 'search':
+        call = session.get(f"{base}/search", params={'q': random.choice(SEARCHES)}, headers=headers)
+    else:
+        call = session.get(f"{base}/videos/{video_id}/pdf", headers=headers)
+    async with call as response:
+        await response.read()
+        return response.status
+
+
+async def client_loop(session: aiohttp.ClientSession, base: str, video_ids: List[str], client: int,
+                      deadline: float, results: Dict[str, Dict[str, list]]):
+    endpoints, weights = list(MIX), list(MIX.values())
+    rng = random.Random(client)
+    while time.perf_counter() < deadline:
+        endpoint = rng.choices(endpoints, weights)[0]
+        start = time.perf_counter()
+        try:
+            ok = await request(session, base, endpoint, rng.choice(video_ids), client) == 200
+        except aiohttp.ClientError:
+            ok = False
+        result = results.setdefault(endpoint, {'seconds': [], 'errors': []})
+        result['seconds' if ok else 'errors'].append(time.perf_counter() - start)
+
+
+async def run(base: str, video_ids: List[str], concurrency: int, duration: float) -> Dict[str, Any]:
+    results: Dict[str, Dict[str, list]] = {}
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        # Warm-up: one summary per video, so the mix measures the service the way replicas usually see it
+        await asyncio.gather(*(request(session, base, 'summary', video_id, 0) for video_id in video_ids))
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(session, base, video_ids, client, start + duration, results)
+                               for client in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    report: Dict[str, Any] = {'concurrency': concurrency, 'seconds': round(elapsed, 2), 'endpoints': {}}
+    everything = []
+    for endpoint in MIX:
+        result = results.get(endpoint)
+        if not result:
+            continue
+        ms = np.array(result['seconds'] or [0.0]) * 1000
+        everything.extend(result['seconds'])
+        report['endpoints'][endpoint] = {
+            'requests': len(result['seconds']), 'errors': len(result['errors']),
+            'rps': round(len(result['seconds']) / elapsed, 1),
+            'p50_ms': round(float(np.percentile(ms, 50)), 1), 'p95_ms': round(float(np.percentile(ms, 95)), 1),
+            'p99_ms': round(float(np.percentile(ms, 99)), 1),
+        }
+    ms = np.array(everything or [0.0]) * 1000
+    report['total'] = {
+        'requests': len(everything), 'errors': sum(len(r['errors']) for r in results.values()),
+        'rps': round(len(everything) / elapsed, 1), 'p50_ms': round(float(np.percentile(ms, 50)), 1),
+        'p95_ms': round(float(np.percentile(ms, 95)), 1), 'p99_ms': round(float(np.percentile(ms, 99)), 1),
+    }
+    return report
+
+
+async def run_local(args: argparse.Namespace) -> Dict[str, Any]:
+    # Imported late: these read their configuration from the environment set up in main()
+    from aiohttp import web
+    from api import create_app
+
+    video_ids = await asyncio.get_running_loop().run_in_executor(None, seed, args.videos, args.minutes)
+    runner = web.AppRunner(create_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        return await run(f"http://127.0.0.1:{port}", video_ids, args.concurrency, args.duration)
+    finally:
+        await runner.cleanup()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test of the HTTP API.")
+    parser.add_argument('--url', help="Running API to test; default: start one in this process")
+    parser.add_argument('--video-ids', nargs='+', help="Already analyzed videos to use with --url")
+    parser.add_argument('--videos', type=int, default=20, help="Synthetic videos to cache (local run)")
+    parser.add_argument('--minutes', type=float, default=30, help="Length of each synthetic video")
+    parser.add_argument('--concurrency', type=int, default=50, help="Concurrent clients")
+    parser.add_argument('--duration', type=float, default=20, help="Seconds to run")
+    parser.add_argument('--latency', type=float, default=0.05, help="Fake Groq latency per request (s)")
+    parser.add_argument('--tokens-per-second', type=float, default=400.0)
+    parser.add_argument('--output', help="JSON file the report is written to")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        if not args.video_ids:
+            parser.error("--url needs --video-ids")
+        report = asyncio.run(run(args.url.rstrip('/'), args.video_ids, args.concurrency, args.duration))
+    else:
+        server = FakeGroqServer(latency=args.latency, tokens_per_second=args.tokens_per_second)
+        with server, tempfile.TemporaryDirectory() as workdir:
+            os.environ['VIDEO_CACHE_DIR'] = os.path.join(workdir, 'cache')
+            os.environ['GROQ_BASE_URL'] = server.url
+            os.environ['GROQ_API_KEY'] = 'loadtest'
+            # The fake server is the only limit, so the numbers measure the service's own overhead
+            for name in ('GROQ_TPM_LIMIT', 'GROQ_RPM_LIMIT'):
+                os.environ[name] = '1000000000'
+            report = asyncio.run(run_local(args))
+            report['groq_requests'] = dict(server.stats)
+
+    print(f"{'endpoint':<12}{'requests':>9}{'errors':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for endpoint, r in list(report['endpoints'].items()) + [('total', report['total'])]:
+        print(f"{endpoint:<12}{r['requests']:>9}{r['errors']:>8}{r['rps']:>8.1f}"
+              f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,16 @@
 import streamlit as st
 import time
-from utils import VideoUtils, AIEngine, PDFGenerator
+import uuid
+import tempfile
+from utils import VideoUtils, AIEngine, PDFGenerator, warm_up
+from chat_context import ChatMemory
+from library import get_library
+from transcript import format_timestamp
+from cache import get_cache
+from rate_limit import peek_scheduler
+from jobs import JobManager
+from normalize import token_reduction
+import tracing
 
 # Page Config
 st.set_page_config(
@@ -11,16 +21,61 @@ st.set_page_config(
 )
 
 # Initialize Session State
+if 'session_id' not in st.session_state:
+    # Identifies this browser session to the shared Groq request scheduler
+    st.session_state.session_id = uuid.uuid4().hex
 if 'transcript' not in st.session_state:
     st.session_state.transcript = ""
 if 'summary' not in st.session_state:
     st.session_state.summary = ""
+if 'summary_stats' not in st.session_state:
+    st.session_state.summary_stats = {}
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
+if 'chat_memory' not in st.session_state:
+    # Running summary of the chat turns too old to send verbatim
+    st.session_state.chat_memory = ChatMemory()
+if 'video_id' not in st.session_state:
+    st.session_state.video_id = None
 if 'metadata' not in st.session_state:
     st.session_state.metadata = None
-if 'processing' not in st.session_state:
-    st.session_state.processing = False
+if 'job_video_id' not in st.session_state:
+    # Video whose background analysis this session is waiting for
+    st.session_state.job_video_id = None
+if 'job_error' not in st.session_state:
+    st.session_state.job_error = None
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    # One executor per server process, shared by all sessions and kept across reruns
+    return JobManager()
+
+@st.cache_data(max_entries=32)
+def transcript_tokens(text: str) -> dict:
+    # Counting is slower than the cleanup itself, do it once per transcript
+    return token_reduction(text)
+
+@st.cache_resource
+def warm_clients():
+    # Once per server process: yt-dlp, groq and the shared Groq client load in the background
+    # while the first page renders, instead of on the first click
+    return warm_up()
+
+warm_clients()
+
+@st.cache_resource
+def start_metrics():
+    # Prometheus endpoint for the pipeline spans, only when METRICS_PORT is set
+    return tracing.start_metrics_server()
+
+if tracing.METRICS_PORT:
+    start_metrics()
+
+STAGE_LABELS = {
+    'metadata': "Fetching metadata",
+    'transcript': "Extracting transcript (this may take a moment)",
+}
+STAGE_ICONS = {'pending': "⏳", 'running': "🔄", 'done': "✅", 'failed': "❌"}
 
 # Custom CSS for aesthetics
 st.markdown("""
@@ -59,6 +114,7 @@ with col2:
 with st.sidebar:
     st.header("About")
     st.info("This application uses Llama-3 via Groq to analyze YouTube videos.")
+    view = st.radio("View", ["Analyze a video", "Search the library"], label_visibility="collapsed")
     
     if st.session_state.metadata:
         st.divider()
@@ -68,48 +124,118 @@ with st.sidebar:
         st.markdown(f"**{st.session_state.metadata['title']}**")
         st.markdown(f"*{st.session_state.metadata['channel']}*")
 
+    with st.expander("Cache"):
+        cache_stats = get_cache().stats()
+        st.caption(
+            f"Transcripts: {cache_stats.get('transcript_hits', 0)} hits / "
+            f"{cache_stats.get('transcript_misses', 0)} misses"
+        )
+        st.caption(
+            f"AI responses: {cache_stats.get('response_hits', 0)} hits / "
+            f"{cache_stats.get('response_misses', 0)} misses ({cache_stats['response_hit_rate']:.0%})"
+        )
+        st.caption(f"{cache_stats['entries']} entries, {cache_stats['bytes'] / (1024 * 1024):.1f} MB")
+
+    with st.expander("Groq queue"):
+        # Peeked, not created: building the client would hold up the sidebar on every rerun until it exists
+        scheduler = peek_scheduler()
+        if scheduler is None:
+            st.caption("No requests yet")
+        else:
+            queue_stats = scheduler.stats()
+            st.caption(f"Waiting: {sum(queue_stats['queue_depth'].values())} request(s)")
+            st.caption(
+                f"{queue_stats['requests']} requests, avg wait {queue_stats['avg_wait_seconds']:.1f}s, "
+                f"max {queue_stats['max_wait_seconds']:.1f}s, {queue_stats['rate_limited']} rate limited"
+            )
+
+    if tracing.ENABLED:
+        with st.expander("Pipeline trace"):
+            summary_rows = tracing.stage_summary()
+            if summary_rows:
+                st.dataframe(summary_rows, hide_index=True, use_container_width=True)
+                st.caption("Recent spans")
+                st.dataframe(tracing.recent_spans(30), hide_index=True, use_container_width=True)
+            else:
+                st.caption("No spans recorded yet.")
+
+def library_search():
+    """Full-text search over every transcript processed so far, on this server."""
+    library = get_library()
+    stats = library.stats()
+    st.subheader("Search the Library")
+    st.caption(f"{stats['videos']} videos, {stats['passages']:,} passages indexed")
+    query = st.text_input("Search", placeholder='e.g. order blocks, or "exact phrase"')
+    if not query:
+        return
+    start = time.time()
+    results = library.search(query)
+    st.caption(f"{len(results)} video(s) in {(time.time() - start) * 1000:.0f} ms")
+    for result in results:
+        with st.container(border=True):
+            st.markdown(f"**{result['title'] or result['video_id']}**"
+                        + (f" · *{result['channel']}*" if result['channel'] else ""))
+            for match in result['matches']:
+                link = f"https://www.youtube.com/watch?v={result['video_id']}&t={int(match['start'])}s"
+                st.markdown(f"[{format_timestamp(match['start'])}]({link}) {match['snippet']}")
+
+if view == "Search the library":
+    library_search()
+    st.stop()
+
 # Main Input
 url = st.text_input("YouTube Video URL", placeholder="https://youtube.com/watch?v=...")
 
 if url:
-    process_button = st.button("Analyze Video", type="primary", disabled=st.session_state.processing)
+    process_button = st.button("Analyze Video", type="primary", disabled=st.session_state.job_video_id is not None)
     
     if process_button:
-        st.session_state.processing = True
-        video_id = VideoUtils.extract_video_id(url)
-        
-        if not video_id:
-            st.error("Invalid YouTube URL")
-            st.session_state.processing = False
+        try:
+            # Runs in the background; another session analyzing the same video shares the job
+            job = get_job_manager().submit(url)
+        except ValueError as e:
+            st.error(str(e))
         else:
-            try:
-                # Reset State
-                st.session_state.transcript = ""
-                st.session_state.summary = ""
-                st.session_state.chat_history = []
-                st.session_state.metadata = None
-                
-                with st.status("Processing video...", expanded=True) as status:
-                    # 1. Metadata
-                    st.write("Fetching metadata...")
-                    metadata = VideoUtils.get_video_metadata(url)
-                    st.session_state.metadata = metadata
-                    st.write(f"Found: {metadata['title']}")
-                    
-                    # 2. Transcript
-                    st.write("Extracting transcript (this may take a moment)...")
-                    transcript = VideoUtils.get_transcript(video_id)
-                    st.session_state.transcript = transcript
-                    st.write("Transcript extracted!")
-                    
-                    status.update(label="Analysis Complete!", state="complete", expanded=False)
-                
-                st.session_state.processing = False
-                st.rerun()
-
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
-                st.session_state.processing = False
+            # Reset State
+            st.session_state.transcript = ""
+            st.session_state.summary = ""
+            st.session_state.summary_stats = {}
+            st.session_state.chat_history = []
+            st.session_state.chat_memory = ChatMemory()
+            st.session_state.metadata = None
+            st.session_state.video_id = job.video_id
+            st.session_state.job_video_id = job.video_id
+            st.session_state.job_error = None
+            st.rerun()
+
+@st.fragment(run_every=1)
+def job_progress():
+    """Polls the background job and hands its results to the session once it finishes."""
+    job = get_job_manager().get(st.session_state.job_video_id)
+    if job is None:
+        st.session_state.job_video_id = None
+        st.rerun()
+
+    with st.status("Processing video...", expanded=True):
+        for stage, state in job.stages.items():
+            st.write(f"{STAGE_ICONS[state]} {STAGE_LABELS[stage]}")
+            if stage == 'metadata' and state == 'done':
+                st.write(f"Found: {job.result['metadata']['title']}")
+
+    if not job.active:
+        if job.status == 'done':
+            st.session_state.metadata = job.result['metadata']
+            st.session_state.transcript = job.result['transcript']
+        else:
+            st.session_state.job_error = job.error
+        st.session_state.job_video_id = None
+        st.rerun()
+
+if st.session_state.job_video_id:
+    job_progress()
+
+if st.session_state.job_error:
+    st.error(f"An error occurred: {st.session_state.job_error}")
 
 # Content Area
 if st.session_state.transcript:
@@ -118,6 +244,13 @@ if st.session_state.transcript:
     with tab1:
         st.subheader("Full Transcript")
         st.text_area("Content", value=st.session_state.transcript, height=400)
+        tokens = transcript_tokens(st.session_state.transcript)
+        if tokens['tokens'] < tokens['raw_tokens']:
+            st.caption(
+                f"~{tokens['tokens']:,} tokens go to the AI after removing caption repeats, "
+                f"non-speech tags and filler words ({tokens['reduction']:.0%} fewer than the "
+                f"{tokens['raw_tokens']:,} shown here)"
+            )
         st.download_button(
             "Download Transcript (.txt)", 
             data=st.session_state.transcript, 
@@ -130,23 +263,45 @@ if st.session_state.transcript:
             if st.button("Generate Summary"):
                 with st.spinner("Generating summary with Llama-3..."):
                     try:
-                        ai = AIEngine()
-                        summary = ai.summarize(st.session_state.transcript)
+                        ai = AIEngine(session=st.session_state.session_id)
+                        # Render tokens as they arrive, write_stream returns the full text
+                        summary = st.write_stream(ai.summarize_stream(st.session_state.transcript))
                         st.session_state.summary = summary
+                        st.session_state.summary_stats = ai.last_stats
                         st.rerun()
                     except Exception as e:
                         st.error(f"Summarization failed: {e}")
         else:
             st.markdown(st.session_state.summary)
+            stats = st.session_state.summary_stats
+            if stats:
+                st.caption(
+                    f"{stats['chunks']} chunk(s), {stats['total_tokens']:,} tokens, "
+                    f"{stats['seconds']}s ({stats['mode'].replace('_', '-')})"
+                    + (f", first token after {stats['ttft_seconds']}s" if 'ttft_seconds' in stats else "")
+                    + (", from cache" if stats.get('cached') else "")
+                )
             
             # PDF Export
             if st.button("Export to PDF"):
                 try:
-                    pdf_bytes = PDFGenerator.generate(
-                        st.session_state.transcript, 
-                        st.session_state.summary, 
-                        st.session_state.metadata
-                    )
+                    # The cached segments add timestamps, the plain text is enough otherwise
+                    transcript = st.session_state.transcript
+                    if st.session_state.video_id:
+                        try:
+                            transcript = VideoUtils.get_transcript_segments(st.session_state.video_id)
+                        except Exception:
+                            pass
+                    with tempfile.TemporaryFile() as pdf_file:
+                        PDFGenerator.generate(
+                            transcript,
+                            st.session_state.summary, 
+                            st.session_state.metadata,
+                            out=pdf_file
+                        )
+                        pdf_file.seek(0)
+                        # download_button takes bytes or a BytesIO, not a file object
+                        pdf_bytes = pdf_file.read()
                     st.download_button(
                         label="Download PDF Report",
                         data=pdf_bytes,
@@ -173,18 +328,18 @@ if st.session_state.transcript:
 
             # Generate response
             with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    try:
-                        ai = AIEngine()
-                        response = ai.chat(
-                            st.session_state.transcript, 
-                            st.session_state.chat_history[:-1], # History excluding current prompt
-                            prompt
-                        )
-                        st.markdown(response)
-                        st.session_state.chat_history.append({"role": "assistant", "content": response})
-                    except Exception as e:
-                        st.error(f"Chat failed: {e}")
+                try:
+                    ai = AIEngine(session=st.session_state.session_id)
+                    response = st.write_stream(ai.chat_stream(
+                        st.session_state.transcript, 
+                        st.session_state.chat_history[:-1], # History excluding current prompt
+                        prompt,
+                        video_id=st.session_state.video_id,
+                        memory=st.session_state.chat_memory
+                    ))
+                    st.session_state.chat_history.append({"role": "assistant", "content": response})
+                except Exception as e:
+                    st.error(f"Chat failed: {e}")
 
 else:
     # Empty state / Promo
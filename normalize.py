@@ -0,0 +1,194 @@
+"""
+Transcript cleanup before anything is sent to the LLM.
+
+    python normalize.py VIDEO_ID [VIDEO_ID ...]
+
+Auto-generated captions repeat the tail of one line at the start of the next,
+carry non-speech tags ([Music], [Applause], ♪) and keep every "um" and "uh".
+`normalize_transcript` drops all three; the raw transcript stays in the cache
+and is what the UI, the PDF and the library show. Words are compared by keys
+computed with NumPy on the UTF-8 bytes, so multi-hour transcripts take
+milliseconds.
+Disable with TRANSCRIPT_NORMALIZE=0.
+"""
+import os
+import re
+import sys
+import argparse
+import functools
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from chat_context import count_tokens
+
+ENABLED = os.getenv("TRANSCRIPT_NORMALIZE", "1").lower() in ("1", "true", "yes")
+# Comma-separated, matched as whole words ignoring case and trailing punctuation. Phrases
+# ("you know") work too but go through a much slower regex pass.
+FILLERS = [f.strip() for f in os.getenv("TRANSCRIPT_FILLERS", "um,umm,uh,uhm,uh-huh,erm,hmm,mm,mhm,ah").split(",")
+           if f.strip()]
+# Immediately repeated runs of this many words are dropped (longest first). Single words are
+# left alone, "had had" and "bye bye" are real speech.
+MIN_REPEAT_WORDS = 2
+MAX_REPEAT_WORDS = int(os.getenv("TRANSCRIPT_MAX_REPEAT_WORDS", "12"))
+
+# [Music], [Applause], [Background noise] ...; parenthesized ones are single words, see NON_SPEECH_WORDS
+BRACKET_TAG_RE = re.compile(r"\[[^\]\n]{1,40}\]")
+NON_SPEECH_WORDS = ["(music)", "(applause)", "(laughter)", "(laughs)", "(inaudible)", "(silence)", "(cheering)"]
+MUSIC_NOTES = "♪♫"
+
+# Bytes folded for word comparisons: ASCII uppercase to lowercase, whitespace (and other control
+# characters) and the punctuation left out of comparisons to 0
+_FOLD = np.arange(256, dtype=np.uint8)
+_FOLD[ord('A'):ord('Z') + 1] = _FOLD[ord('a'):ord('z') + 1]
+_FOLD[:ord(' ') + 1] = 0
+_FOLD[list(b",.!?;:\"")] = 0
+# Random 64-bit value per pair of folded bytes (previous << 8 | current), 0 when the current one is 0
+_PAIR_VALUE = np.random.default_rng(0x5EED).integers(1, 2 ** 62, size=256 * 256, dtype=np.int64)
+_PAIR_VALUE[0::256] = 0
+
+
+def _words(data: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Byte (start, end) of every whitespace-separated word in UTF-8 `data`, which must
+    end with whitespace, and a 64-bit key per word: the sum of the random values of
+    its folded byte pairs (starting from the 0 before it), so letter order counts.
+    Equal words get equal keys; different words colliding is unlikely enough for
+    comparing neighbours.
+    """
+    space = data <= ord(' ')
+    # Word starts and ends alternate among the whitespace transitions
+    changes = np.flatnonzero(space[1:] != space[:-1]) + 1
+    if len(data) and not space[0]:
+        changes = np.concatenate(([0], changes))
+    starts, ends = changes[::2], changes[1::2]
+    if not len(starts):
+        return starts, ends, np.zeros(0, dtype=np.int64)
+    # np.take: plain gathers, much faster than fancy indexing on a uint8 array
+    pairs = np.take(_FOLD, data).astype(np.uint16)
+    pairs[1:] |= pairs[:-1] << 8
+    # The first word's first pair has no previous byte, the same as one after whitespace
+    pairs[0] &= 0xFF
+    with np.errstate(over='ignore'):
+        # Sums run from each word's start to the next one's, the whitespace in between adds 0
+        keys = np.add.reduceat(np.take(_PAIR_VALUE, pairs), starts)
+    return starts, ends, keys
+
+
+def _word_keys(words: List[str]) -> np.ndarray:
+    return _words(np.frombuffer((" ".join(words) + " ").encode('utf-8'), dtype=np.uint8))[2]
+
+
+def _ranges_mask(starts: np.ndarray, ends: np.ndarray, size: int) -> np.ndarray:
+    """
+    Boolean mask of `size` that is True in the sorted, disjoint ranges [starts[i], ends[i]).
+    One repeat per range and gap, cheaper than a cumulative sum when the ranges are few.
+    """
+    bounds = np.empty(2 * len(starts), dtype=np.int64)
+    bounds[0::2], bounds[1::2] = starts, ends
+    inside = np.arange(len(bounds) + 1) % 2 == 1
+    return np.repeat(inside, np.diff(bounds, prepend=0, append=size))
+
+
+def repeated_words(keys: np.ndarray, min_words: int = MIN_REPEAT_WORDS,
+                   max_words: int = MAX_REPEAT_WORDS) -> np.ndarray:
+    """
+    Mask of words that immediately repeat the `min_words`..`max_words` words before
+    them: "so the idea is the idea is that" drops the second "the idea is". One
+    vectorized pass per run length, longest first.
+    """
+    dropped = np.zeros(len(keys), dtype=bool)
+    positions = np.arange(len(keys))
+    for n in range(max_words, min_words - 1, -1):
+        if len(keys) < 2 * n:
+            continue
+        # same: the j with word j + n equal to word j. A run of at least n of them is a repeated block.
+        same = np.flatnonzero(keys[n:] == keys[:-n])
+        if len(same) < n:
+            continue
+        breaks = np.flatnonzero(np.diff(same) != 1) + 1
+        starts = same[np.concatenate(([0], breaks))]
+        lengths = np.diff(np.concatenate(([0], breaks, [len(same)])))
+        repeated = lengths >= n
+        if not repeated.any():
+            continue
+        starts, lengths = starts[repeated], lengths[repeated]
+        # Whole copies only: "a b a b a c" loses one "a b", not the trailing "a"
+        drop = _ranges_mask(starts + n, starts + n + lengths // n * n, len(keys))
+        dropped[positions[drop]] = True
+        keys, positions = keys[~drop], positions[~drop]
+    return dropped
+
+
+_SINGLE_FILLERS = [f for f in FILLERS if " " not in f] + NON_SPEECH_WORDS
+FILLER_KEYS = _word_keys(_SINGLE_FILLERS)
+_PHRASES = [f for f in FILLERS if " " in f]
+FILLER_PHRASE_RE = re.compile(
+    r"(?<!\S)(?:" + "|".join(re.escape(f) for f in _PHRASES) + r")[,.]*(?!\S)", re.IGNORECASE
+) if _PHRASES else None
+
+
+@functools.lru_cache(maxsize=16)
+def normalize_transcript(text: str) -> str:
+    """
+    The transcript as sent to the LLM: non-speech tags, filler words and repeated
+    caption runs removed, whitespace collapsed. Cached for the last few transcripts,
+    since every summary and chat turn on a video starts from the same text.
+    """
+    if not ENABLED or not text:
+        return text
+    if "[" in text:
+        text = BRACKET_TAG_RE.sub(" ", text)
+    for note in MUSIC_NOTES:
+        text = text.replace(note, " ")
+    if FILLER_PHRASE_RE is not None:
+        text = FILLER_PHRASE_RE.sub(" ", text)
+
+    # The trailing space gives the last word a separator too
+    data = np.frombuffer((text + " ").encode('utf-8'), dtype=np.uint8)
+    starts, ends, keys = _words(data)
+    filler = np.isin(keys, FILLER_KEYS)
+    # Fillers go first, so "the um the" style stutters line up as repeats
+    dropped = filler.copy()
+    dropped[~filler] = repeated_words(keys[~filler])
+
+    # Keep the bytes of the remaining words plus the separator after each, as a single space
+    starts, ends = starts[~dropped], ends[~dropped]
+    marks = np.zeros(len(data) + 1, dtype=np.int8)
+    marks[starts] = 1
+    marks[ends + 1] -= 1
+    out = data.copy()
+    out[ends] = ord(' ')
+    return out[np.cumsum(marks[:-1], dtype=np.int8) > 0].tobytes().decode('utf-8').rstrip()
+
+
+def token_reduction(raw: str, normalized: Optional[str] = None) -> Dict[str, float]:
+    """{'raw_tokens', 'tokens', 'reduction'} for a transcript, `reduction` as a fraction of the raw tokens."""
+    if normalized is None:
+        normalized = normalize_transcript(raw)
+    raw_tokens = count_tokens(raw)
+    tokens = raw_tokens if normalized is raw else count_tokens(normalized)
+    return {'raw_tokens': raw_tokens, 'tokens': tokens,
+            'reduction': round(1 - tokens / raw_tokens, 4) if raw_tokens else 0.0}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from cache import get_cache
+
+    parser = argparse.ArgumentParser(description="Token reduction of the transcript cleanup per cached video.")
+    parser.add_argument('video_ids', nargs='+')
+    args = parser.parse_args(argv)
+
+    print(f"{'video':<14}{'raw tokens':>12}{'tokens':>10}{'saved':>8}")
+    for video_id in args.video_ids:
+        cached = get_cache().get_transcript(video_id)
+        if cached is None:
+            print(f"{video_id:<14}  not in the cache")
+            continue
+        r = token_reduction(cached['transcript'].text)
+        print(f"{video_id:<14}{r['raw_tokens']:>12,}{r['tokens']:>10,}{r['reduction']:>8.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import os
+import zlib
+from typing import BinaryIO, Dict, Optional, Tuple
+
+import fpdf
+from fpdf import FPDF
+
+from cache import CACHE_DIR
+
+# Unicode font for PDF export. DejaVu ships with most Linux distributions; set PDF_FONT_PATH
+# (and PDF_BOLD_FONT_PATH) to any other TTF. Without one, export falls back to Latin-1 Arial.
+FONT_CANDIDATES = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+]
+BOLD_FONT_CANDIDATES = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf",
+    "C:\\Windows\\Fonts\\arialbd.ttf",
+]
+
+# fpdf parses a TTF's metrics on every add_font unless they are pickled, keep those with the cache
+FONT_CACHE_DIR = os.path.join(CACHE_DIR, "fonts")
+
+_fonts: Optional[Dict[str, str]] = None
+# fpdf's font and font file entries for the Unicode font, as loaded by the first export
+_loaded_fonts: Optional[Tuple[Dict[str, dict], Dict[str, dict]]] = None
+
+
+def _find(env: str, candidates) -> Optional[str]:
+    path = os.getenv(env)
+    if path:
+        return path if os.path.exists(path) else None
+    return next((p for p in candidates if os.path.exists(p)), None)
+
+
+def unicode_fonts() -> Dict[str, str]:
+    """Style ('' / 'B') -> TTF path of the Unicode font, empty if none is installed. Looked up once."""
+    global _fonts
+    if _fonts is None:
+        regular = _find("PDF_FONT_PATH", FONT_CANDIDATES)
+        _fonts = {}
+        if regular:
+            _fonts[''] = regular
+            # Headings fall back to the regular face rather than to a font without the glyphs
+            _fonts['B'] = _find("PDF_BOLD_FONT_PATH", BOLD_FONT_CANDIDATES) or regular
+            os.makedirs(FONT_CACHE_DIR, exist_ok=True)
+            fpdf.set_global("FPDF_CACHE_MODE", 2)
+            fpdf.set_global("FPDF_CACHE_DIR", FONT_CACHE_DIR)
+    return _fonts
+
+
+class _Sink:
+    """File wrapper whose len() is the number of bytes written, which is all fpdf needs from its buffer."""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.size = 0
+
+    def write(self, s: str):
+        data = s.encode('latin-1')
+        self.stream.write(data)
+        self.size += len(data)
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class StreamingPDF(FPDF):
+    """
+    FPDF that writes to a stream as it goes instead of building the document in memory.
+
+    Each page's content is compressed and written as soon as the page is finished,
+    so memory holds one page at a time. Only what the PDF needs at the end (page
+    objects, fonts, xref) is written by close(). Page-number aliases and links are
+    not supported, the export doesn't use them.
+    """
+
+    FONT_FAMILY = 'Unicode'
+
+    def __init__(self, stream: BinaryIO, orientation='P', unit='mm', format='A4'):
+        FPDF.__init__(self, orientation, unit, format)
+        self.buffer = _Sink(stream)
+        self._contents: Dict[int, int] = {}
+        self._header_written = False
+        self.body_font = 'Arial'
+        fonts = unicode_fonts()
+        if fonts:
+            self._add_unicode_fonts(fonts)
+            self.body_font = self.FONT_FAMILY
+
+    def _add_unicode_fonts(self, fonts: Dict[str, str]):
+        """add_font for every style, reading the metrics only on the first export of the process."""
+        global _loaded_fonts
+        if _loaded_fonts is None:
+            for style, path in fonts.items():
+                self.add_font(self.FONT_FAMILY, style, path, uni=True)
+            _loaded_fonts = ({key: dict(font, subset=list(font['subset'])) for key, font in self.fonts.items()},
+                             dict(self.font_files))
+            return
+        loaded, font_files = _loaded_fonts
+        for key, font in loaded.items():
+            # The glyph widths are shared, the subset collects this document's characters
+            self.fonts[key] = dict(font, i=len(self.fonts) + 1, subset=list(font['subset']))
+        self.font_files.update(font_files)
+
+    @property
+    def unicode(self) -> bool:
+        return self.body_font == self.FONT_FAMILY
+
+    def _out(self, s):
+        if isinstance(s, bytes):
+            s = s.decode('latin-1')
+        elif not isinstance(s, str):
+            s = str(s)
+        if self.state == 2:
+            self.pages[self.page] += s + "\n"
+        else:
+            self.buffer.write(s + "\n")
+
+    def _putheader(self):
+        if not self._header_written:
+            self._header_written = True
+            FPDF._putheader(self)
+
+    def _endpage(self):
+        FPDF._endpage(self)
+        self._putheader()
+        content = self.pages[self.page].encode('latin-1')
+        if self.compress:
+            content = zlib.compress(content)
+        self._newobj()
+        self._contents[self.page] = self.n
+        self._out('<<' + ('/Filter /FlateDecode ' if self.compress else '') + '/Length ' + str(len(content)) + '>>')
+        self._putstream(content)
+        self._out('endobj')
+        self.pages[self.page] = ''
+        # fpdf appends every character drawn to the font's subset list, keep only distinct ones
+        for font in self.fonts.values():
+            if font.get('type') == 'TTF':
+                font['subset'] = list(dict.fromkeys(font['subset']))
+
+    def _putpages(self):
+        if self.def_orientation == 'P':
+            w_pt, h_pt = self.fw_pt, self.fh_pt
+        else:
+            w_pt, h_pt = self.fh_pt, self.fw_pt
+        kids = []
+        for page in range(1, self.page + 1):
+            self._newobj()
+            kids.append(self.n)
+            self._out('<</Type /Page')
+            self._out('/Parent 1 0 R')
+            self._out('/Resources 2 0 R')
+            self._out('/Contents ' + str(self._contents[page]) + ' 0 R>>')
+            self._out('endobj')
+        self.offsets[1] = len(self.buffer)
+        self._out('1 0 obj')
+        self._out('<</Type /Pages')
+        self._out('/Kids [' + ' '.join(f"{kid} 0 R" for kid in kids) + ']')
+        self._out('/Count ' + str(self.page))
+        self._out('/MediaBox [0 0 %.2f %.2f]' % (w_pt, h_pt))
+        self._out('>>')
+        self._out('endobj')
+
+    def _putTTfontwidths(self, font, maxUni):
+        # fpdf tests every code point of the font against the subset list, a set makes that O(1)
+        subset = font['subset']
+        font['subset'] = set(subset)
+        try:
+            FPDF._putTTfontwidths(self, font, maxUni)
+        finally:
+            font['subset'] = subset
+
+    def safe_text(self, value: str) -> str:
+        """Text as the current font can draw it: unchanged with the Unicode font, else Latin-1 with '?'."""
+        if self.unicode:
+            return value
+        return value.encode('latin-1', 'replace').decode('latin-1')
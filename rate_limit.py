@@ -0,0 +1,253 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Optional
+
+import tracing
+
+if TYPE_CHECKING:
+    # groq takes ~0.2s to import, it is loaded with the first request (or by utils.warm_up)
+    from groq import Groq, RateLimitError
+
+# Per-model budgets (requests/tokens per minute, audio seconds per hour), override via environment
+MODEL_LIMITS: Dict[str, Dict[str, float]] = {
+    "llama-3.1-8b-instant": {
+        "tokens_per_minute": float(os.getenv("GROQ_TPM_LIMIT", "6000")),
+        "requests_per_minute": float(os.getenv("GROQ_RPM_LIMIT", "30")),
+    },
+    "whisper-large-v3": {
+        "requests_per_minute": float(os.getenv("WHISPER_RPM_LIMIT", "20")),
+        "audio_seconds_per_hour": float(os.getenv("WHISPER_ASH_LIMIT", "7200")),
+    },
+}
+DEFAULT_LIMITS = {"requests_per_minute": 30.0}
+
+# How often a request that hits a 429 or a transient error is re-queued before giving up
+RATE_LIMIT_RETRIES = int(os.getenv("GROQ_RATE_LIMIT_RETRIES", "5"))
+
+# Whisper bills every request as at least 10 seconds of audio
+MIN_BILLED_AUDIO_SECONDS = 10
+
+# The one Groq client is shared by every session and stage. Idle connections are kept this
+# long (httpx closes them after 5s by default), so a chat message sent a minute after the
+# last one doesn't pay for a new TLS handshake.
+GROQ_KEEPALIVE_SECONDS = float(os.getenv("GROQ_KEEPALIVE_SECONDS", "120"))
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "32"))
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate_per_minute`."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens will be available (0 if they are now)."""
+        # A single request larger than the bucket could never be satisfied, cap it
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self.tokens >= amount:
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        with self._lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+    def drain(self):
+        """Empties the bucket, e.g. after the server reported the limit was hit."""
+        with self._lock:
+            self.tokens = 0.0
+            self.updated = time.monotonic()
+
+
+class GroqScheduler:
+    """
+    Process-wide gate in front of the Groq client.
+
+    Every request declares its estimated cost (tokens, audio seconds) and waits
+    until the per-model token buckets can cover it. Waiting requests are queued
+    per model and served round-robin across sessions, FIFO within a session, so
+    one user's long job can't starve everybody else. On a 429 the model is paused
+    for the server's `retry-after` and the request is re-queued.
+    """
+
+    def __init__(self, client: 'Groq', limits: Optional[Dict[str, Dict[str, float]]] = None):
+        self.client = client
+        self.limits = limits or MODEL_LIMITS
+        self._cond = threading.Condition()
+        self._buckets: Dict[str, Dict[str, TokenBucket]] = {}
+        self._queues: Dict[str, 'OrderedDict[str, Deque[object]]'] = {}
+        self._paused_until: Dict[str, float] = {}
+        self._stats = {'requests': 0, 'rate_limited': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+
+    def _model_buckets(self, model: str) -> Dict[str, TokenBucket]:
+        if model not in self._buckets:
+            limits = self.limits.get(model, DEFAULT_LIMITS)
+            buckets = {}
+            if 'tokens_per_minute' in limits:
+                buckets['tokens'] = TokenBucket(limits['tokens_per_minute'])
+            if 'requests_per_minute' in limits:
+                buckets['requests'] = TokenBucket(limits['requests_per_minute'])
+            if 'audio_seconds_per_hour' in limits:
+                ash = limits['audio_seconds_per_hour']
+                buckets['audio_seconds'] = TokenBucket(ash / 60.0, capacity=ash)
+            self._buckets[model] = buckets
+        return self._buckets[model]
+
+    def _is_next(self, model: str, session: str, ticket: object) -> bool:
+        # The model's queue is ordered by sessions, the first one with work is served next
+        queues = self._queues[model]
+        first = next(iter(queues))
+        return first == session and queues[session][0] is ticket
+
+    def _try_consume(self, model: str, cost: Dict[str, float]) -> float:
+        """Takes `cost` from the model's buckets if all can cover it, else returns seconds to wait."""
+        delay = self._paused_until.get(model, 0.0) - time.monotonic()
+        buckets = self._model_buckets(model)
+        for name, amount in cost.items():
+            if name in buckets:
+                delay = max(delay, buckets[name].wait_time(amount))
+        if delay > 0:
+            return delay
+        for name, amount in cost.items():
+            if name in buckets:
+                buckets[name].take(amount)
+        return 0.0
+
+    def _wait_turn(self, model: str, session: str, cost: Dict[str, float]) -> float:
+        """Blocks until this request is at the front of the fair queue and within budget."""
+        ticket = object()
+        start = time.monotonic()
+        with self._cond:
+            queues = self._queues.setdefault(model, OrderedDict())
+            queues.setdefault(session, deque()).append(ticket)
+            try:
+                while True:
+                    if self._is_next(model, session, ticket):
+                        delay = self._try_consume(model, cost)
+                        if delay == 0:
+                            break
+                        self._cond.wait(timeout=delay)
+                    else:
+                        self._cond.wait()
+            finally:
+                queues[session].remove(ticket)
+                if queues[session]:
+                    # Served (or abandoned): this session goes to the back of the rotation
+                    queues.move_to_end(session)
+                else:
+                    del queues[session]
+                self._cond.notify_all()
+
+            waited = time.monotonic() - start
+            self._stats['requests'] += 1
+            self._stats['wait_seconds'] += waited
+            self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], waited)
+            return waited
+
+    def _on_rate_limited(self, model: str, error: 'RateLimitError', attempt: int):
+        retry_after = None
+        try:
+            retry_after = float(error.response.headers.get('retry-after'))
+        except (AttributeError, TypeError, ValueError):
+            pass
+        if retry_after is None:
+            retry_after = 2 ** attempt
+        with self._cond:
+            self._stats['rate_limited'] += 1
+            self._paused_until[model] = max(self._paused_until.get(model, 0.0), time.monotonic() + retry_after)
+            # The server says we're over budget, stop trusting what the buckets think is left
+            for bucket in self._model_buckets(model).values():
+                bucket.drain()
+            self._cond.notify_all()
+        print(f"Rate limited on {model}, retrying in {retry_after:.1f}s...")
+
+    def _run(self, model: str, session: str, cost: Dict[str, float], call: Callable[[], Any]) -> Any:
+        from groq import RateLimitError, APIConnectionError, InternalServerError
+
+        # Queue time and retries are charged to the caller's span (e.g. whisper.upload)
+        span = tracing.current()
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            span.add('queue_seconds', self._wait_turn(model, session, cost))
+            try:
+                return call()
+            except RateLimitError as e:
+                if attempt == RATE_LIMIT_RETRIES:
+                    raise
+                span.add('rate_limited')
+                self._on_rate_limited(model, e, attempt)
+            except (APIConnectionError, InternalServerError) as e:
+                # The client is created without its own retries, so transient failures are retried here
+                if attempt == RATE_LIMIT_RETRIES:
+                    raise
+                span.add('retries')
+                print(f"Groq request failed ({e}), retrying in {2 ** attempt}s...")
+                time.sleep(2 ** attempt)
+
+    def chat_completion(self, session: str, estimated_tokens: int, **kwargs) -> Any:
+        """`client.chat.completions.create(**kwargs)`, scheduled against the model's TPM/RPM budget."""
+        cost = {'tokens': estimated_tokens, 'requests': 1}
+        return self._run(kwargs['model'], session, cost, lambda: self.client.chat.completions.create(**kwargs))
+
+    def transcription(self, session: str, audio_seconds: float, **kwargs) -> Any:
+        """`client.audio.transcriptions.create(**kwargs)`, scheduled against the model's RPM/ASH budget."""
+        cost = {'audio_seconds': max(audio_seconds, MIN_BILLED_AUDIO_SECONDS), 'requests': 1}
+        return self._run(kwargs['model'], session, cost, lambda: self.client.audio.transcriptions.create(**kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth per model plus request, wait-time and 429 counters."""
+        with self._cond:
+            result: Dict[str, Any] = dict(self._stats)
+            result['avg_wait_seconds'] = result['wait_seconds'] / result['requests'] if result['requests'] else 0.0
+            result['queue_depth'] = {
+                model: sum(len(q) for q in queues.values()) for model, queues in self._queues.items()
+            }
+            return result
+
+
+_scheduler: Optional[GroqScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def make_client(api_key: str) -> 'Groq':
+    """A Groq client with a keep-alive connection pool sized for the whole process."""
+    import httpx
+    from groq import Groq, DefaultHttpxClient
+
+    http_client = DefaultHttpxClient(limits=httpx.Limits(
+        max_connections=GROQ_MAX_CONNECTIONS,
+        max_keepalive_connections=GROQ_MAX_CONNECTIONS,
+        keepalive_expiry=GROQ_KEEPALIVE_SECONDS,
+    ))
+    # Retries are handled by the scheduler, so the client must not retry on its own
+    return Groq(api_key=api_key, max_retries=0, http_client=http_client)
+
+
+def peek_scheduler() -> Optional[GroqScheduler]:
+    """The process-wide scheduler if one was created already, without creating it or waiting for it."""
+    return _scheduler
+
+
+def get_scheduler() -> GroqScheduler:
+    """Returns the process-wide scheduler, creating its Groq client on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            api_key = os.getenv("GROQ_API_KEY")
+            if not api_key:
+                raise ValueError("GROQ_API_KEY not found. Please set it in .env file.")
+            _scheduler = GroqScheduler(make_client(api_key))
+        return _scheduler
@@ -0,0 +1,161 @@
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cache import INDEX_DIR
+
+# Chunking and ranking settings for chat retrieval
+CHUNK_WORDS = int(os.getenv("RETRIEVAL_CHUNK_WORDS", "150"))
+CHUNK_OVERLAP = 30
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Indexes kept in memory per process, the rest are reloaded from disk
+MEMORY_INDEXES = 32
+
+# Unicode words, so transcripts in any language are searchable
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.casefold())
+
+
+class TranscriptIndex:
+    """
+    BM25 index over overlapping word windows of one transcript.
+    Built with NumPy only, so no network or embedding model is needed.
+    """
+
+    def __init__(self, chunks: List[str], vocab: Dict[str, int], doc_ids: np.ndarray,
+                 term_ids: np.ndarray, term_freqs: np.ndarray, doc_lengths: np.ndarray):
+        self.chunks = chunks
+        self.vocab = vocab
+        # Sparse (doc, term, tf) triplets sorted by term, so one term's postings are contiguous
+        self.doc_ids = doc_ids
+        self.term_ids = term_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self._term_starts = np.searchsorted(term_ids, np.arange(len(vocab) + 1))
+        doc_freq = np.diff(self._term_starts)
+        n = max(len(chunks), 1)
+        self.idf = np.log(1 + (n - doc_freq + 0.5) / (doc_freq + 0.5))
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, text: str, chunk_words: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> 'TranscriptIndex':
+        words = text.split()
+        step = max(1, chunk_words - overlap)
+        chunks = [" ".join(words[i:i + chunk_words]) for i in range(0, max(len(words) - overlap, 1), step)]
+
+        vocab: Dict[str, int] = {}
+        doc_ids, term_ids, term_freqs, doc_lengths = [], [], [], []
+        for doc, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            doc_lengths.append(len(tokens))
+            ids = np.array([vocab.setdefault(t, len(vocab)) for t in tokens], dtype=np.int32)
+            terms, counts = np.unique(ids, return_counts=True)
+            doc_ids.append(np.full(len(terms), doc, dtype=np.int32))
+            term_ids.append(terms)
+            term_freqs.append(counts.astype(np.float32))
+
+        doc_ids = np.concatenate(doc_ids) if doc_ids else np.zeros(0, dtype=np.int32)
+        term_ids = np.concatenate(term_ids) if term_ids else np.zeros(0, dtype=np.int32)
+        term_freqs = np.concatenate(term_freqs) if term_freqs else np.zeros(0, dtype=np.float32)
+        order = np.argsort(term_ids, kind='stable')
+        return cls(chunks, vocab, doc_ids[order], term_ids[order], term_freqs[order],
+                   np.array(doc_lengths, dtype=np.float32))
+
+    def search(self, query: str, k: int = TOP_K) -> List[Tuple[int, float]]:
+        """Returns up to k (chunk index, score) pairs, best first."""
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / (self.avg_length or 1.0))
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            lo, hi = self._term_starts[term_id], self._term_starts[term_id + 1]
+            docs = self.doc_ids[lo:hi]
+            tf = self.term_freqs[lo:hi]
+            scores[docs] += self.idf[term_id] * tf * (BM25_K1 + 1) / (tf + norm[docs])
+
+        hits = np.flatnonzero(scores)
+        if len(hits) == 0:
+            return []
+        top = hits[np.argsort(-scores[hits], kind='stable')[:k]]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def context(self, query: str, k: int = TOP_K) -> List[str]:
+        """Top-k chunks for the query, in transcript order. Falls back to the opening chunks."""
+        hits = sorted(i for i, _ in self.search(query, k))
+        if not hits:
+            hits = list(range(min(k, len(self.chunks))))
+        return [self.chunks[i] for i in hits]
+
+    def save(self, path: str):
+        vocab = np.array(sorted(self.vocab, key=self.vocab.get))
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp, chunks=np.array(self.chunks), vocab=vocab, doc_ids=self.doc_ids,
+            term_ids=self.term_ids, term_freqs=self.term_freqs, doc_lengths=self.doc_lengths
+        )
+        # Atomic rename so concurrent readers never see a half-written file
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'TranscriptIndex':
+        with np.load(path) as data:
+            vocab = {term: i for i, term in enumerate(data['vocab'].tolist())}
+            return cls(data['chunks'].tolist(), vocab, data['doc_ids'], data['term_ids'],
+                       data['term_freqs'], data['doc_lengths'])
+
+
+_indexes: 'OrderedDict[str, TranscriptIndex]' = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _index_path(key: str) -> str:
+    return os.path.join(INDEX_DIR, f"{key}.npz")
+
+
+def get_index(text: str, video_id: Optional[str] = None) -> TranscriptIndex:
+    """
+    Returns the index for a transcript, building and caching it on first use.
+    Indexes are cached per video ID (or per text hash when no ID is given),
+    in memory and under CACHE_DIR/indexes, where they count towards the cache's size limit.
+    """
+    digest = hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+    key = f"{video_id}_{digest}" if video_id else digest
+    with _indexes_lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]
+
+    path = _index_path(key)
+    index = None
+    if os.path.exists(path):
+        try:
+            index = TranscriptIndex.load(path)
+            # The file's mtime is its last use for the cache's eviction
+            os.utime(path)
+        except Exception as e:
+            print(f"Error loading index {path}: {e}")
+    if index is None:
+        index = TranscriptIndex.build(text)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            index.save(path)
+        except OSError as e:
+            print(f"Error saving index {path}: {e}")
+
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > MEMORY_INDEXES:
+            _indexes.popitem(last=False)
+    return index
@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The modules read their configuration at import time: point them at a throwaway cache and
+# take the Groq rate limits out of the way before any test imports them
+os.environ['VIDEO_CACHE_DIR'] = tempfile.mkdtemp(prefix='video-text-tests-')
+os.environ.setdefault('GROQ_API_KEY', 'test')
+os.environ['GROQ_TPM_LIMIT'] = os.environ['GROQ_RPM_LIMIT'] = '1000000000'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def fake_groq():
+    from fake_groq import FakeGroqServer
+
+    with FakeGroqServer(latency=0.0, tokens_per_second=100000, completion_tokens=20) as server:
+        os.environ['GROQ_BASE_URL'] = server.url
+        yield server
@@ -0,0 +1,29 @@
+import json
+
+import utils
+from batch import BatchRunner, Checkpoint
+
+
+class FailingYoutubeDL:
+    def __init__(self, options):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download=False):
+        raise RuntimeError("Video unavailable")
+
+
+def test_failed_metadata_is_not_checkpointed(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'yt_dlp', type('yt_dlp', (), {'YoutubeDL': FailingYoutubeDL}))
+    output, checkpoint = str(tmp_path / "results.jsonl"), str(tmp_path / "results.checkpoint")
+    stats = BatchRunner(output, checkpoint).run(["aaaaaaaaaaa"])
+    assert stats['failed'] == 1
+    assert not Checkpoint(checkpoint).done("aaaaaaaaaaa", 'metadata')
+    with open(output, encoding='utf-8') as f:
+        result = json.loads(f.readline())
+    assert result['status'] == 'failed' and result['stage'] == 'metadata'
@@ -0,0 +1,44 @@
+import cache
+from cache import TranscriptCache
+from transcript import Transcript
+
+
+def test_hits_do_not_write(tmp_path):
+    store = TranscriptCache(str(tmp_path / "videos.db"))
+    store.put_metadata("video", {"title": "t"})
+    conn = store._conn()
+    changes = conn.total_changes
+    for _ in range(10):
+        assert store.get_metadata("video") == {"title": "t"}
+    assert store.get_metadata("missing") is None
+    assert conn.total_changes == changes
+    stats = store.stats()
+    assert stats['metadata_hits'] == 10
+    assert stats['metadata_misses'] == 1
+
+
+def test_eviction_runs_every_few_puts(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'EVICT_EVERY_PUTS', 5)
+    store = TranscriptCache(str(tmp_path / "videos.db"), max_bytes=1000, max_age=0)
+    store.evict()
+    for i in range(4):
+        store.put_metadata(f"video{i}", {"title": "t" * 400})
+    assert store.stats()['entries'] == 4
+    store.put_metadata("video4", {"title": "t" * 400})
+    assert store.stats()['entries'] == 2
+    assert store.get_metadata("video4") is not None
+
+
+def test_chunk_checkpoints_count_against_max_bytes(tmp_path):
+    store = TranscriptCache(str(tmp_path / "videos.db"), max_bytes=3000, max_age=0)
+    chunk = Transcript.from_segments([("w" * 1000, 0.0, 3.0)])
+    store.put_chunk("stale", 0, "hash", chunk, 3.0)
+    store.put_chunk("stale", 1, "hash", chunk, 3.0)
+    store.put_metadata("video", {"title": "t" * 400})
+    store.put_chunk("recent", 0, "hash", chunk, 3.0)
+    assert store.stats()['chunk_bytes'] > 3000
+    store.evict()
+    assert store.get_chunk("stale", 0, "hash") is None and store.get_chunk("stale", 1, "hash") is None
+    assert store.get_chunk("recent", 0, "hash") is not None
+    assert store.get_metadata("video") is not None
+    assert store.stats()['bytes'] <= 3000
@@ -0,0 +1,25 @@
+import library
+from library import Library
+from transcript import Transcript
+
+
+def _video(text: str) -> Transcript:
+    return Transcript.from_segments([(text, 0.0, 3.0), ("and nothing else", 3.0, 3.0)])
+
+
+def test_common_words_rank_only_the_newest_matches(tmp_path, monkeypatch):
+    store = Library(str(tmp_path / "library.db"))
+    # The oldest video is the best match, but falls outside the candidates
+    store.add("old", _video("blocks blocks blocks"))
+    for i in range(5):
+        store.add(f"new{i}", _video(f"order blocks number {i} in a much longer passage of filler words"))
+    store.add("best", _video("blocks blocks in short"))
+
+    assert store.search("blocks")[0]['video_id'] == "old"
+    monkeypatch.setattr(library, 'RANK_CANDIDATES', 3)
+    results = store.search("blocks")
+    assert [r['video_id'] for r in results][0] == "best"
+    assert {r['video_id'] for r in results} == {"best", "new4", "new3"}
+    assert all(a['score'] >= b['score'] for a, b in zip(results, results[1:]))
+    # Fewer matches than candidates: all of them are ranked
+    assert [r['video_id'] for r in store.search("order number 2")] == ["new2"]
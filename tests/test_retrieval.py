@@ -0,0 +1,33 @@
+import os
+
+from cache import TranscriptCache
+from retrieval import TranscriptIndex, tokenize
+
+
+def test_tokenize_keeps_non_ascii_words():
+    assert tokenize("Größe der Übertragung, naïve café 東京") == ["grösse", "der", "übertragung", "naïve", "café", "東京"]
+
+
+def test_search_finds_non_ascii_terms():
+    filler = "der Sprecher erklärt das System " * 40
+    text = filler + "die Straße nach München ist gesperrt " + filler
+    index = TranscriptIndex.build(text, chunk_words=20, overlap=5)
+    hits = index.search("STRASSE München")
+    assert hits
+    assert "München" in index.chunks[hits[0][0]]
+
+
+def test_evict_counts_index_files(tmp_path):
+    index_dir = tmp_path / "indexes"
+    index_dir.mkdir()
+    cache = TranscriptCache(str(tmp_path / "videos.db"), max_bytes=3000, max_age=0)
+    for i, mtime in enumerate((100, 300)):
+        path = index_dir / f"old{i}.npz"
+        path.write_bytes(b"x" * 1000)
+        os.utime(path, (mtime, mtime))
+    cache.put_metadata("recent", {"title": "t" * 1500})
+    cache.evict()
+    assert not (index_dir / "old0.npz").exists()
+    assert (index_dir / "old1.npz").exists()
+    assert cache.get_metadata("recent") is not None
+    assert cache.stats()['bytes'] <= 3000
@@ -0,0 +1,20 @@
+from utils import AIEngine
+
+TRANSCRIPT = "the speaker explains how the system works and walks through an example " * 20
+
+
+def test_summarize_stream_records_usage(fake_groq):
+    ai = AIEngine(session="test-stream")
+    text = "".join(ai.summarize_stream(TRANSCRIPT + "summary", mode="single"))
+    assert text.strip()
+    assert ai.last_stats['prompt_tokens'] > 0
+    assert ai.last_stats['completion_tokens'] == 20
+    assert 'ttft_seconds' in ai.last_stats
+
+
+def test_chat_stream_records_usage(fake_groq):
+    ai = AIEngine(session="test-stream")
+    text = "".join(ai.chat_stream(TRANSCRIPT + "chat", [], "What does the speaker explain?"))
+    assert text.strip()
+    assert ai.last_stats['prompt_tokens'] > 0
+    assert ai.last_stats['completion_tokens'] == 20
@@ -0,0 +1,9 @@
+from transcript import Transcript
+
+
+def test_concat_skips_empty_middle_part_with_its_offset():
+    first = Transcript.from_segments([("one", 0.0, 2.0), ("two", 2.0, 2.0)])
+    last = Transcript.from_segments([("three", 1.0, 2.0)])
+    joined = Transcript.concat([first, Transcript.from_segments([]), last], [0.0, 600.0, 1200.0])
+    assert list(joined) == [("one", 0.0, 2.0), ("two", 2.0, 2.0), ("three", 1201.0, 2.0)]
+    assert joined.text == "one two three"
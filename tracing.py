@@ -0,0 +1,258 @@
+"""
+Lightweight spans around the pipeline stages.
+
+    with tracing.span('whisper', video_id=video_id) as s:
+        ...
+        s.set(chunks=4, bytes=size)
+        s.add('retries')
+
+Enabled with PIPELINE_TRACING=1. Finished spans are appended as JSON lines to
+TRACE_LOG, aggregated per stage (count, duration histogram, summed numeric
+attributes) for `render_prometheus()`, and kept in a short in-memory list for
+the debug panel. When disabled, `span()` returns a shared no-op object, so an
+instrumented call costs one attribute check.
+"""
+import os
+import json
+import functools
+import time
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from typing import Any, Deque, Dict, List, Optional
+
+from cache import CACHE_DIR
+
+ENABLED = os.getenv("PIPELINE_TRACING", "0").lower() in ("1", "true", "yes")
+TRACE_LOG = os.getenv("PIPELINE_TRACE_LOG", os.path.join(CACHE_DIR, "trace.jsonl"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+RECENT_SPANS = 200
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_local = threading.local()
+_lock = threading.Lock()
+_recent: Deque[Dict[str, Any]] = deque(maxlen=RECENT_SPANS)
+_stages: Dict[str, Dict[str, Any]] = {}
+_logger: Optional[logging.Logger] = None
+
+
+class _NoopSpan:
+    """Stands in for a span when tracing is off (or there is no current span)."""
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def add(self, key: str, amount: float = 1):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ('name', 'attrs', 'start', 'parent')
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+        self.parent: Optional[str] = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, key: str, amount: float = 1):
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+    def __enter__(self) -> 'Span':
+        stack = _stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.time() - self.start
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        _finish({
+            'span': self.name,
+            'parent': self.parent,
+            'start': round(self.start, 3),
+            'seconds': round(duration, 4),
+            'status': 'error' if exc_type else 'ok',
+            **({'error': str(exc)[:200]} if exc_type else {}),
+            **self.attrs,
+        })
+        return False
+
+
+def _stack() -> List[Span]:
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def span(name: str, **attrs):
+    """Context manager timing one stage; the object it yields takes extra attributes."""
+    if not ENABLED:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def traced(name: str):
+    """Decorator running the function inside span(name); the body adds attributes through current()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current():
+    """The innermost open span on this thread, for code that only contributes attributes (e.g. retries)."""
+    if not ENABLED:
+        return _NOOP
+    stack = _stack()
+    return stack[-1] if stack else _NOOP
+
+
+def record(name: str, seconds: float, **attrs):
+    """Records a stage that was timed by the caller, e.g. across generator yields."""
+    if not ENABLED:
+        return
+    stack = _stack()
+    _finish({'span': name, 'parent': stack[-1].name if stack else None,
+             'start': round(time.time() - seconds, 3), 'seconds': round(seconds, 4), 'status': 'ok', **attrs})
+
+
+def _get_logger() -> logging.Logger:
+    global _logger
+    if _logger is None:
+        logger = logging.getLogger("pipeline.trace")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        os.makedirs(os.path.dirname(TRACE_LOG) or '.', exist_ok=True)
+        handler = RotatingFileHandler(TRACE_LOG, maxBytes=5 * 1024 * 1024, backupCount=3, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+
+def _finish(entry: Dict[str, Any]):
+    with _lock:
+        _recent.append(entry)
+        stage = _stages.setdefault(entry['span'], {
+            'count': 0, 'errors': 0, 'seconds': 0.0, 'buckets': [0] * len(DURATION_BUCKETS), 'sums': {},
+        })
+        stage['count'] += 1
+        stage['errors'] += entry['status'] == 'error'
+        stage['seconds'] += entry['seconds']
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if entry['seconds'] <= bound:
+                stage['buckets'][i] += 1
+        for key, value in entry.items():
+            if key not in ('start', 'seconds') and isinstance(value, (int, float)):
+                stage['sums'][key] = stage['sums'].get(key, 0) + value
+    try:
+        _get_logger().info(json.dumps(entry, default=str))
+    except Exception as e:
+        print(f"Error writing trace log: {e}")
+
+
+def recent_spans(limit: int = 50) -> List[Dict[str, Any]]:
+    """Most recent finished spans, newest first."""
+    with _lock:
+        return list(_recent)[-limit:][::-1]
+
+
+def stage_summary() -> List[Dict[str, Any]]:
+    """Per-stage count, error count, total and average seconds, plus summed numeric attributes."""
+    with _lock:
+        return [
+            {'stage': name, 'count': s['count'], 'errors': s['errors'], 'seconds': round(s['seconds'], 3),
+             'avg_seconds': round(s['seconds'] / s['count'], 3), **s['sums']}
+            for name, s in sorted(_stages.items())
+        ]
+
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus() -> str:
+    """All stage metrics in the Prometheus text exposition format."""
+    lines = [
+        "# HELP pipeline_stage_seconds Duration of pipeline stages.",
+        "# TYPE pipeline_stage_seconds histogram",
+    ]
+    with _lock:
+        stages = {name: {**s, 'buckets': list(s['buckets']), 'sums': dict(s['sums'])} for name, s in _stages.items()}
+    for name, s in sorted(stages.items()):
+        stage = _label(name)
+        for bound, count in zip(DURATION_BUCKETS, s['buckets']):
+            lines.append(f'pipeline_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'pipeline_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {s["count"]}')
+        lines.append(f'pipeline_stage_seconds_sum{{stage="{stage}"}} {s["seconds"]:.6f}')
+        lines.append(f'pipeline_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+    lines += ["# HELP pipeline_stage_errors_total Stages that raised.", "# TYPE pipeline_stage_errors_total counter"]
+    for name, s in sorted(stages.items()):
+        lines.append(f'pipeline_stage_errors_total{{stage="{_label(name)}"}} {s["errors"]}')
+    lines += ["# HELP pipeline_stage_attribute_total Summed numeric span attributes (bytes, tokens, chunks, retries, cache hits).",
+              "# TYPE pipeline_stage_attribute_total counter"]
+    for name, s in sorted(stages.items()):
+        for key, value in sorted(s['sums'].items()):
+            lines.append(f'pipeline_stage_attribute_total{{stage="{_label(name)}",attribute="{_label(key)}"}} {float(value)}')
+    return "\n".join(lines) + "\n"
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    """Serves `render_prometheus()` at http://0.0.0.0:<port>/metrics from a daemon thread, once per process."""
+    global _server
+    with _lock:
+        if _server is not None or not port:
+            return _server
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                data = render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        try:
+            _server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+        except OSError as e:
+            # Another Streamlit process already serves this port
+            print(f"Metrics server not started on port {port}: {e}")
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+        return _server
@@ -0,0 +1,181 @@
+import struct
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Serialized layout: header, offsets (int64, n + 1), starts (float64, n), durations (float64, n), utf-8 text
+_MAGIC = b'VTT1'
+_HEADER = struct.Struct('<4sII')
+
+
+def _field(item: Any, name: str, default: Any = None) -> Any:
+    """Reads a field from a dict or an object (API clients return either depending on version)."""
+    if isinstance(item, dict):
+        return item.get(name, default)
+    return getattr(item, name, default)
+
+
+def format_timestamp(seconds: float) -> str:
+    """H:MM:SS, or M:SS under an hour."""
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+
+class Transcript:
+    """
+    Timestamped transcript stored compactly as one text buffer plus parallel arrays.
+
+    Segment i is `buffer[offsets[i]:offsets[i + 1] - 1]` (segments are joined by a
+    single space) and starts at `starts[i]` seconds for `durations[i]` seconds.
+    Slicing returns a Transcript that shares the buffer and array memory (NumPy
+    views), and `text` gives the plain-string view the rest of the app uses.
+    """
+
+    __slots__ = ('buffer', 'offsets', 'starts', 'durations')
+
+    def __init__(self, buffer: str, offsets: np.ndarray, starts: np.ndarray, durations: np.ndarray):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.starts = starts
+        self.durations = durations
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[Tuple[str, float, float]]) -> 'Transcript':
+        """Builds a transcript from (text, start, duration) tuples."""
+        texts, starts, durations = [], [], []
+        for text, start, duration in segments:
+            text = " ".join(text.split())
+            if not text:
+                continue
+            texts.append(text)
+            starts.append(start)
+            durations.append(duration)
+        lengths = np.fromiter((len(t) + 1 for t in texts), dtype=np.int64, count=len(texts))
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(" ".join(texts), offsets, np.array(starts, dtype=np.float64), np.array(durations, dtype=np.float64))
+
+    @classmethod
+    def from_text(cls, text: str) -> 'Transcript':
+        """Wraps plain text without timing information as a single segment."""
+        return cls.from_segments([(text, 0.0, 0.0)])
+
+    @classmethod
+    def from_captions(cls, items: Iterable[Any]) -> 'Transcript':
+        """From YouTube caption entries (`text`, `start`, `duration`)."""
+        return cls.from_segments(
+            (_field(item, 'text', ''), float(_field(item, 'start', 0.0)), float(_field(item, 'duration', 0.0)))
+            for item in items
+        )
+
+    @classmethod
+    def from_whisper(cls, response: Any) -> 'Transcript':
+        """From a Whisper `verbose_json` response (segments with `text`, `start`, `end`)."""
+        segments = _field(response, 'segments') or []
+        if not segments:
+            return cls.from_text(_field(response, 'text', ''))
+        return cls.from_segments(
+            (_field(seg, 'text', ''), float(_field(seg, 'start', 0.0)),
+             float(_field(seg, 'end', 0.0)) - float(_field(seg, 'start', 0.0)))
+            for seg in segments
+        )
+
+    @classmethod
+    def concat(cls, parts: List['Transcript'], time_offsets: Optional[List[float]] = None) -> 'Transcript':
+        """Joins transcripts in order, shifting each part's timestamps by its time offset."""
+        # Empty parts are dropped together with their offsets, so the rest keep their own
+        pairs = [(p, shift) for p, shift in zip(parts, time_offsets or [0.0] * len(parts)) if len(p)]
+        if not pairs:
+            return cls.from_segments([])
+        parts, time_offsets = [p for p, _ in pairs], [shift for _, shift in pairs]
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for part in parts:
+            offsets.append(part.offsets[1:] - part.offsets[0] + base)
+            base = int(offsets[-1][-1])
+        return cls(
+            " ".join(part.text for part in parts),
+            np.concatenate(offsets),
+            np.concatenate([part.starts + shift for part, shift in zip(parts, time_offsets)]),
+            np.concatenate([part.durations for part in parts]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def text(self) -> str:
+        """The transcript as one string (segments joined by spaces)."""
+        if not len(self):
+            return ""
+        return self.buffer[self.offsets[0]:self.offsets[-1] - 1]
+
+    def __str__(self) -> str:
+        return self.text
+
+    def segment_text(self, i: int) -> str:
+        return self.buffer[self.offsets[i]:self.offsets[i + 1] - 1]
+
+    def __iter__(self) -> Iterator[Tuple[str, float, float]]:
+        for i in range(len(self)):
+            yield self.segment_text(i), float(self.starts[i]), float(self.durations[i])
+
+    def __getitem__(self, key: slice) -> 'Transcript':
+        """Segment range as a view sharing this transcript's memory."""
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("Transcript only supports contiguous slices")
+        lo, hi, _ = key.indices(len(self))
+        hi = max(lo, hi)
+        return Transcript(self.buffer, self.offsets[lo:hi + 1], self.starts[lo:hi], self.durations[lo:hi])
+
+    def segment_at(self, seconds: float) -> int:
+        """Index of the segment playing at `seconds` (binary search), or -1 before the first one."""
+        return int(np.searchsorted(self.starts, seconds, side='right')) - 1
+
+    def between(self, start: float, end: float) -> 'Transcript':
+        """Segments overlapping [start, end) seconds, as a view."""
+        lo = max(self.segment_at(start), 0)
+        hi = int(np.searchsorted(self.starts, end, side='left'))
+        return self[lo:hi]
+
+    def passages(self, max_chars: int) -> Iterator['Transcript']:
+        """Consecutive segments grouped into passages of about `max_chars`, as views."""
+        start, size = 0, 0
+        for i in range(len(self)):
+            size += int(self.offsets[i + 1] - self.offsets[i])
+            if size >= max_chars or i == len(self) - 1:
+                yield self[start:i + 1]
+                start, size = i + 1, 0
+
+    def time_at_char(self, char_offset: int) -> float:
+        """Start time of the segment containing a character offset into `text`."""
+        i = int(np.searchsorted(self.offsets, self.offsets[0] + char_offset, side='right')) - 1
+        return float(self.starts[min(max(i, 0), len(self) - 1)]) if len(self) else 0.0
+
+    def to_bytes(self) -> bytes:
+        # Re-base a slice so the serialized form only holds its own text
+        text = self.text.encode('utf-8')
+        offsets = (self.offsets - self.offsets[0]).astype('<i8', copy=False)
+        return b''.join([
+            _HEADER.pack(_MAGIC, len(self), len(text)),
+            offsets.tobytes(),
+            self.starts.astype('<f8', copy=False).tobytes(),
+            self.durations.astype('<f8', copy=False).tobytes(),
+            text,
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Transcript':
+        magic, n, text_len = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("Not a serialized transcript")
+        pos = _HEADER.size
+        # frombuffer wraps the bytes without copying
+        offsets = np.frombuffer(data, dtype='<i8', count=n + 1, offset=pos)
+        pos += 8 * (n + 1)
+        starts = np.frombuffer(data, dtype='<f8', count=n, offset=pos)
+        pos += 8 * n
+        durations = np.frombuffer(data, dtype='<f8', count=n, offset=pos)
+        pos += 8 * n
+        return cls(data[pos:pos + text_len].decode('utf-8'), offsets, starts, durations)
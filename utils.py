@@ -1,12 +1,24 @@
+import io
 import os
 import re
 import time
-from typing import Optional, Dict, List, Union
-import yt_dlp
-from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
-from groq import Groq
-from fpdf import FPDF
+import hashlib
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Optional, Dict, Iterator, List, Tuple, Union
 from dotenv import load_dotenv
+import tracing
+from cache import get_cache
+from audio import AudioSegmenter, YOUTUBE_PLAYER_CLIENT
+from rate_limit import get_scheduler
+from retrieval import get_index
+from transcript import Transcript, format_timestamp
+from library import get_library
+from normalize import normalize_transcript
+from chat_context import (ChatMemory, CHAT_SUMMARY_MAX_TOKENS, count_message_tokens, count_tokens, format_messages,
+                          split_history)
 
 # Load environment variables
 load_dotenv()
@@ -14,7 +26,86 @@ load_dotenv('.env.local')
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+# LLM settings. The single-pass limit keeps one request under strict 6000 TPM limits,
+# longer transcripts are summarized in chunks of SUMMARY_CHUNK_TOKENS.
+# Per-model TPM/RPM budgets live in rate_limit.MODEL_LIMITS.
+LLM_MODEL = "llama-3.1-8b-instant"
+SINGLE_PASS_CHARS = 22000
+# `mode` values AIEngine.summarize accepts
+SUMMARY_MODES = ("auto", "single", "map_reduce")
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+SUMMARY_CHUNK_MAX_TOKENS = 512
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+
+# Summaries and chat answers are cached by transcript, model, prompt version and normalized
+# question, shared by every session. Bump PROMPT_VERSION whenever a prompt below changes.
+PROMPT_VERSION = 1
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+
+# Whisper chunk transcription: parallel uploads, and retries of local failures per chunk
+# (Groq errors are retried by the scheduler)
+WHISPER_CONCURRENCY = int(os.getenv("WHISPER_CONCURRENCY", "4"))
+WHISPER_MAX_RETRIES = int(os.getenv("WHISPER_MAX_RETRIES", "3"))
+
+# yt-dlp info dicts from metadata lookups are handed to the Whisper download instead of extracting
+# again. Their stream URLs expire after a few hours, older ones are not reused.
+INFO_MAX_AGE_SECONDS = 3600
+INFO_CACHE_SIZE = 32
+# How long the Whisper fallback waits for a metadata extraction that is still running
+INFO_WAIT_SECONDS = 30
+
+# yt-dlp, youtube-transcript-api, groq and fpdf take about half a second to import together, which
+# the app's first page would wait for. They are loaded on first use instead, or by warm_up()
+# in the background. Assigning these (e.g. to stand-ins in benchmark.py) skips the import.
+yt_dlp = None
+YouTubeTranscriptApi = None
+
+
+def _yt_dlp():
+    global yt_dlp
+    if yt_dlp is None:
+        import yt_dlp as module
+        yt_dlp = module
+    return yt_dlp
+
+
+def _transcript_api():
+    global YouTubeTranscriptApi
+    if YouTubeTranscriptApi is None:
+        from youtube_transcript_api import YouTubeTranscriptApi as api
+        YouTubeTranscriptApi = api
+    return YouTubeTranscriptApi
+
+
+# youtube_transcript_api's errors for videos without captions, matched by name so a stand-in
+# YouTubeTranscriptApi doesn't need the module imported
+NO_CAPTIONS_ERRORS = ('TranscriptsDisabled', 'NoTranscriptFound')
+
+
+def warm_up() -> threading.Thread:
+    """
+    Imports the heavy dependencies and creates the shared Groq client on a background
+    thread, so the first request doesn't pay for them. Returns the thread.
+    """
+    def run():
+        try:
+            _yt_dlp()
+            _transcript_api()
+            import pdf_stream
+            if GROQ_API_KEY:
+                get_scheduler()
+        except Exception as e:
+            print(f"Error warming up: {e}")
+
+    thread = threading.Thread(target=run, daemon=True, name="warm-up")
+    thread.start()
+    return thread
+
 class VideoUtils:
+    # video ID -> (time started, future of the sanitized info dict or None)
+    _infos: 'OrderedDict[str, Tuple[float, Future]]' = OrderedDict()
+    _infos_lock = threading.Lock()
+
     @staticmethod
     def extract_video_id(url: str) -> Optional[str]:
         """Extracts the video ID from a YouTube URL."""
@@ -22,23 +113,49 @@ class VideoUtils:
         return match.group(1) if match else None
 
     @staticmethod
-    def get_video_metadata(url: str) -> Dict[str, str]:
-        """Fetches video metadata using yt-dlp."""
+    @tracing.traced('metadata')
+    def get_video_metadata(url: str, strict: bool = False) -> Dict[str, str]:
+        """
+        Fetches video metadata using yt-dlp (served from the on-disk cache when possible).
+        A failed lookup returns an 'Unknown Video' placeholder, or raises if `strict`.
+        """
+        video_id = VideoUtils.extract_video_id(url)
+        span = tracing.current()
+        span.set(video_id=video_id, cache_hit=0)
+        if video_id:
+            cached = get_cache().get_metadata(video_id)
+            if cached:
+                span.set(cache_hit=1)
+                return cached
+
         ydl_opts = {
             'quiet': True,
             'no_warnings': True,
+            'extractor_args': {'youtube': {'player_client': [YOUTUBE_PLAYER_CLIENT]}},
         }
+        info_future = VideoUtils._begin_info(video_id) if video_id else None
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with _yt_dlp().YoutubeDL(ydl_opts) as ydl:
                 info = ydl.extract_info(url, download=False)
-                return {
+                if info_future:
+                    info_future.set_result(ydl.sanitize_info(info))
+                metadata = {
                     'title': info.get('title', 'Unknown Title'),
                     'channel': info.get('uploader', 'Unknown Channel'),
                     'duration': str(info.get('duration', 0)),
                     'thumbnail': info.get('thumbnail', '')
                 }
+            if video_id:
+                get_cache().put_metadata(video_id, metadata)
+                VideoUtils._add_to_library(video_id, metadata=metadata)
+            return metadata
         except Exception as e:
             print(f"Error fetching metadata: {e}")
+            span.set(error=str(e)[:200])
+            if info_future and not info_future.done():
+                info_future.set_result(None)
+            if strict:
+                raise
             return {
                 'title': 'Unknown Video',
                 'channel': 'Unknown Channel',
@@ -47,145 +164,302 @@ class VideoUtils:
             }
 
     @staticmethod
-    def get_transcript(video_id: str) -> str:
+    def _begin_info(video_id: str) -> Future:
+        """Registers an info extraction for `video_id` that `video_info` can wait on."""
+        future = Future()
+        with VideoUtils._infos_lock:
+            VideoUtils._infos.pop(video_id, None)
+            VideoUtils._infos[video_id] = (time.time(), future)
+            while len(VideoUtils._infos) > INFO_CACHE_SIZE:
+                VideoUtils._infos.popitem(last=False)
+        return future
+
+    @staticmethod
+    def video_info(video_id: str, timeout: float = INFO_WAIT_SECONDS) -> Optional[Dict[str, Any]]:
         """
-        Tries to fetch transcript via captions first.
-        Falls back to downloading audio and using Whisper via Groq if captions fail.
+        The yt-dlp info dict of the latest metadata lookup for `video_id`, waiting
+        for it if the lookup is still running. None if there was none recently.
         """
-        # Method 1: Captions
+        with VideoUtils._infos_lock:
+            entry = VideoUtils._infos.get(video_id)
+        if not entry or time.time() - entry[0] > INFO_MAX_AGE_SECONDS:
+            return None
         try:
-            # Use static method directly
-            transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
-            
-            # Iterate over the result (FetchedTranscript should be iterable yielding objects)
-            full_text = " ".join([item['text'] for item in transcript_list])
-            
-            # Decode HTML entities
-            import html
-            return html.unescape(full_text)
-        except (TranscriptsDisabled, NoTranscriptFound) as e:
-            print(f"Captions not found ({e}). Falling back to Whisper...")
-            return VideoUtils.transcribe_with_whisper(video_id)
-        except Exception as e:
-            print(f"Error fetching captions: {e}")
-            return VideoUtils.transcribe_with_whisper(video_id)
+            return entry[1].result(timeout=timeout)
+        except Exception:
+            return None
 
     @staticmethod
-    def transcribe_with_whisper(video_id: str) -> str:
-        """Downloads audio and uses Groq Whisper for transcription."""
-        if not GROQ_API_KEY:
-            raise ValueError("GROQ_API_KEY not found in environment variables.")
-        
-        client = Groq(api_key=GROQ_API_KEY)
-        
-        # Download Audio
-        filename = f"{video_id}.mp3"
+    def forget_info(video_id: str):
+        with VideoUtils._infos_lock:
+            VideoUtils._infos.pop(video_id, None)
+
+    @staticmethod
+    def list_playlist_videos(url: str) -> List[str]:
+        """Returns the video IDs of a playlist or channel without fetching each video."""
         ydl_opts = {
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '64',
-            }],
-            'outtmpl': video_id, # yt-dlp appends ext automatically
             'quiet': True,
-            'extractor_args': {'youtube': {'player_client': ['android']}},
-            'retries': 10,
-            'fragment_retries': 10,
-            'socket_timeout': 30,
-            # 'force_ipv4': True, # Uncomment if IPv6 issues persist
+            'no_warnings': True,
+            'extract_flat': 'in_playlist',
         }
-        
+        with _yt_dlp().YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+        video_ids = []
+        for entry in info.get('entries') or []:
+            video_id = entry.get('id') if entry else None
+            if video_id and len(video_id) == 11:
+                video_ids.append(video_id)
+        return video_ids
+
+    @staticmethod
+    def get_transcript(video_id: str) -> str:
+        """
+        Returns the transcript as plain text (see get_transcript_segments for timestamps).
+        """
+        return VideoUtils.get_transcript_segments(video_id).text
+
+    @staticmethod
+    @tracing.traced('transcript')
+    def get_transcript_segments(video_id: str) -> Transcript:
+        """
+        Returns the timestamped transcript from the on-disk cache, or fetches and caches it.
+        """
+        span = tracing.current()
+        cache = get_cache()
+        cached = cache.get_transcript(video_id)
+        if cached:
+            span.set(video_id=video_id, cache_hit=1, source=cached.get('source'),
+                     chars=len(cached['transcript'].text), segments=len(cached['transcript']))
+            # Transcripts cached before the library existed are added on their next use
+            VideoUtils._add_to_library(video_id, transcript=cached['transcript'])
+            return cached['transcript']
+
+        transcript, source = VideoUtils._fetch_transcript(video_id)
+        span.set(video_id=video_id, cache_hit=0, source=source, chars=len(transcript.text), segments=len(transcript))
+        cache.put_transcript(video_id, transcript, source)
+        # Build the chat retrieval index now so the first question doesn't pay for it
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([f"https://www.youtube.com/watch?v={video_id}"])
-            
-            # Note: yt-dlp might append .mp3 to the filename depending on config, check it
-            if not os.path.exists(filename):
-                # Try finding any file starting with video_id
-                for file in os.listdir('.'):
-                    if file.startswith(video_id) and file.endswith('.mp3'):
-                        filename = file
-                        break
-            
-            if not os.path.exists(filename):
-                 raise FileNotFoundError("Audio file download failed.")
+            normalized = normalize_transcript(transcript.text)
+            span.set(normalized_chars=len(normalized))
+            get_index(normalized, video_id)
+        except Exception as e:
+            print(f"Error indexing transcript: {e}")
+        VideoUtils._add_to_library(video_id, transcript=transcript)
+        return transcript
 
-            # Check file size (limit is 25MB, set safe limit 24MB)
-            file_size_mb = os.path.getsize(filename) / (1024 * 1024)
-            
-            if file_size_mb > 24:
-                print(f"File size {file_size_mb:.2f}MB > 24MB. Chunking...")
-                # Split using ffmpeg segment
-                import subprocess
-                chunk_pattern = f"{video_id}_chunk_%03d.mp3"
-                subprocess.run([
-                    'ffmpeg', '-i', filename, 
-                    '-f', 'segment', '-segment_time', '900', # 15 mins
-                    '-c', 'copy', chunk_pattern
-                ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                
-                # Find all chunks
-                chunks = sorted([f for f in os.listdir('.') if f.startswith(f"{video_id}_chunk_") and f.endswith('.mp3')])
-                full_transcription = ""
-                
-                for chunk in chunks:
-                    try:
-                        with open(chunk, "rb") as file:
-                            resp = client.audio.transcriptions.create(
-                                file=(chunk, file.read()),
-                                model="whisper-large-v3",
-                                response_format="json"
-                            )
-                            full_transcription += resp.text + " "
-                    except Exception as e:
-                        print(f"Error transcribing chunk {chunk}: {e}")
-                    finally:
-                        try: os.remove(chunk)
-                        except: pass
-                
-                # Cleanup main file
-                try: os.remove(filename)
-                except: pass
-                
-                return full_transcription.strip()
-            
+    @staticmethod
+    def _add_to_library(video_id: str, transcript: Optional[Transcript] = None,
+                        metadata: Optional[Dict[str, str]] = None):
+        """Adds to the cross-video search index; a failure there never fails the analysis."""
+        try:
+            with tracing.span('library', video_id=video_id) as span:
+                if metadata:
+                    get_library().set_metadata(video_id, metadata)
+                if transcript is not None:
+                    span.set(added=int(get_library().add(video_id, transcript)))
+        except Exception as e:
+            print(f"Error adding {video_id} to the library: {e}")
+
+    @staticmethod
+    def _fetch_transcript(video_id: str) -> Tuple[Transcript, str]:
+        """
+        Tries to fetch transcript via captions first.
+        Falls back to downloading audio and using Whisper via Groq if captions fail.
+        Returns (transcript, source) where source is 'captions' or 'whisper'.
+        """
+        # Method 1: Captions
+        try:
+            with tracing.span('captions', video_id=video_id) as span:
+                # Use static method directly
+                transcript_list = _transcript_api().get_transcript(video_id)
+
+                # Decode HTML entities, keeping each caption's timing
+                import html
+                transcript = Transcript.from_segments(
+                    (html.unescape(text), start, duration)
+                    for text, start, duration in Transcript.from_captions(transcript_list)
+                )
+                span.set(segments=len(transcript))
+            return transcript, 'captions'
+        except Exception as e:
+            if type(e).__name__ in NO_CAPTIONS_ERRORS:
+                print(f"Captions not found ({e}). Falling back to Whisper...")
             else:
-                # Transcribe single file
-                with open(filename, "rb") as file:
-                    transcription = client.audio.transcriptions.create(
-                        file=(filename, file.read()),
+                print(f"Error fetching captions: {e}")
+            return VideoUtils.transcribe_with_whisper_segments(video_id), 'whisper'
+
+    @staticmethod
+    @tracing.traced('whisper.upload')
+    def _transcribe_file(path: str, session: str, audio_seconds: float,
+                         retries: int = WHISPER_MAX_RETRIES) -> Transcript:
+        """
+        Transcribes one audio file of `audio_seconds` with Whisper, retrying local
+        failures (reading the file) with exponential backoff. Groq errors are not
+        retried here: the scheduler already retries the transient ones.
+        Segments are timed from the start of the file.
+        """
+        from groq import APIError
+
+        span = tracing.current()
+        span.set(file=os.path.basename(path), bytes=os.path.getsize(path), audio_seconds=round(audio_seconds, 2))
+        scheduler = get_scheduler()
+        for attempt in range(retries + 1):
+            try:
+                # Hand the open file to the client so it is streamed rather than read into memory
+                with open(path, "rb") as file:
+                    resp = scheduler.transcription(
+                        session,
+                        audio_seconds,
+                        file=(os.path.basename(path), file),
                         model="whisper-large-v3",
-                        response_format="json"
+                        response_format="verbose_json"
                     )
-                
-                # Cleanup
-                try: os.remove(filename)
-                except: pass
-                    
-                return transcription.text
+                return Transcript.from_whisper(resp)
+            except APIError:
+                # Rate limits, connection and server errors were retried by the scheduler, the rest are permanent
+                raise
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                delay = 2 ** attempt + random.uniform(0, 1)
+                span.add('retries')
+                print(f"Error transcribing {path} (attempt {attempt + 1}/{retries + 1}): {e}. Retrying in {delay:.1f}s...")
+                time.sleep(delay)
 
-        except Exception as e:
-            # Cleanup on error
-            if os.path.exists(filename):
-                try: os.remove(filename)
-                except: pass
-            # Cleanup chunks on error
-            for f in os.listdir('.'):
-                 if f.startswith(f"{video_id}_chunk_") and f.endswith('.mp3'):
-                     try: os.remove(f)
-                     except: pass
-            raise Exception(f"Transcription failed: {str(e)}")
+    @staticmethod
+    def _transcribe_segment(segmenter: AudioSegmenter, path: str, duration: float, session: str,
+                            checkpoint_key: Tuple[str, int, str]) -> Tuple[Transcript, float]:
+        try:
+            transcript = VideoUtils._transcribe_file(path, session, duration)
+        finally:
+            segmenter.release(path)
+        # Persist right away so a later failure doesn't cost this chunk again
+        get_cache().put_chunk(*checkpoint_key, transcript, duration)
+        return transcript, duration
 
-class AIEngine:
-    def __init__(self):
+    @staticmethod
+    def transcribe_with_whisper(video_id: str, concurrency: Optional[int] = None,
+                                session: Optional[str] = None) -> str:
+        """Plain-text variant of transcribe_with_whisper_segments."""
+        return VideoUtils.transcribe_with_whisper_segments(video_id, concurrency, session).text
+
+    @staticmethod
+    @tracing.traced('whisper')
+    def transcribe_with_whisper_segments(video_id: str, concurrency: Optional[int] = None,
+                                         session: Optional[str] = None) -> Transcript:
+        """
+        Streams audio through ffmpeg and uses Groq Whisper for transcription.
+        Segments are transcribed by up to `concurrency` workers (default
+        WHISPER_CONCURRENCY) while later ones are still downloading.
+        Requests go through the shared scheduler, queued fairly under `session`
+        (defaults to the video ID).
+        Each chunk's result is checkpointed as soon as it is transcribed and the
+        downloaded audio is kept until the whole job succeeds, so retrying a failed
+        job resumes the download and only transcribes the chunks still missing.
+        """
         if not GROQ_API_KEY:
-             raise ValueError("GROQ_API_KEY not found. Please set it in .env file.")
-        self.client = Groq(api_key=GROQ_API_KEY)
+            raise ValueError("GROQ_API_KEY not found in environment variables.")
+        
+        session = session or video_id
+        workers = max(1, concurrency or WHISPER_CONCURRENCY)
+
+        cache = get_cache()
+        restored = 0
+        # Reuse the metadata lookup's extraction, started alongside the captions request
+        info = VideoUtils.video_info(video_id)
+        tracing.current().set(info_reused=int(info is not None))
+
+        # Keep one segment queued per worker so uploads never wait on the download
+        with AudioSegmenter(video_id, max_pending=workers + 1, info=info) as segmenter, \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            # Another process may have transcribed the video while this one waited for its lock
+            cached = cache.get_transcript(video_id) if segmenter.waited else None
+            if cached:
+                tracing.current().set(video_id=video_id, cache_hit=1)
+                return cached['transcript']
+            futures = []
+            try:
+                for index, path, duration, digest in segmenter:
+                    failed = next((f for f in futures if f.done() and f.exception()), None)
+                    if failed:
+                        segmenter.release(path)
+                        failed.result()
+                    # Chunks transcribed by an earlier, failed attempt are reused when the audio is identical
+                    checkpoint_key = (video_id, index, digest)
+                    checkpoint = cache.get_chunk(*checkpoint_key)
+                    if checkpoint:
+                        segmenter.release(path)
+                        done = Future()
+                        done.set_result(checkpoint)
+                        futures.append(done)
+                        restored += 1
+                    else:
+                        future = pool.submit(VideoUtils._transcribe_segment, segmenter, path, duration, session, checkpoint_key)
+                        # A failed chunk fails the job, stop downloading instead of waiting for the next segment
+                        future.add_done_callback(lambda f: f.cancelled() or f.exception() is None or segmenter.stop())
+                        futures.append(future)
+                print(f"Transcribing {len(futures) - restored} segments with {workers} workers "
+                      f"({restored} restored from checkpoint, {segmenter.downloaded_bytes / (1024 * 1024):.1f}MB downloaded)...")
+                tracing.current().set(video_id=video_id, chunks=len(futures), restored=restored,
+                                      downloaded_bytes=segmenter.downloaded_bytes)
+                # Results are collected in submission order, so the text is reassembled in chunk order
+                results = [f.result() for f in futures]
+            except Exception as e:
+                for f in futures:
+                    f.cancel()
+                # A retry extracts again, in case the stream URLs were the problem
+                VideoUtils.forget_info(video_id)
+                # Downloaded audio and finished chunks are kept, a retry picks up from here
+                raise Exception(f"Transcription failed: {str(e)}")
+            segmenter.discard()
+
+        # Each segment's timestamps start at zero, shift them by the audio that came before
+        parts, time_offsets, elapsed = [], [], 0.0
+        for part, duration in results:
+            parts.append(part)
+            time_offsets.append(elapsed)
+            elapsed += duration
+        transcript = Transcript.concat(parts, time_offsets)
+        tracing.current().set(audio_seconds=round(elapsed, 2), chars=len(transcript.text))
+        cache.clear_chunks(video_id)
+        return transcript
+
+def split_by_tokens(text: str, max_tokens: int) -> List[str]:
+    """Splits text into chunks of up to max_tokens (see count_tokens), breaking at sentence ends where possible."""
+    # Auto-generated captions often have no punctuation, so oversized sentences fall back to words
+    pieces = []
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        tokens = count_tokens(sentence)
+        if tokens <= max_tokens:
+            pieces.append((sentence, tokens))
+        else:
+            pieces.extend((word, count_tokens(word)) for word in sentence.split())
 
-    def summarize(self, text: str) -> str:
-        prompt = f"""
-        Please provide a comprehensive summary of the following transcript.
+    chunks, current, size = [], [], 0
+    for piece, tokens in pieces:
+        if current and size + tokens > max_tokens:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+def normalize_question(text: str) -> str:
+    """Lowercase words without punctuation, so trivially different phrasings share a cache entry."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+def response_key(kind: str, text: str, *parts: str) -> str:
+    """Cache key of an LLM response: the request kind, transcript hash, model, prompt version and `parts`."""
+    digest = hashlib.sha256()
+    transcript_hash = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    for part in (kind, transcript_hash, LLM_MODEL, str(PROMPT_VERSION)) + parts:
+        digest.update(part.encode('utf-8') + b'\0')
+    return digest.hexdigest()
+
+SUMMARY_PROMPT = """
+        Please provide a comprehensive summary of the following {label}.
         Use Markdown formatting.
         Structure:
         
@@ -198,73 +472,408 @@ class AIEngine:
         ## Detailed Breakdown
         (Sections with headers if appropriate)
         
-        Transcript:
-        {text[:22000]} 
-        """ 
-        # Truncate to stay under strict 6000 TPM limits
-        
-        completion = self.client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are a helpful AI assistant that summarizes video transcripts."},
-                {"role": "user", "content": prompt}
-            ],
-            model="llama-3.1-8b-instant", 
+        {label}:
+        {text} 
+        """
+
+CHUNK_PROMPT = """
+        This is part {index} of {total} of a video transcript.
+        Write concise bullet-point notes covering every topic, argument, example,
+        name and number mentioned in this part. Do not add an introduction.
+
+        Transcript part {index}/{total}:
+        {text}
+        """
+
+MERGE_PROMPT = """
+        Merge the following notes on consecutive parts of a video transcript into one
+        set of concise bullet-point notes. Keep every distinct topic, name and number.
+
+        Notes:
+        {text}
+        """
+
+FOLD_PROMPT = """
+        Update the running summary of a conversation about a video with the new messages below.
+        Keep every question the user asked, the facts given in the answers and anything
+        the user said about what they are looking for. Stay under 150 words.
+
+        Summary so far:
+        {summary}
+
+        New messages:
+        {messages}
+        """
+
+class AIEngine:
+    def __init__(self, session: str = "default"):
+        """`session` identifies the caller so the shared scheduler can queue requests fairly."""
+        if not GROQ_API_KEY:
+             raise ValueError("GROQ_API_KEY not found. Please set it in .env file.")
+        self.scheduler = get_scheduler()
+        self.client = self.scheduler.client
+        self.session = session
+        self.last_stats: Dict[str, Union[int, float, str]] = {}
+        self._started = time.time()
+        self._usage_lock = threading.Lock()
+
+    def _request_kwargs(self, messages: List[Dict[str, str]], max_tokens: Optional[int]) -> Dict:
+        kwargs = {
+            'messages': messages,
+            'model': LLM_MODEL,
+        }
+        if max_tokens:
+            kwargs['max_tokens'] = max_tokens
+        return kwargs
+
+    def _estimate(self, messages: List[Dict[str, str]], max_tokens: Optional[int]) -> int:
+        return count_message_tokens(messages) + (max_tokens or 1024)
+
+    def _record_usage(self, usage):
+        if usage:
+            with self._usage_lock:
+                self.last_stats['prompt_tokens'] += usage.prompt_tokens
+                self.last_stats['completion_tokens'] += usage.completion_tokens
+
+    @tracing.traced('llm.completion')
+    def _complete(self, messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> str:
+        """Runs one chat completion through the shared scheduler and records token usage."""
+        completion = self.scheduler.chat_completion(
+            self.session,
+            self._estimate(messages, max_tokens),
+            **self._request_kwargs(messages, max_tokens)
         )
+        self._record_usage(completion.usage)
+        if completion.usage:
+            tracing.current().set(model=LLM_MODEL, prompt_tokens=completion.usage.prompt_tokens,
+                                  completion_tokens=completion.usage.completion_tokens)
         return completion.choices[0].message.content
 
-    def chat(self, text: str, history: List[Dict[str, str]], question: str) -> str:
+    def _stream(self, messages: List[Dict[str, str]], max_tokens: Optional[int] = None,
+                cache_key: Optional[str] = None) -> Iterator[str]:
+        """
+        Streams one chat completion, yielding content deltas and finalizing `last_stats` at the end.
+        A stream that runs to completion is stored in the response cache under `cache_key`.
+        """
+        # A span can't stay open across yields (the consumer may be another thread), so this one is timed by hand
+        started = time.time()
+        try:
+            stream = self.scheduler.chat_completion(
+                self.session,
+                self._estimate(messages, max_tokens),
+                stream=True,
+                **self._request_kwargs(messages, max_tokens)
+            )
+            parts = []
+            for chunk in stream:
+                # Groq sends usage on the final chunk under x_groq; `usage` is the OpenAI position
+                x_groq = getattr(chunk, 'x_groq', None)
+                self._record_usage(getattr(x_groq, 'usage', None) or getattr(chunk, 'usage', None))
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if 'ttft_seconds' not in self.last_stats:
+                    self.last_stats['ttft_seconds'] = round(time.time() - self._started, 3)
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+            self._store_response(cache_key, "".join(parts))
+        finally:
+            self._finish_stats()
+            tracing.record('llm.stream', time.time() - started, model=LLM_MODEL, mode=self.last_stats.get('mode'),
+                           chunks=self.last_stats.get('chunks'), prompt_tokens=self.last_stats['prompt_tokens'],
+                           completion_tokens=self.last_stats['completion_tokens'],
+                           ttft_seconds=self.last_stats.get('ttft_seconds'))
+
+    def _begin_stats(self, mode: str, chunks: int = 1):
+        self.last_stats = {'mode': mode, 'chunks': chunks, 'prompt_tokens': 0, 'completion_tokens': 0}
+        self._started = time.time()
+
+    def _finish_stats(self):
+        self.last_stats['total_tokens'] = self.last_stats['prompt_tokens'] + self.last_stats['completion_tokens']
+        self.last_stats['seconds'] = round(time.time() - self._started, 2)
+
+    def _trace_stats(self):
+        tracing.current().set(**{k: v for k, v in self.last_stats.items() if k != 'seconds'})
+
+    def _cached_response(self, key: str, count: bool = True) -> Optional[str]:
+        """A cached response for `key`, with `last_stats` set to the original call's plus cached=True."""
+        if not LLM_CACHE_TTL_HOURS:
+            return None
+        started = time.time()
+        try:
+            hit = get_cache().get_response(key, LLM_CACHE_TTL_HOURS * 3600, count)
+        except Exception as e:
+            print(f"Error reading response cache: {e}")
+            return None
+        if hit is None:
+            return None
+        self._started = started
+        self.last_stats = {**hit['stats'], 'cached': True}
+        if 'ttft_seconds' in self.last_stats:
+            self.last_stats['ttft_seconds'] = round(time.time() - started, 3)
+        return hit['text']
+
+    def _store_response(self, key: Optional[str], text: str):
+        if not key or not LLM_CACHE_TTL_HOURS or not text:
+            return
+        # ttft and seconds are measured again on a hit, the stored stats describe the original call
+        stats = {k: v for k, v in self.last_stats.items() if k not in ('seconds', 'ttft_seconds', 'total_tokens')}
+        try:
+            get_cache().put_response(key, text, stats, source=str(stats.get('mode')))
+        except Exception as e:
+            print(f"Error writing response cache: {e}")
+
+    @tracing.traced('summary')
+    def summarize(self, text: str, mode: str = "auto") -> str:
+        """
+        Summarizes a transcript.
+        mode="single" sends one request with the transcript truncated to 22k characters,
+        mode="map_reduce" summarizes token-budgeted chunks concurrently and merges them,
+        mode="auto" picks map_reduce only when the transcript would be truncated.
+        Chunk and token counts for the call are left in `self.last_stats`, with
+        cached=True when the summary came from the response cache.
+        The transcript is cleaned up first (see normalize.py).
+        """
+        text = normalize_transcript(text)
+        mode = self._summary_mode(text, mode)
+        key = self._summary_key(text, mode)
+        summary = self._cached_response(key)
+        if summary is None:
+            summary = self._complete(self._summary_messages(text, mode))
+            self._finish_stats()
+            self._store_response(key, summary)
+        else:
+            self._finish_stats()
+        self._trace_stats()
+        return summary
+
+    def summarize_stream(self, text: str, mode: str = "auto") -> Iterator[str]:
+        """
+        Like `summarize`, but yields the final summary as it is generated.
+        In map_reduce mode the chunk notes are still collected first, only the merge is streamed.
+        `last_stats['ttft_seconds']` measures from the call to the first token.
+        A cached summary is yielded in one piece.
+        """
+        text = normalize_transcript(text)
+        mode = self._summary_mode(text, mode)
+        key = self._summary_key(text, mode)
+        cached = self._cached_response(key)
+        if cached is not None:
+            self._finish_stats()
+            yield cached
+            return
+        messages = self._summary_messages(text, mode)
+        yield from self._stream(messages, cache_key=key)
+
+    def cached_summary(self, text: str, mode: str = "auto") -> Optional[str]:
+        """
+        The summary `summarize` would return if it is in the response cache, without generating
+        one. Not counted in the cache's hit rate, which measures the LLM calls it saves.
+        """
+        text = normalize_transcript(text)
+        return self._cached_response(self._summary_key(text, self._summary_mode(text, mode)), count=False)
+
+    @staticmethod
+    def _summary_mode(text: str, mode: str) -> str:
+        if mode == "auto":
+            return "single" if len(text) <= SINGLE_PASS_CHARS else "map_reduce"
+        return mode
+
+    @staticmethod
+    def _summary_key(text: str, mode: str) -> str:
+        # Map-reduce output depends on how the transcript was chunked
+        return response_key('summary', text, mode, str(SUMMARY_CHUNK_TOKENS) if mode == "map_reduce" else "")
+
+    def _summary_messages(self, text: str, mode: str) -> List[Dict[str, str]]:
+        """Resets `last_stats` and returns the messages for the final summary request."""
+        mode = self._summary_mode(text, mode)
+        self._begin_stats(mode)
+
+        if mode == "map_reduce":
+            notes = self._map_reduce_notes(text)
+            return [
+                {"role": "system", "content": "You are a helpful AI assistant that summarizes video transcripts."},
+                {"role": "user", "content": SUMMARY_PROMPT.format(label="Notes on consecutive parts of the transcript", text=notes)}
+            ]
+        # Truncate to stay under strict 6000 TPM limits
+        return [
+            {"role": "system", "content": "You are a helpful AI assistant that summarizes video transcripts."},
+            {"role": "user", "content": SUMMARY_PROMPT.format(label="Transcript", text=text[:SINGLE_PASS_CHARS])}
+        ]
+
+    def _map_reduce_notes(self, text: str) -> str:
+        chunks = split_by_tokens(text, SUMMARY_CHUNK_TOKENS)
+        self.last_stats['chunks'] = len(chunks)
+
+        def summarize_chunk(args):
+            index, chunk = args
+            return self._complete([
+                {"role": "system", "content": "You are a helpful AI assistant that takes notes on video transcripts."},
+                {"role": "user", "content": CHUNK_PROMPT.format(index=index + 1, total=len(chunks), text=chunk)}
+            ], max_tokens=SUMMARY_CHUNK_MAX_TOKENS)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(SUMMARY_CONCURRENCY, len(chunks)))) as pool:
+            partials = list(pool.map(summarize_chunk, enumerate(chunks)))
+
+        # Very long videos can produce more notes than fit in one request, reduce them in groups first
+        while count_tokens("\n\n".join(partials)) > SUMMARY_CHUNK_TOKENS and len(partials) > 1:
+            groups = split_by_tokens("\n\n".join(partials), SUMMARY_CHUNK_TOKENS)
+            if len(groups) >= len(partials):
+                break
+            with ThreadPoolExecutor(max_workers=max(1, min(SUMMARY_CONCURRENCY, len(groups)))) as pool:
+                partials = list(pool.map(lambda group: self._complete([
+                    {"role": "system", "content": "You are a helpful AI assistant that takes notes on video transcripts."},
+                    {"role": "user", "content": MERGE_PROMPT.format(text=group)}
+                ], max_tokens=SUMMARY_CHUNK_MAX_TOKENS), groups))
+
+        return "\n\n".join(f"Part {i + 1}:\n{partial}" for i, partial in enumerate(partials))
+
+    @tracing.traced('chat')
+    def chat(self, text: str, history: List[Dict[str, str]], question: str,
+             video_id: Optional[str] = None, memory: Optional[ChatMemory] = None) -> str:
+        """
+        Answers a question using only the transcript chunks most relevant to it,
+        retrieved from the video's local BM25 index. Repeated questions (same
+        transcript, same conversation so far) are answered from the response cache.
+        Only the last few turns of `history` are sent; older ones are folded into
+        `memory`'s running summary, or left out when no memory is given.
+        """
+        text = normalize_transcript(text)
+        key = self._chat_key(text, history, question)
+        answer = self._cached_response(key)
+        if answer is None:
+            answer = self._complete(self._chat_messages(text, history, question, video_id, memory))
+            self._finish_stats()
+            self._store_response(key, answer)
+        else:
+            self._finish_stats()
+        self._trace_stats()
+        return answer
+
+    def chat_stream(self, text: str, history: List[Dict[str, str]], question: str,
+                    video_id: Optional[str] = None, memory: Optional[ChatMemory] = None) -> Iterator[str]:
+        """Like `chat`, but yields the answer as it is generated."""
+        text = normalize_transcript(text)
+        key = self._chat_key(text, history, question)
+        cached = self._cached_response(key)
+        if cached is not None:
+            self._finish_stats()
+            yield cached
+            return
+        messages = self._chat_messages(text, history, question, video_id, memory)
+        yield from self._stream(messages, cache_key=key)
+
+    @staticmethod
+    def _chat_key(text: str, history: List[Dict[str, str]], question: str) -> str:
+        # The earlier turns shape the answer too, a follow-up only hits after the same conversation
+        conversation = "\n".join(f"{m['role']}: {normalize_question(m['content'])}" for m in history)
+        return response_key('chat', text, normalize_question(question),
+                            hashlib.sha1(conversation.encode('utf-8')).hexdigest())
+
+    def _fold_history(self, memory: ChatMemory, messages: List[Dict[str, str]]):
+        """Folds `messages` into the running summary with one short request (counted in `last_stats`)."""
+        memory.summary = self._complete([
+            {"role": "system", "content": "You keep concise running summaries of conversations."},
+            {"role": "user", "content": FOLD_PROMPT.format(summary=memory.summary or "(empty)",
+                                                           messages=format_messages(messages))}
+        ], max_tokens=CHAT_SUMMARY_MAX_TOKENS)
+        memory.folded += len(messages)
+
+    def _chat_messages(self, text: str, history: List[Dict[str, str]], question: str,
+                       video_id: Optional[str], memory: Optional[ChatMemory] = None) -> List[Dict[str, str]]:
+        self._begin_stats('chat')
         messages = [{"role": "system", "content": "You are a helpful assistant answering questions about a video transcript."}]
         
-        # Add context (transcript) - usually best to add as system context or first user message
-        messages.append({"role": "system", "content": f"Context (Video Transcript): {text[:22000]}"})
+        # Add context - retrieve on the question plus the previous user turn so follow-ups keep their topic
+        previous = next((m["content"] for m in reversed(history) if m["role"] == "user"), "")
+        with tracing.span('retrieval', video_id=video_id) as span:
+            excerpts = get_index(text, video_id).context(f"{previous} {question}")
+            span.set(chunks=len(excerpts))
+        context = "\n\n".join(f"[Excerpt {i + 1}] {chunk}" for i, chunk in enumerate(excerpts))
+        messages.append({"role": "system", "content": f"Context (relevant excerpts from the video transcript, in order):\n{context}"})
         
-        # Add history
-        for msg in history:
+        # Add history: a summary of the older turns, then the recent ones verbatim
+        to_fold, recent = split_history(history, memory or ChatMemory())
+        if to_fold and memory is not None:
+            try:
+                self._fold_history(memory, to_fold)
+                self.last_stats['folded_messages'] = len(to_fold)
+            except Exception as e:
+                # Those turns are left out of this prompt and folded on the next one
+                print(f"Error summarizing chat history: {e}")
+        if memory is not None and memory.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{memory.summary}"})
+        for msg in recent:
             messages.append({"role": msg["role"], "content": msg["content"]})
             
         # Add current question
         messages.append({"role": "user", "content": question})
         
-        completion = self.client.chat.completions.create(
-            messages=messages,
-            model="llama-3.1-8b-instant",
-        )
-        return completion.choices[0].message.content
+        self.last_stats['chunks'] = len(excerpts)
+        return messages
+
+# The transcript is laid out in blocks of about this many characters, one multi_cell each
+PDF_BLOCK_CHARS = 1500
+
 
 class PDFGenerator:
     @staticmethod
-    def generate(transcript: str, summary: str, metadata: Dict[str, str]) -> bytes:
-        pdf = FPDF()
+    def _blocks(transcript: Union[str, Transcript]) -> Iterator[Tuple[Optional[float], str]]:
+        """Yields (start time or None, text) paragraphs of about PDF_BLOCK_CHARS."""
+        if isinstance(transcript, Transcript) and len(transcript) > 1:
+            for passage in transcript.passages(PDF_BLOCK_CHARS):
+                yield float(passage.starts[0]), passage.text
+        else:
+            for block in split_by_tokens(str(transcript), PDF_BLOCK_CHARS // 4):
+                yield None, block
+
+    @staticmethod
+    def generate(transcript: Union[str, Transcript], summary: str, metadata: Dict[str, str],
+                 out: Optional[Union[str, BinaryIO]] = None) -> Optional[bytes]:
+        """
+        Renders the report into `out` (a path or a binary stream) page by page.
+        Without `out` the PDF is returned as bytes. A Transcript gets a timestamp per paragraph.
+        """
+        if out is None:
+            buffer = io.BytesIO()
+            PDFGenerator.generate(transcript, summary, metadata, buffer)
+            return buffer.getvalue()
+        if isinstance(out, str):
+            with open(out, 'wb') as f:
+                PDFGenerator.generate(transcript, summary, metadata, f)
+            return None
+        PDFGenerator._render(transcript, summary, metadata, out)
+        return None
+
+    @staticmethod
+    @tracing.traced('pdf')
+    def _render(transcript: Union[str, Transcript], summary: str, metadata: Dict[str, str], out: BinaryIO):
+        from pdf_stream import StreamingPDF
+
+        pdf = StreamingPDF(out)
         pdf.add_page()
-        
+        font = pdf.body_font
+
         # Helper to add text with wrapping
         def add_text(text, style='', size=12):
-            pdf.set_font("Arial", style, size)
-            # Force ASCII compatible
-            import unicodedata
-            normalized = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
-            pdf.multi_cell(0, 6, normalized)
+            pdf.set_font(font, style, size)
+            pdf.multi_cell(0, 6, pdf.safe_text(text))
             pdf.ln(2)
 
         # Header
-        pdf.set_font("Arial", 'B', 24)
+        pdf.set_font(font, 'B', 24)
         pdf.set_text_color(59, 130, 246)
         pdf.cell(0, 10, "YouTube-to-Text Pro", 0, 1)
         pdf.ln(5)
         
-        pdf.set_font("Arial", '', 10)
+        pdf.set_font(font, '', 10)
         pdf.set_text_color(128, 128, 128)
         pdf.cell(0, 10, f"Generated on: {time.strftime('%Y-%m-%d %H:%M:%S')}", 0, 1)
-        
-        # Sanitize title
-        import unicodedata
-        safe_title = unicodedata.normalize('NFKD', metadata.get('title', 'Unknown')).encode('ascii', 'ignore').decode('ascii')
-        pdf.cell(0, 10, f"Video: {safe_title}", 0, 1)
+        pdf.cell(0, 10, pdf.safe_text(f"Video: {metadata.get('title', 'Unknown')}"), 0, 1)
         pdf.ln(10)
 
         # Summary
         if summary:
-            pdf.set_font("Arial", 'B', 18)
+            pdf.set_font(font, 'B', 18)
             pdf.set_text_color(139, 92, 246)
             pdf.cell(0, 10, "AI Summary & Insights", 0, 1)
             pdf.ln(5)
@@ -279,12 +888,18 @@ class PDFGenerator:
             pdf.ln(10)
 
         # Transcript
-        pdf.set_font("Arial", 'B', 18)
+        pdf.set_font(font, 'B', 18)
         pdf.set_text_color(59, 130, 246)
         pdf.cell(0, 10, "Full Transcript", 0, 1)
         pdf.ln(5)
         
-        pdf.set_text_color(0, 0, 0)
-        add_text(transcript, size=10)
-        
-        return pdf.output(dest='S').encode('latin-1')
+        for start, block in PDFGenerator._blocks(transcript):
+            if start is not None:
+                pdf.set_font(font, 'B', 9)
+                pdf.set_text_color(128, 128, 128)
+                pdf.cell(0, 5, format_timestamp(start), 0, 1)
+            pdf.set_text_color(0, 0, 0)
+            add_text(block, size=10)
+
+        pdf.close()
+        tracing.current().set(chars=len(str(transcript)), pages=pdf.page, bytes=len(pdf.buffer))